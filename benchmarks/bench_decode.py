@@ -0,0 +1,68 @@
+"""Decode benchmark over the bundled sample videos.
+
+Times the original read-every-frame loop of get_main_item against the
+FrameDecoder modes in cv/video_decoder.py.
+
+Usage: python benchmarks/bench_decode.py [--frame-skip 5] [--videos videos/*.mp4]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'cv'))
+
+from video_decoder import FrameDecoder
+
+def read_every_frame(video_path, frame_skip):
+    """The original loop: cap.read() every frame and drop the unsampled ones."""
+    cap = cv2.VideoCapture(video_path)
+    frame_count = sampled = 0
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_count += 1
+        if frame_count % frame_skip != 0:
+            continue
+        sampled += 1
+    cap.release()
+    return frame_count, sampled
+
+def run_decoder(video_path, frame_skip, mode='grab', scale=1.0):
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    sampled = sum(1 for _ in FrameDecoder(cap, frame_skip, mode=mode, scale=scale).frames())
+    cap.release()
+    return total, sampled
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frame-skip', type=int, default=5)
+    parser.add_argument('--videos', nargs='*', default=sorted(glob.glob(os.path.join(ROOT, 'videos', '*.mp4'))))
+    args = parser.parse_args()
+
+    variants = [
+        ('read (original)', lambda path: read_every_frame(path, args.frame_skip)),
+        ('grab', lambda path: run_decoder(path, args.frame_skip, 'grab')),
+        ('grab, scale 0.5', lambda path: run_decoder(path, args.frame_skip, 'grab', 0.5)),
+        ('seek', lambda path: run_decoder(path, args.frame_skip, 'seek')),
+    ]
+
+    print(f"{'video':<12} {'variant':<18} {'frames':>7} {'sampled':>8} {'seconds':>8} {'video fps':>10} {'speedup':>8}")
+    for video_path in args.videos:
+        baseline = None
+        for name, run in variants:
+            start = time.perf_counter()
+            frames, sampled = run(video_path)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{os.path.basename(video_path):<12} {name:<18} {frames:>7} {sampled:>8} {elapsed:>8.2f} "
+                  f"{frames / elapsed:>10.1f} {baseline / elapsed:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Micro-benchmark for the nearest-person distance stage of get_main_item.
+
+Compares the original nested Python loop with the vectorized/KD-tree
+implementation in cv/proximity.py for 1k to 1M object points.
+
+Usage: python benchmarks/bench_proximity.py [--persons-ratio 0.1] [--frames 300]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cv'))
+
+import proximity
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+# The nested loop is quadratic; only time it while it finishes in seconds
+LOOP_MAX_PAIRS = 2_000_000
+
+def legacy_min_distance(objects, persons):
+    """The original triple-nested loop from get_main_item, for one object class."""
+    min_distance = float('inf')
+    for obj_x, obj_y in objects:
+        for person_x, person_y in persons:
+            distance = np.sqrt((obj_x - person_x)**2 + (obj_y - person_y)**2)
+            if distance < min_distance:
+                min_distance = distance
+    return min_distance
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--persons-ratio', type=float, default=0.1, help="persons per object point")
+    parser.add_argument('--frames', type=int, default=300, help="number of distinct frames for same-frame matching")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'objects':>10} {'persons':>9} {'loop (s)':>10} {'any frame (s)':>14} {'same frame (s)':>15}")
+    for n in SIZES:
+        m = max(1, int(n * args.persons_ratio))
+        objects = rng.uniform(0, 1920, (n, 2))
+        persons = rng.uniform(0, 1920, (m, 2))
+        object_frames = rng.integers(0, args.frames, n)
+        person_frames = rng.integers(0, args.frames, m)
+
+        loop_time = "skipped"
+        if n * m <= LOOP_MAX_PAIRS:
+            expected, elapsed = timed(legacy_min_distance, objects.tolist(), persons.tolist())
+            loop_time = f"{elapsed:.3f}"
+
+        distances, any_time = timed(proximity.nearest_distances, objects, persons)
+        _, same_time = timed(proximity.nearest_distances_same_frame, objects, object_frames, persons, person_frames)
+        if loop_time != "skipped":
+            assert np.isclose(distances.min(), expected)
+
+        print(f"{n:>10} {m:>9} {loop_time:>10} {any_time:>14.3f} {same_time:>15.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Offline benchmark suite for the whole pipeline over the bundled sample videos.
+
+Runs against a pluggable detector (a deterministic stub by default, or the
+backend configured in cv/config.yaml) and local stand-ins for the image
+upload and Google Lens services, in a scratch output directory, so results
+are reproducible without network access. Reports decode fps, inference fps,
+detect_color throughput on cv/cropped_main_items/*, distance stage time,
+cold and warm end-to-end latency, the latency of a fresh CLI process on
+cached results, the import time of the entry points (-X importtime) and peak
+RSS, and saves them as JSON.
+
+Usage: python benchmarks/run_benchmarks.py [--detector stub|config] [--videos videos/video1.mp4 ...]
+                                           [--output results.json] [--compare baseline.json --threshold 0.1]
+"""
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CV_DIR = os.path.join(ROOT, 'cv')
+sys.path.insert(0, CV_DIR)
+
+from stubs import StubDetector, StubServices
+
+# Required by the pipeline once it calls a service; the stub services ignore them
+API_KEYS = ('API_KEY', 'SEARCH_ENGINE_ID', 'SERPAPI_API_KEY', 'IMG_API_KEY')
+
+# Entry points whose import time is profiled
+ENTRY_MODULES = ('main', 'viewer', 'tiktok_recommendation', 'results_api', 'batch_process')
+
+def bench_config(workdir, services, videos_dir):
+    """cv/config.yaml redirected to the scratch directory and the stub services."""
+    with open(os.path.join(CV_DIR, 'config.yaml'), 'r') as file:
+        config = yaml.safe_load(file)
+    config['paths'] = {'root': workdir, 'videos_dir': videos_dir}
+    model_config = config.setdefault('model', {})
+    for option in ('weights', 'repo'):
+        if model_config.get(option):
+            model_config[option] = os.path.join(CV_DIR, model_config[option])
+    config['cache'] = {**config.get('cache', {}), 'directory': os.path.join(workdir, 'cache')}
+    config['lens'] = {**config.get('lens', {}), 'url': services.url('/lens'),
+                      'cache_directory': os.path.join(workdir, 'lens_cache')}
+    config['match_index'] = {**config.get('match_index', {}), 'path': os.path.join(workdir, 'matches.db')}
+    config['near_duplicates'] = {**config.get('near_duplicates', {}), 'path': os.path.join(workdir, 'fingerprints.db')}
+    config['upload'] = {**config.get('upload', {}), 'index_path': os.path.join(workdir, 'upload_index.json')}
+    config['instrumentation'] = {'traces': True, 'prometheus_textfile': None}
+    config['daemon'] = {**config.get('daemon', {}), 'enabled': False}
+    return config
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / 1024
+
+def metric(value, unit, better):
+    return {'value': round(value, 6), 'unit': unit, 'better': better}
+
+def bench_decode(video_paths, frame_skip, decode_config):
+    from video_decoder import FrameDecoder
+
+    metrics, frames, seconds = {}, 0, 0.0
+    for video_path in video_paths:
+        cap = cv2.VideoCapture(video_path)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        start = time.perf_counter()
+        for _ in FrameDecoder(cap, frame_skip, mode=decode_config.get('mode', 'grab'),
+                              scale=decode_config.get('scale', 1.0)).frames():
+            pass
+        elapsed = time.perf_counter() - start
+        cap.release()
+        metrics[f'decode_fps/{os.path.basename(video_path)}'] = metric(total / elapsed, 'frames/s', 'higher')
+        frames += total
+        seconds += elapsed
+    metrics['decode_fps'] = metric(frames / seconds, 'frames/s', 'higher')
+    return metrics
+
+def bench_inference(detector, video_path, frame_skip, batch_size, max_frames):
+    """Inference fps on sampled frames of one video, in batches of the configured size."""
+    from video_decoder import FrameDecoder
+
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    for _, frame in FrameDecoder(cap, frame_skip, buffer_count=max_frames + 1).frames():
+        frames.append(frame)
+        if len(frames) == max_frames:
+            break
+    cap.release()
+
+    # Warm up, e.g. for lazily initialized backends
+    detector(frames[:batch_size])
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        detector(frames[i:i + batch_size])
+    elapsed = time.perf_counter() - start
+    return {'inference_fps': metric(len(frames) / elapsed, 'frames/s', 'higher')}
+
+def bench_color(detect_color, crop_paths, repeats):
+    crops = [image for image in map(cv2.imread, crop_paths) if image is not None]
+    detect_color(crops[0])
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for crop in crops:
+            detect_color(crop)
+    elapsed = time.perf_counter() - start
+    return {'color_throughput': metric(repeats * len(crops) / elapsed, 'crops/s', 'higher')}
+
+def reset_caches(workdir, upload_image):
+    """Forget every cached detection, fingerprint, Google Lens result and upload."""
+    for name in ('cache', 'fingerprints.db', 'fingerprints.db-wal', 'fingerprints.db-shm', 'lens_cache',
+                 'upload_index.json'):
+        path = os.path.join(workdir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    upload_image._index = None
+
+def bench_end_to_end(pipeline, instrumentation, upload_image, workdir, videos):
+    """Cold (nothing cached) and warm (everything cached) runs of main.run per video, then a cached run in a new process."""
+    metrics, traces = {}, {}
+    for video in videos:
+        reset_caches(workdir, upload_image)
+        for run in ('cold', 'warm'):
+            instrumentation.start(video)
+            start = time.perf_counter()
+            pipeline.run(video, show=False)
+            elapsed = time.perf_counter() - start
+            summary = instrumentation.current().summary()
+            metrics[f'e2e_{run}_seconds/{video}'] = metric(elapsed, 's', 'lower')
+            traces[f'{video}/{run}'] = {'stages': summary['stages'], 'counters': summary['counters']}
+            if run == 'cold':
+                distance = summary['stages'].get('distance', {}).get('total', 0.0)
+                metrics[f'distance_seconds/{video}'] = metric(distance, 's', 'lower')
+        metrics[f'cached_cli_seconds/{video}'] = metric(cached_cli_seconds(dict(os.environ), workdir, video), 's', 'lower')
+    return metrics, traces
+
+def parse_importtime(stderr, module):
+    """Cumulative import seconds of module and its slowest direct imports from -X importtime output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, name.strip(), int(cumulative) / 1e6))
+    total = next(seconds for depth, name, seconds in entries if depth == 0 and name == module)
+    # Direct imports are listed before their importer, one level deeper
+    children = sorted(((name, seconds) for depth, name, seconds in entries if depth == 1),
+                      key=lambda child: -child[1])
+    return total, children
+
+def bench_imports(env, modules=ENTRY_MODULES, slowest=8):
+    """Import time of each entry point in a fresh interpreter."""
+    metrics, profiles = {}, {}
+    for module in modules:
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=CV_DIR,
+                                 env=env, capture_output=True, text=True, check=True)
+        total, children = parse_importtime(process.stderr, module)
+        metrics[f'import_seconds/{module}'] = metric(total, 's', 'lower')
+        profiles[module] = {name: round(seconds, 6) for name, seconds in children[:slowest]}
+    return metrics, profiles
+
+def cached_cli_seconds(env, workdir, video):
+    """Wall time of a new process running main.run on the cached results of a video."""
+    code = (f"import sys; sys.path.insert(0, {CV_DIR!r}); import instrumentation, main; "
+            f"instrumentation.start({video!r}); sys.exit(0 if main.run({video!r}, show=False) else 1)")
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-c', code], cwd=workdir, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if process.returncode:
+        raise RuntimeError(f"Cached run of {video} failed:\n{process.stderr}")
+    return elapsed
+
+def environment(detector_name):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'detector': detector_name, 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpus': os.cpu_count(), 'opencv': cv2.__version__,
+            'numpy': np.__version__}
+
+def compare(metrics, baseline, threshold):
+    """Print each metric against a baseline run and return the names of those that regressed."""
+    regressions = []
+    print(f"\n{'metric':<36} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, current in metrics.items():
+        previous = baseline['metrics'].get(name)
+        if previous is None or not previous['value']:
+            continue
+        change = (current['value'] - previous['value']) / previous['value']
+        worse = -change if current['better'] == 'higher' else change
+        flag = '  REGRESSION' if worse > threshold else ''
+        if flag:
+            regressions.append(name)
+        print(f"{name:<36} {previous['value']:>12.3f} {current['value']:>12.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--detector', choices=['stub', 'config'], default='stub',
+                        help="deterministic stub detector, or the model backend configured in cv/config.yaml")
+    parser.add_argument('--stub-latency-ms', type=float, default=0.0, help="inference time per image of the stub detector")
+    parser.add_argument('--service-latency-ms', type=float, default=50.0, help="response time of the stub services")
+    parser.add_argument('--videos', nargs='*', default=sorted(glob.glob(os.path.join(ROOT, 'videos', 'video[1-4].mp4'))))
+    parser.add_argument('--crops', nargs='*', default=sorted(glob.glob(os.path.join(CV_DIR, 'cropped_main_items', '*.jpg'))))
+    parser.add_argument('--inference-frames', type=int, default=64)
+    parser.add_argument('--color-repeats', type=int, default=20)
+    parser.add_argument('--output', help="results file; defaults to benchmarks/results/benchmark_<time>.json")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change counted as a regression")
+    parser.add_argument('--verbose', action='store_true', help="keep the pipeline's logging")
+    args = parser.parse_args()
+
+    video_paths = [os.path.abspath(path) for path in args.videos]
+    output = os.path.abspath(args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                                         f"benchmark_{datetime.datetime.now():%Y%m%d-%H%M%S}.json"))
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    videos_dir = os.path.dirname(video_paths[0])
+    for key in API_KEYS:
+        os.environ.setdefault(key, 'benchmark')
+
+    workdir = tempfile.mkdtemp(prefix='tiktok-benchmark-')
+    try:
+        with StubServices(latency=args.service_latency_ms / 1000) as services:
+            config = bench_config(workdir, services, videos_dir)
+            config_path = os.path.join(workdir, 'config.yaml')
+            with open(config_path, 'w') as file:
+                yaml.safe_dump(config, file)
+
+            # Point the pipeline at the scratch config; state such as the upload index stays in workdir too
+            os.environ['TIKTOK_CONFIG'] = config_path
+            os.chdir(workdir)
+            import tiktok_recommendation
+            import upload_image
+            import instrumentation
+            import main as pipeline
+            if not args.verbose:
+                logging.getLogger().setLevel(logging.WARNING)
+            upload_image.UPLOAD_URL = services.url('/upload')
+            if args.detector == 'stub':
+                tiktok_recommendation.model = StubDetector(latency=args.stub_latency_ms / 1000)
+            detector = tiktok_recommendation.load_yolo_model()
+
+            frame_skip = tiktok_recommendation.FRAME_SKIP
+            videos = [os.path.basename(path) for path in video_paths]
+            metrics, imports = bench_imports(dict(os.environ))
+            metrics.update(bench_decode(video_paths, frame_skip, config.get('decode', {})))
+            metrics.update(bench_inference(detector, video_paths[0], frame_skip,
+                                           config.get('inference', {}).get('batch_size', 8), args.inference_frames))
+            metrics.update(bench_color(tiktok_recommendation.detect_color, args.crops, args.color_repeats))
+            end_to_end, traces = bench_end_to_end(pipeline, instrumentation, upload_image, workdir, videos)
+            metrics.update(end_to_end)
+            metrics['peak_rss_mb'] = metric(peak_rss_mb(), 'MB', 'lower')
+            service_requests = dict(services.requests)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {'created': datetime.datetime.now().isoformat(timespec='seconds'),
+               'environment': environment(args.detector), 'metrics': metrics,
+               'stages': traces, 'imports': imports, 'service_requests': service_requests}
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=4)
+
+    print(f"{'metric':<36} {'value':>12} unit")
+    for name, value in metrics.items():
+        print(f"{name:<36} {value['value']:>12.3f} {value['unit']}")
+    print(f"\nResults written to {output}")
+
+    if baseline_path:
+        with open(baseline_path, 'r') as file:
+            regressions = compare(metrics, json.load(file), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.threshold:.0%}.")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
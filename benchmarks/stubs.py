@@ -0,0 +1,208 @@
+"""Offline stand-ins for the detector and the HTTP services the pipeline calls.
+
+StubDetector returns deterministic detections derived from each frame's
+pixels, so runs are repeatable without model weights. StubServices serves
+the image upload, Google Lens, Google Custom Search and product page
+endpoints from a local aiohttp server with a fixed per-request latency, and
+can be told to fail requests to test retries.
+"""
+import asyncio
+import collections
+import hashlib
+import threading
+import time
+
+import numpy as np
+from aiohttp import web
+
+from detection_backends import COCO_NAMES, Detections
+
+PERSON = COCO_NAMES.index('person')
+ITEMS = [COCO_NAMES.index(name) for name in ('handbag', 'cup', 'cell phone')]
+
+class StubDetector:
+    """Detector with the backends' interface returning a person and a few items per frame.
+
+    Boxes follow the brightest region of a coarse thumbnail of the frame, so
+    they move with the video's content but are identical on every run.
+    latency adds a fixed cost per image, to stand in for a model's inference time.
+    """
+
+    names = COCO_NAMES
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def detect(self, frame):
+        height, width = frame.shape[:2]
+        thumbnail = frame[::max(1, height // 16), ::max(1, width // 16)].mean(axis=2)
+        row, column = np.unravel_index(np.argmax(thumbnail), thumbnail.shape)
+        size = min(width, height) / 6
+        # Keep the whole layout inside the frame, so no box is clipped empty
+        cx = np.clip((column + 0.5) / thumbnail.shape[1] * width, 2.5 * size, width - 2.5 * size)
+        cy = np.clip((row + 0.5) / thumbnail.shape[0] * height, 2 * size, height - 2 * size)
+        rows = [[cx - size, cy - 2 * size, cx + size, cy + 2 * size, 0.9, PERSON]]
+        for i, item in enumerate(ITEMS):
+            offset = (i - 1) * 1.5 * size
+            rows.append([cx + offset, cy + size, cx + offset + size, cy + 2 * size, 0.8 - 0.1 * i, item])
+        return np.array(rows, dtype=np.float32)
+
+    def __call__(self, images, size=None):
+        images = images if isinstance(images, list) else [images]
+        if self.latency:
+            time.sleep(self.latency * len(images))
+        return Detections([self.detect(image) for image in images], self.names)
+
+def visual_matches(image_url, count):
+    """Deterministic Google Lens style visual matches for an image URL."""
+    seed = int(hashlib.sha256(image_url.encode()).hexdigest()[:8], 16)
+    sources = ['Amazon', 'eBay', 'Etsy', 'Walmart', 'Target']
+    matches = []
+    for position in range(1, count + 1):
+        value = (seed + position * 7919) % 20000 / 100
+        matches.append({
+            'position': position,
+            'title': f"Product {seed % 1000}-{position}",
+            'link': f"https://shop.example.com/{seed}/{position}",
+            'source': sources[(seed + position) % len(sources)],
+            'price': {'value': f"${value:.2f}", 'extracted_value': value, 'currency': '$'},
+            'in_stock': position % 3 != 0,
+            'thumbnail': f"https://images.example.com/{seed}/{position}.jpg",
+        })
+    return matches
+
+class StubServices:
+    """Local image upload (imgbb), Google Lens (SerpApi), Google Custom Search and product pages on a background thread.
+
+    /search lists the product pages /pages/<n>, each streamed in chunks with
+    its <img> after page_padding bytes and followed by as many more.
+    fail() queues error responses for a path, served before its normal ones.
+    requests counts the requests per endpoint, times records when each arrived
+    and pages_completed how many product pages were sent in full.
+
+    Usage:
+        with StubServices(latency=0.05) as services:
+            upload_url, lens_url = services.url('/upload'), services.url('/lens')
+    """
+
+    def __init__(self, latency=0.05, matches=60, products=5, page_padding=256 * 1024, host='127.0.0.1'):
+        self.latency = latency
+        self.matches = matches
+        self.products = products
+        self.page_padding = page_padding
+        self.host = host
+        self.port = None
+        self.requests = {'upload': 0, 'lens': 0, 'search': 0, 'pages': 0}
+        self.times = {name: [] for name in self.requests}
+        self.pages_completed = 0
+        self._failures = collections.defaultdict(collections.deque)
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    def url(self, path):
+        return f"http://{self.host}:{self.port}{path}"
+
+    def fail(self, path, status, retry_after=None, body='error'):
+        """Answer the next request to path (e.g. '/lens') with status and body instead of its normal response."""
+        headers = {'Retry-After': str(retry_after)} if retry_after is not None else None
+        self._failures[path].append((status, headers, body))
+
+    def _received(self, name, request):
+        """Count a request and return the queued failure response for its path, if any."""
+        self.requests[name] += 1
+        self.times[name].append(time.monotonic())
+        failures = self._failures.get(request.path)
+        if failures:
+            status, headers, body = failures.popleft()
+            return web.Response(status=status, headers=headers, text=body)
+        return None
+
+    async def upload(self, request):
+        failure = self._received('upload', request)
+        if failure is not None:
+            return failure
+        data = await request.post()
+        image = data['image'].file.read()
+        await asyncio.sleep(self.latency)
+        digest = hashlib.sha256(image).hexdigest()
+        return web.json_response({'data': {'url': self.url(f'/images/{digest}.jpg')}})
+
+    async def lens(self, request):
+        failure = self._received('lens', request)
+        if failure is not None:
+            return failure
+        await asyncio.sleep(self.latency)
+        return web.json_response({'visual_matches': visual_matches(request.query.get('url', ''), self.matches)})
+
+    async def search(self, request):
+        failure = self._received('search', request)
+        if failure is not None:
+            return failure
+        await asyncio.sleep(self.latency)
+        items = [{'title': f"{request.query.get('q', '')} {i}", 'link': self.url(f'/pages/{i}')}
+                 for i in range(self.products)]
+        return web.json_response({'items': items})
+
+    async def page(self, request):
+        failure = self._received('pages', request)
+        if failure is not None:
+            return failure
+        await asyncio.sleep(self.latency)
+        response = web.StreamResponse(headers={'Content-Type': 'text/html; charset=utf-8'})
+        await response.prepare(request)
+        padding = b'<p>' + b'x' * 16 * 1024 + b'</p>'
+        chunks = max(1, self.page_padding // len(padding))
+        try:
+            await response.write(b'<html><body>')
+            for _ in range(chunks):
+                await response.write(padding)
+            await response.write(f'<img src="/images/{request.match_info["n"]}.jpg">'.encode())
+            # The rest of the page arrives slowly, so a client that stops at the image has disconnected by then
+            for _ in range(chunks):
+                await asyncio.sleep(0.01)
+                await response.write(padding)
+            await response.write(b'</body></html>')
+            await response.write_eof()
+        except ConnectionResetError:
+            return response
+        self.pages_completed += 1
+        return response
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_post('/upload', self.upload)
+        app.router.add_get('/lens', self.lens)
+        app.router.add_get('/search', self.search)
+        app.router.add_get('/pages/{n}', self.page)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,57 @@
+import cv2
+import numpy as np
+
+class SceneChangeSampler:
+    """Decides which sampled frames are worth running detection on.
+
+    Each frame is reduced to a small grayscale thumbnail. A frame is detected
+    when its mean absolute difference from the last detected frame exceeds
+    threshold (0-1), or when max_gap sampled frames have passed without a
+    detection, so slow changes within a scene are still picked up.
+    """
+
+    def __init__(self, threshold=0.03, max_gap=6, thumbnail_size=32):
+        self.threshold = threshold
+        self.max_gap = max_gap
+        self.thumbnail_size = thumbnail_size
+        self._last_signature = None
+        self._skipped = 0
+        self.detected = 0
+        self.skipped = 0
+
+    def _signature(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        thumbnail = cv2.resize(gray, (self.thumbnail_size, self.thumbnail_size), interpolation=cv2.INTER_AREA)
+        return thumbnail.astype(np.float32)
+
+    def should_detect(self, frame):
+        """Return True if detection should run on this sampled frame."""
+        signature = self._signature(frame)
+        if self._last_signature is not None and self._skipped + 1 < self.max_gap:
+            change = np.abs(signature - self._last_signature).mean() / 255
+            if change < self.threshold:
+                self._skipped += 1
+                self.skipped += 1
+                return False
+
+        self._last_signature = signature
+        self._skipped = 0
+        self.detected += 1
+        return True
+
+class StabilityMonitor:
+    """Signals an early exit once the same value was reported for N consecutive updates."""
+
+    def __init__(self, stable_updates):
+        self.stable_updates = stable_updates
+        self._value = None
+        self._count = 0
+
+    def update(self, value):
+        """Record the current value; return True once it has been stable long enough."""
+        if value is not None and value == self._value:
+            self._count += 1
+        else:
+            self._value = value
+            self._count = 1 if value is not None else 0
+        return self._count >= self.stable_updates
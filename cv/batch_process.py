@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v')
+
+MANIFEST_NAME = 'batch_manifest.jsonl'
+
+def list_videos(source):
+    """Return the absolute paths of the videos in a directory (recursively) or listed in a .txt/.json manifest.
+
+    Manifest entries are relative to the manifest's directory unless absolute.
+    """
+    if os.path.isdir(source):
+        videos = []
+        for directory, _, files in os.walk(source):
+            videos.extend(os.path.join(directory, name) for name in files
+                          if name.lower().endswith(VIDEO_EXTENSIONS))
+        return sorted(os.path.abspath(video) for video in videos)
+
+    with open(source, 'r') as file:
+        if source.endswith('.json'):
+            entries = json.load(file)
+        else:
+            entries = [line.strip() for line in file if line.strip() and not line.startswith('#')]
+    base = os.path.dirname(os.path.abspath(source))
+    return [os.path.abspath(os.path.join(base, entry)) for entry in entries]
+
+def video_label(video_path, base):
+    """Unique output name for a video: its path relative to base, flattened into one file name.
+
+    The outputs are named after the part before the first dot, so directory
+    separators and dots are replaced to keep e.g. a/clip.mp4 and b/clip.mp4 apart.
+    """
+    relative, extension = os.path.splitext(os.path.relpath(video_path, base))
+    return relative.replace(os.sep, '__').replace('.', '_') + extension
+
+def read_manifest(manifest_path):
+    """Return the manifest records by video label; later records win."""
+    records = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A partial line left by an interrupted run
+                    continue
+                records[record['video']] = record
+    return records
+
+# Set in each worker: queue on which it announces the videos it starts
+_started = None
+
+def _init_worker(output_root, threads, started):
+    """Per-process setup: the batch's output paths, a share of the CPU threads, and the model loaded once."""
+    global _started
+    _started = started
+    import cv2
+    import output_paths
+    import tiktok_recommendation
+
+    paths_config = dict(tiktok_recommendation.config.get('paths', {}), root=output_root)
+    output_paths.configure(**paths_config)
+
+    model_config = tiktok_recommendation.config.setdefault('model', {})
+    if threads and not model_config.get('threads'):
+        model_config['threads'] = threads
+    cv2.setNumThreads(model_config.get('threads') or 0)
+    tiktok_recommendation.load_yolo_model()
+
+def _process(video_path, label, use_cache, upload):
+    """Detect the main item of one video in a worker process and return its manifest record."""
+    import output_paths
+    import tiktok_recommendation
+    import instrumentation
+
+    # Lets the parent tell which videos were in flight if a worker crashes
+    _started.put(label)
+    paths = output_paths.get()
+    instrumentation.start(label)
+    start = time.perf_counter()
+    record = {'video': label, 'path': video_path}
+    try:
+        detection_summary = tiktok_recommendation.detect_main_item(label, use_cache, video_path=video_path)
+        if detection_summary:
+            record.update({
+                'status': 'ok',
+                'main_item': detection_summary['main_item'],
+                'main_item_colors': detection_summary.get('main_item_colors'),
+                'other_items_summary': detection_summary['other_items_summary'],
+                'main_item_coordinates': detection_summary['main_item_coordinates'],
+                'main_item_frame_path': paths.main_item_frame(label),
+                'cropped_main_item_path': paths.cropped_main_item(label),
+            })
+            if upload:
+                record['image_url'] = tiktok_recommendation.upload_main_item(label, detection_summary)
+        else:
+            record['status'] = 'no_item'
+    except Exception as e:
+        logging.exception(f"Failed to process {video_path}")
+        record.update({'status': 'error', 'error': str(e)})
+    record['elapsed'] = round(time.perf_counter() - start, 3)
+    try:
+        record['trace'] = tiktok_recommendation.write_trace(label)['stages']
+    except Exception as e:
+        logging.error(f"Could not write the trace of {video_path}: {e}")
+    return record
+
+def _run_pool(jobs, workers, output_root, use_cache, upload, write_record):
+    """Process jobs on a new pool, passing each finished video's record to write_record.
+
+    A worker that dies (segfault, out of memory) breaks the whole pool.
+    Returns the jobs left unfinished and the labels of those that had
+    started by then; both are empty if the pool finished every job.
+    """
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # Spawn, not fork: workers must not inherit the parent's torch/OpenCV thread pools
+    context = multiprocessing.get_context('spawn')
+    started = context.SimpleQueue()
+    started_labels = set()
+
+    def drain():
+        # Read as the batch goes, so the queue's pipe never fills up and blocks the workers
+        while not started.empty():
+            started_labels.add(started.get())
+
+    unfinished = {label: (video_path, label) for video_path, label in jobs}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(output_root, threads, started)) as executor:
+        futures = {executor.submit(_process, video_path, label, use_cache, upload): (video_path, label)
+                   for video_path, label in jobs}
+        for future in as_completed(futures):
+            drain()
+            video_path, label = futures[future]
+            try:
+                record = future.result()
+            except BrokenProcessPool:
+                continue
+            except Exception as e:
+                logging.error(f"Worker failed on {video_path}: {e!r}")
+                record = {'video': label, 'path': video_path, 'status': 'error', 'error': repr(e)}
+            del unfinished[label]
+            started_labels.discard(label)
+            write_record(record)
+    drain()
+    return list(unfinished.values()), started_labels & set(unfinished)
+
+def run_batch(videos, base, output_root, workers, use_cache=True, upload=False, resume=False, max_attempts=2):
+    """Process videos across a pool of workers, appending one record per video to the output manifest.
+
+    A crashed worker breaks the pool, which is then restarted for the
+    unfinished videos. Those that were in flight are first retried one at a
+    time, so only a video that crashes its worker on its own is recorded as
+    an error, after max_attempts crashes. Returns the number of videos that failed.
+    """
+    os.makedirs(output_root, exist_ok=True)
+    manifest_path = os.path.join(output_root, MANIFEST_NAME)
+
+    jobs = [(video_path, video_label(video_path, base)) for video_path in videos]
+    if resume:
+        done = {label for label, record in read_manifest(manifest_path).items() if record.get('status') != 'error'}
+        jobs = [(video_path, label) for video_path, label in jobs if label not in done]
+        logging.info(f"Resuming: {len(videos) - len(jobs)} videos already processed.")
+    if not jobs:
+        return 0
+
+    # Quantize the int8 model here, once, rather than in every worker at the same time
+    import settings
+    import detection_backends
+    detection_backends.prepare_weights(settings.load().get('model', {}))
+
+    workers = max(1, min(workers, len(jobs)))
+    logging.info(f"Processing {len(jobs)} videos with {workers} workers, "
+                 f"{max(1, (os.cpu_count() or 1) // workers)} threads each.")
+
+    failures = 0
+    completed = 0
+    with open(manifest_path, 'a') as manifest:
+        def write_record(record):
+            nonlocal failures, completed
+            # Written as each video finishes so an interrupted run can be resumed
+            manifest.write(json.dumps(record) + '\n')
+            manifest.flush()
+            failures += record['status'] == 'error'
+            completed += 1
+            logging.info(f"[{completed}/{len(jobs)}] {record['video']}: {record['status']} "
+                         f"({record.get('main_item')}, {record.get('elapsed', 0):.1f}s)")
+
+        remaining, suspects = jobs, []
+        crashes = Counter()
+        while remaining or suspects:
+            if suspects:
+                # Alone in a pool, a crash can only be this video's
+                video_path, label = job = suspects.pop(0)
+                unfinished, _ = _run_pool([job], 1, output_root, use_cache, upload, write_record)
+                if unfinished:
+                    crashes[label] += 1
+                    logging.error(f"{video_path} crashed its worker ({crashes[label]}/{max_attempts}).")
+                    if crashes[label] < max_attempts:
+                        suspects.insert(0, job)
+                    else:
+                        write_record({'video': label, 'path': video_path, 'status': 'error',
+                                      'error': f"worker crashed {crashes[label]} times"})
+                continue
+
+            remaining, running = _run_pool(remaining, workers, output_root, use_cache, upload, write_record)
+            if remaining and not running:
+                # Broken before any video started, e.g. the model failed to load: restarting would not help
+                for video_path, label in remaining:
+                    write_record({'video': label, 'path': video_path, 'status': 'error',
+                                  'error': "worker pool failed to start"})
+                break
+            if remaining:
+                logging.warning(f"A worker crashed; retrying the {len(running)} videos in flight one at a time "
+                                f"and restarting the pool for {len(remaining) - len(running)} others.")
+                suspects = [job for job in remaining if job[1] in running]
+                remaining = [job for job in remaining if job[1] not in running]
+    return failures
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Detect the main item of many videos across a process pool.")
+    parser.add_argument('source', help="directory of videos, or a .txt/.json manifest of video paths")
+    parser.add_argument('--output-root', default='./batch_output',
+                        help="root for main_items/, cropped_main_items/ and the batch manifest")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument('--no-cache', action='store_true', help="ignore and do not update the detection cache")
+    parser.add_argument('--upload', action='store_true', help="upload each cropped main item and record its URL")
+    parser.add_argument('--resume', action='store_true', help="skip videos already recorded in the batch manifest")
+    parser.add_argument('--max-attempts', type=int, default=2,
+                        help="record a video as an error after it crashed its worker this many times")
+    args = parser.parse_args()
+
+    videos = list_videos(args.source)
+    base = args.source if os.path.isdir(args.source) else os.path.dirname(os.path.abspath(args.source))
+    failures = run_batch(videos, os.path.abspath(base), os.path.abspath(args.output_root), args.workers,
+                         use_cache=not args.no_cache, upload=args.upload, resume=args.resume,
+                         max_attempts=args.max_attempts)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,135 @@
+import logging
+import cv2
+import numpy as np
+
+# Reference colors used to name a dominant RGB color
+COLOR_PALETTE = {
+    "red": (200, 50, 50),
+    "green": (50, 200, 50),
+    "blue": (50, 50, 200),
+    "yellow": (200, 200, 50),
+    "magenta": (200, 50, 200),
+    "cyan": (50, 200, 200),
+    "white": (150, 150, 150),
+    "black": (100, 100, 100),
+    "orange": (200, 100, 50),
+    "lime": (100, 200, 50),
+    "violet": (150, 50, 150),
+}
+
+PALETTE_NAMES = list(COLOR_PALETTE)
+PALETTE_RGB = np.array(list(COLOR_PALETTE.values()), dtype=np.float64)
+
+def nearest_color_names(rgb_colors):
+    """Map an (N, 3) array of RGB colors to the names of their closest palette colors."""
+    rgb_colors = np.asarray(rgb_colors, dtype=np.float64).reshape(-1, 3)
+    distances = ((rgb_colors[:, None, :] - PALETTE_RGB[None, :, :]) ** 2).sum(axis=-1)
+    return [PALETTE_NAMES[i] for i in distances.argmin(axis=1)]
+
+class ColorEngine:
+    """Dominant color detection for many crops at once.
+
+    Each crop is downscaled and its pixels are binned into a coarse RGB
+    histogram (levels**3 cells, each represented by the mean of its pixels).
+    A weighted k-means over the occupied cells then stands in for a k-means
+    over the raw pixels, and runs for all crops together as NumPy array
+    operations instead of one scikit-learn fit per crop.
+    """
+
+    def __init__(self, k=3, levels=16, sample_height=50, max_iterations=20):
+        self.k = k
+        self.levels = levels
+        self.sample_height = sample_height
+        self.max_iterations = max_iterations
+
+    def _sample_pixels(self, image):
+        """Convert a BGR crop to RGB and downscale it to sample_height rows."""
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        height, width, _ = image_rgb.shape
+        new_width = max(1, int(width / height * self.sample_height))
+        resized_img = cv2.resize(image_rgb, (new_width, self.sample_height), interpolation=cv2.INTER_AREA)
+        return resized_img.reshape(-1, 3)
+
+    def _histograms(self, pixel_sets):
+        """Bin every crop's pixels into occupied histogram cells.
+
+        Returns the owning crop index, pixel count and mean RGB color of each
+        occupied cell, sorted by crop.
+        """
+        levels = self.levels
+        n_cells = levels ** 3
+        pixels = np.concatenate(pixel_sets).astype(np.int64)
+        crop_ids = np.repeat(np.arange(len(pixel_sets)), [len(p) for p in pixel_sets])
+
+        quantized = pixels * levels // 256
+        cells = (quantized[:, 0] * levels + quantized[:, 1]) * levels + quantized[:, 2]
+        flat = crop_ids * n_cells + cells
+        size = len(pixel_sets) * n_cells
+
+        counts = np.bincount(flat, minlength=size)
+        occupied = np.flatnonzero(counts)
+        sums = np.stack([np.bincount(flat, weights=pixels[:, c], minlength=size)[occupied] for c in range(3)], axis=-1)
+        counts = counts[occupied].astype(np.float64)
+        return occupied // n_cells, counts, sums / counts[:, None]
+
+    @staticmethod
+    def _segment_argmax(values, cell_crops, n_crops):
+        """Index of the largest value within each crop's (contiguous) run of cells."""
+        order = np.lexsort((-values, cell_crops))
+        first = np.searchsorted(cell_crops[order], np.arange(n_crops))
+        return order[first]
+
+    def _cluster(self, cell_crops, counts, means, n_crops):
+        """Weighted k-means over histogram cells of all crops; return centers (N, k, 3) and weights (N, k)."""
+        k = self.k
+
+        # Deterministic weighted k-means++ seeding: heaviest cell, then farthest by weight
+        centers = [means[self._segment_argmax(counts, cell_crops, n_crops)]]
+        min_d2 = ((means - centers[0][cell_crops]) ** 2).sum(axis=-1)
+        for _ in range(k - 1):
+            centers.append(means[self._segment_argmax(counts * min_d2, cell_crops, n_crops)])
+            min_d2 = np.minimum(min_d2, ((means - centers[-1][cell_crops]) ** 2).sum(axis=-1))
+        centers = np.stack(centers, axis=1)
+
+        for _ in range(self.max_iterations):
+            distances = ((means[:, None, :] - centers[cell_crops]) ** 2).sum(axis=-1)
+            keys = cell_crops * k + distances.argmin(axis=1)
+            weights = np.bincount(keys, weights=counts, minlength=n_crops * k).reshape(n_crops, k)
+            totals = np.stack([
+                np.bincount(keys, weights=counts * means[:, c], minlength=n_crops * k) for c in range(3)
+            ], axis=-1).reshape(n_crops, k, 3)
+            new_centers = np.where(weights[..., None] > 0, totals / np.maximum(weights, 1)[..., None], centers)
+            if np.allclose(new_centers, centers):
+                break
+            centers = new_centers
+        return centers, weights
+
+    def dominant_rgb(self, crops):
+        """Return the dominant RGB color of each BGR crop, NaN for empty or invalid crops."""
+        result = np.full((len(crops), 3), np.nan)
+        valid, pixel_sets = [], []
+        for i, crop in enumerate(crops):
+            if crop is None or crop.ndim != 3 or crop.shape[0] == 0 or crop.shape[1] == 0:
+                continue
+            try:
+                pixel_sets.append(self._sample_pixels(crop))
+                valid.append(i)
+            except cv2.error as e:
+                logging.error(f"Error detecting color: {e}")
+
+        if pixel_sets:
+            cell_crops, counts, means = self._histograms(pixel_sets)
+            centers, weights = self._cluster(cell_crops, counts, means, len(pixel_sets))
+            result[valid] = centers[np.arange(len(valid)), weights.argmax(axis=1)]
+        return result
+
+    def dominant_colors(self, crops):
+        """Return the dominant color name of each BGR crop ("unknown" for empty crops)."""
+        if len(crops) == 0:
+            return []
+        dominant = self.dominant_rgb(crops)
+        known = ~np.isnan(dominant).any(axis=1)
+        names = ["unknown"] * len(crops)
+        for i, name in zip(np.flatnonzero(known), nearest_color_names(dominant[known])):
+            names[i] = name
+        return names
@@ -0,0 +1,55 @@
+import requests
+
+class DaemonUnavailable(Exception):
+    """Raised when the inference daemon cannot be reached or does not accept the job."""
+
+class JobLost(RuntimeError):
+    """Raised when the daemon stops answering about a job it accepted, which may still be running."""
+
+def submit_job(daemon_url, video, use_cache=True, timeout=600, poll_interval=30):
+    """Submit a video to the inference daemon and wait for its result.
+
+    Returns the finished job as a dict (see inference_daemon.Job.to_dict),
+    whose status is 'done' or 'no_item'. Raises DaemonUnavailable if the
+    daemon cannot be reached or rejects the job (e.g. its queue is full),
+    the only case in which the video was not handed over. Once accepted,
+    raises RuntimeError if the job fails, JobLost (a RuntimeError) if the
+    daemon stops answering and TimeoutError if it does not finish in time.
+    """
+    try:
+        response = requests.post(f"{daemon_url}/jobs", json={'video': video, 'use_cache': use_cache}, timeout=10)
+        response.raise_for_status()
+        job = response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise DaemonUnavailable(str(e)) from e
+
+    return wait_for_job(daemon_url, job['id'], timeout=timeout, poll_interval=poll_interval)
+
+def wait_for_job(daemon_url, job_id, timeout=600, poll_interval=30):
+    """Long-poll the daemon until the job has finished or timeout seconds have passed."""
+    session = requests.Session()
+    remaining = timeout
+    while remaining > 0:
+        wait = min(poll_interval, remaining)
+        try:
+            response = session.get(f"{daemon_url}/jobs/{job_id}", params={'wait': wait}, timeout=wait + 10)
+            response.raise_for_status()
+            job = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise JobLost(f"Lost track of job {job_id}: {e}") from e
+
+        if job['status'] in ('done', 'no_item'):
+            return job
+        if job['status'] == 'failed':
+            raise RuntimeError(f"Job {job_id} failed: {job.get('error')}")
+        remaining -= wait
+    raise TimeoutError(f"Job {job_id} did not finish within {timeout} seconds")
+
+def get_status(daemon_url):
+    """Return the daemon's queue depth and worker counters."""
+    try:
+        response = requests.get(f"{daemon_url}/status", timeout=10)
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise DaemonUnavailable(str(e)) from e
@@ -0,0 +1,331 @@
+import ast
+import logging
+import os
+import cv2
+import numpy as np
+
+COCO_NAMES = [
+    'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat', 'traffic light',
+    'fire hydrant', 'stop sign', 'parking meter', 'bench', 'bird', 'cat', 'dog', 'horse', 'sheep', 'cow',
+    'elephant', 'bear', 'zebra', 'giraffe', 'backpack', 'umbrella', 'handbag', 'tie', 'suitcase', 'frisbee',
+    'skis', 'snowboard', 'sports ball', 'kite', 'baseball bat', 'baseball glove', 'skateboard', 'surfboard',
+    'tennis racket', 'bottle', 'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple',
+    'sandwich', 'orange', 'broccoli', 'carrot', 'hot dog', 'pizza', 'donut', 'cake', 'chair', 'couch',
+    'potted plant', 'bed', 'dining table', 'toilet', 'tv', 'laptop', 'mouse', 'remote', 'keyboard',
+    'cell phone', 'microwave', 'oven', 'toaster', 'sink', 'refrigerator', 'book', 'clock', 'vase', 'scissors',
+    'teddy bear', 'hair drier', 'toothbrush',
+]
+
+DEFAULT_IMAGE_SIZE = 640
+
+class Detections:
+    """Backend-independent detection results, shaped like YOLOv5's results object.
+
+    xyxy holds one (N, 6) array of x1, y1, x2, y2, confidence, class rows per image.
+    """
+
+    def __init__(self, xyxy, names):
+        self.xyxy = xyxy
+        self.names = names
+
+def class_ids(names, classes):
+    """Map class names to the ids of a model's names (a list or an id -> name dict); unknown names are skipped."""
+    ids = {name: i for i, name in (names.items() if isinstance(names, dict) else enumerate(names))}
+    missing = [name for name in classes if name not in ids]
+    if missing:
+        logging.warning(f"The model does not detect {', '.join(missing)}.")
+    return sorted(ids[name] for name in classes if name in ids)
+
+def _as_array(rows):
+    """An image's detection rows as a NumPy array, whether the backend returned a tensor or an array."""
+    return rows.cpu().numpy() if hasattr(rows, 'cpu') else np.asarray(rows, dtype=np.float32).reshape(-1, 6)
+
+class TorchBackend:
+    """YOLOv5 through torch.hub, from GitHub or from a local checkout and weights file."""
+
+    def __init__(self, name='yolov5s', weights=None, repo=None, image_size=None, threads=None, classes=None,
+                 **options):
+        # Imported here: torch is only needed by this backend and slow to import
+        try:
+            import torch
+        except ImportError:
+            raise ImportError("The torch backend requires PyTorch to be installed.")
+        if threads:
+            torch.set_num_threads(threads)
+
+        if repo:
+            # Offline: local yolov5 checkout plus local weights, no network access
+            self.model = torch.hub.load(repo, 'custom', path=weights or f"{name}.pt", source='local')
+        elif weights:
+            self.model = torch.hub.load('ultralytics/yolov5', 'custom', path=weights)
+        else:
+            self.model = torch.hub.load('ultralytics/yolov5', name, pretrained=True)
+        self.image_size = image_size
+        self.names = self.model.names
+        if classes is not None:
+            # YOLOv5 drops other classes before NMS
+            self.model.classes = class_ids(self.names, classes)
+
+    def __call__(self, images, size=None):
+        size = size or self.image_size
+        if size:
+            return self.model(images, size=size)
+        return self.model(images)
+
+class OnnxBackend:
+    """YOLOv5 exported to ONNX (export.py --include onnx), run with ONNX Runtime.
+
+    Pre- and post-processing mirror YOLOv5's AutoShape: frames are passed in the
+    channel order they are given, letterboxed to image_size, and filtered with
+    the same confidence/IoU thresholds and class-aware NMS.
+    """
+
+    def __init__(self, weights, image_size=DEFAULT_IMAGE_SIZE, threads=None, providers=None, classes=None,
+                 conf_threshold=0.25, iou_threshold=0.45, max_detections=1000, **options):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The onnx backends require onnxruntime to be installed.")
+
+        session_options = onnxruntime.SessionOptions()
+        if threads:
+            session_options.intra_op_num_threads = threads
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(weights, sess_options=session_options,
+                                                    providers=providers or ['CPUExecutionProvider'])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.fixed_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        # Static exports fix the input size; dynamic ones use the configured size
+        height, width = model_input.shape[2:4]
+        self.dynamic_size = not (isinstance(height, int) and isinstance(width, int))
+        self.input_size = (image_size, image_size) if self.dynamic_size else (height, width)
+        self.input_type = np.float16 if 'float16' in model_input.type else np.float32
+
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+        self.names = self._load_names()
+        self.classes = np.array(class_ids(self.names, classes)) if classes is not None else None
+
+    def _load_names(self):
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if 'names' in metadata:
+            names = ast.literal_eval(metadata['names'])
+            if isinstance(names, dict):
+                names = [names[i] for i in sorted(names)]
+            return list(names)
+        return COCO_NAMES
+
+    def _letterbox(self, image, input_size):
+        """Resize keeping the aspect ratio and pad to the input size; return image, gain and padding."""
+        height, width = image.shape[:2]
+        target_height, target_width = input_size
+        gain = min(target_height / height, target_width / width)
+        new_width, new_height = round(width * gain), round(height * gain)
+        pad_x, pad_y = (target_width - new_width) / 2, (target_height - new_height) / 2
+
+        if (new_width, new_height) != (width, height):
+            image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+        top, bottom = round(pad_y - 0.1), round(pad_y + 0.1)
+        left, right = round(pad_x - 0.1), round(pad_x + 0.1)
+        image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return image, gain, (left, top)
+
+    def _postprocess(self, prediction, gain, padding, image_shape):
+        """Turn one image's raw (N, 5 + classes) output into xyxy/conf/cls rows."""
+        prediction = prediction[prediction[:, 4] > self.conf_threshold]
+        if len(prediction) == 0:
+            return np.zeros((0, 6), dtype=np.float32)
+
+        scores = prediction[:, 5:] * prediction[:, 4:5]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences > self.conf_threshold
+        if self.classes is not None:
+            # Like YOLOv5, drop other classes after picking each box's best class and before NMS
+            keep &= np.isin(class_ids, self.classes)
+        prediction, class_ids, confidences = prediction[keep], class_ids[keep], confidences[keep]
+        if len(prediction) == 0:
+            return np.zeros((0, 6), dtype=np.float32)
+
+        cx, cy, w, h = prediction[:, 0], prediction[:, 1], prediction[:, 2], prediction[:, 3]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+        # Class-aware NMS by offsetting each class into its own coordinate range
+        offset_boxes = boxes + class_ids[:, None] * 4096
+        nms_boxes = np.column_stack([offset_boxes[:, :2], offset_boxes[:, 2:] - offset_boxes[:, :2]])
+        kept = cv2.dnn.NMSBoxes(nms_boxes.tolist(), confidences.tolist(), self.conf_threshold, self.iou_threshold)
+        kept = np.asarray(kept, dtype=np.int64).reshape(-1)[:self.max_detections]
+
+        boxes = boxes[kept]
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - padding[0]) / gain).clip(0, image_shape[1])
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - padding[1]) / gain).clip(0, image_shape[0])
+        return np.column_stack([boxes, confidences[kept], class_ids[kept]]).astype(np.float32)
+
+    def _infer(self, images, size=None):
+        # Only dynamic exports can run at another size than the configured one
+        input_size = (size, size) if size and self.dynamic_size else self.input_size
+        prepared = [self._letterbox(image, input_size) for image in images]
+        batch = np.stack([image for image, _, _ in prepared]).transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=self.input_type) / 255.0
+        outputs = self.session.run(None, {self.input_name: batch.astype(self.input_type)})[0]
+        return [self._postprocess(prediction.astype(np.float32), gain, padding, image.shape)
+                for prediction, (_, gain, padding), image in zip(outputs, prepared, images)]
+
+    def __call__(self, images, size=None):
+        if isinstance(images, np.ndarray):
+            images = [images]
+        if self.fixed_batch:
+            # Static exports only take batches of exactly fixed_batch images, so split and pad the last with copies
+            xyxy = []
+            for start in range(0, len(images), self.fixed_batch):
+                chunk = images[start:start + self.fixed_batch]
+                xyxy.extend(self._infer(chunk + [chunk[-1]] * (self.fixed_batch - len(chunk)), size)[:len(chunk)])
+        else:
+            xyxy = self._infer(images, size)
+        return Detections(xyxy, self.names)
+
+class PersonRoiDetector:
+    """Two-pass detection around persons, with the interface of the backends it wraps.
+
+    A first pass over whole frames at a low inference size only has to find
+    persons; the second runs at the model's full size on the regions around
+    them, merged where they overlap. Held and worn items fill more of a
+    region than of a whole frame, so small ones are found without running
+    every frame at a higher resolution. Frames without a person are detected
+    whole. Resizing the first pass requires a torch model or an ONNX export
+    with a dynamic input size.
+    """
+
+    def __init__(self, model, person_size=320, margin=0.5):
+        self.model = model
+        self.names = model.names
+        self.person_size = person_size
+        self.margin = margin
+        self.person_id = class_ids(self.names, ['person'])[0]
+
+    def regions(self, persons, image_shape):
+        """Boxes around persons widened by margin of their size on every side, merged while any overlap."""
+        height, width = image_shape[:2]
+        regions = []
+        for x1, y1, x2, y2 in persons[:, :4]:
+            dx, dy = (x2 - x1) * self.margin, (y2 - y1) * self.margin
+            regions.append([max(0, int(x1 - dx)), max(0, int(y1 - dy)), min(width, int(x2 + dx)), min(height, int(y2 + dy))])
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(regions)):
+                for j in range(i + 1, len(regions)):
+                    a, b = regions[i], regions[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del regions[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return regions
+
+    def __call__(self, images, size=None):
+        if isinstance(images, np.ndarray):
+            images = [images]
+        first = self.model(images, size=self.person_size)
+
+        # Second pass inputs: the regions around each frame's persons, or the whole frame without persons
+        crops, owners = [], []
+        persons_per_image = []
+        for i, (image, rows) in enumerate(zip(images, first.xyxy)):
+            rows = _as_array(rows)
+            persons = rows[rows[:, 5] == self.person_id]
+            persons_per_image.append(persons)
+            if len(persons) == 0:
+                crops.append(image)
+                owners.append((i, 0, 0, False))
+                continue
+            for x1, y1, x2, y2 in self.regions(persons, image.shape):
+                if x2 <= x1 or y2 <= y1:
+                    continue
+                crops.append(image[y1:y2, x1:x2])
+                owners.append((i, x1, y1, True))
+        second = self.model(crops, size=size)
+
+        found = [[persons] for persons in persons_per_image]
+        for (i, x1, y1, around_persons), rows in zip(owners, second.xyxy):
+            rows = _as_array(rows).copy()
+            if around_persons:
+                # Persons come from the first pass; map the region's items back to frame coordinates
+                rows = rows[rows[:, 5] != self.person_id]
+                rows[:, [0, 2]] += x1
+                rows[:, [1, 3]] += y1
+            found[i].append(rows)
+        return Detections([np.concatenate(parts).astype(np.float32) for parts in found], self.names)
+
+def quantize_onnx_model(weights, quantized_weights):
+    """Write an int8 dynamically quantized copy of an ONNX model.
+
+    Written to a temporary file and renamed into place, so other processes
+    never open a partially written model.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    logging.info(f"Quantizing {weights} to int8 at {quantized_weights}...")
+    root, extension = os.path.splitext(quantized_weights)
+    temp_path = f"{root}.{os.getpid()}.tmp{extension}"
+    try:
+        quantize_dynamic(weights, temp_path, weight_type=QuantType.QUInt8)
+        os.replace(temp_path, quantized_weights)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return quantized_weights
+
+def prepare_weights(model_config):
+    """Create the weights the configured backend derives from others (the int8 model), if missing.
+
+    Called once before starting worker processes, so they do not all quantize at the same time.
+    """
+    if model_config.get('backend', 'torch') != 'onnx-int8':
+        return None
+    name = model_config.get('name', 'yolov5s')
+    weights = model_config.get('weights') or f"{name}.onnx"
+    quantized_weights = model_config.get('quantized_weights') or f"{os.path.splitext(weights)[0]}-int8.onnx"
+    if not os.path.exists(quantized_weights):
+        quantize_onnx_model(weights, quantized_weights)
+    return quantized_weights
+
+def model_id(model_config):
+    """Identify a model configuration, e.g. for cache keys ('yolov5s', 'yolov5s/onnx-int8@416')."""
+    name = model_config.get('name', 'yolov5s')
+    backend = model_config.get('backend', 'torch')
+    image_size = model_config.get('image_size')
+    if backend == 'torch' and not image_size and not model_config.get('weights'):
+        return name
+    weights = os.path.basename(model_config.get('weights') or '')
+    return f"{name}/{backend}@{image_size or DEFAULT_IMAGE_SIZE}" + (f"/{weights}" if weights else '')
+
+def load_backend(model_config, classes=None):
+    """Create the detection backend selected by the model section of config.yaml.
+
+    classes restricts detection to those class names; None detects every class.
+    """
+    backend = model_config.get('backend', 'torch')
+    name = model_config.get('name', 'yolov5s')
+    options = {
+        'image_size': model_config.get('image_size'),
+        'threads': model_config.get('threads'),
+        'classes': classes,
+    }
+
+    if backend == 'torch':
+        return TorchBackend(name, weights=model_config.get('weights'), repo=model_config.get('repo'), **options)
+
+    weights = model_config.get('weights') or f"{name}.onnx"
+    options['image_size'] = options['image_size'] or DEFAULT_IMAGE_SIZE
+    options['providers'] = model_config.get('providers')
+    if backend == 'onnx':
+        return OnnxBackend(weights, **options)
+    if backend == 'onnx-int8':
+        return OnnxBackend(prepare_weights(model_config), **options)
+    raise ValueError(f"Unknown detection backend '{backend}', expected torch, onnx or onnx-int8.")
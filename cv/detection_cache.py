@@ -0,0 +1,224 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import cv2
+
+CACHE_FORMAT_VERSION = 1
+
+SUMMARY_FILE = 'summary.json'
+FRAME_FILE = 'main_item_frame.jpg'
+OTHER_ITEM_FILE = 'other_item_{}.png'
+CROP_FILE = 'cropped_main_item.jpg'
+
+# Summary fields holding images, which are not stored in summary.json
+IMAGE_FIELDS = ('main_item_frame', 'other_item_crops', 'cropped_main_item_jpeg')
+
+# Seconds after which the cache size is measured again, to account for entries other processes added
+RESCAN_INTERVAL = 60
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class DetectionCache:
+    """On-disk cache of detection summaries keyed by video content and detector settings.
+
+    Each entry is a directory holding summary.json, the annotated main item
+    frame and any extra JSON artifacts (e.g. visual matches). Entries are
+    evicted least-recently-used first once the cache exceeds max_bytes.
+    Several processes may share the directory; writes only walk it when
+    their running size estimate crosses max_bytes or it is RESCAN_INTERVAL
+    seconds old.
+    """
+
+    # Per cache directory: (size as last measured plus what this process wrote since, when it was measured).
+    # Kept across instances, which callers create per video
+    _sizes = {}
+    _sizes_lock = threading.Lock()
+
+    def __init__(self, directory='./cache', max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._hash_index_path = os.path.join(directory, 'video_hashes.json')
+        os.makedirs(directory, exist_ok=True)
+
+    def video_hash(self, video_path):
+        """Content hash of a video, memoized by absolute path, size and mtime."""
+        stat = os.stat(video_path)
+        path = os.path.abspath(video_path)
+        with self._lock:
+            index = self._load_json(self._hash_index_path) or {}
+            cached = index.get(path)
+            if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+                return cached['sha256']
+
+            digest = file_digest(video_path)
+            index[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+            self._write_json(self._hash_index_path, index, indent=None)
+            return digest
+
+    def key(self, video_path, model_name, frame_skip, consumer_items, settings=None, video_hash=None):
+        """Build the cache key for a video processed with the given detector settings.
+
+        settings holds any further options that change the result (omitted when empty).
+        video_hash replaces the content hash of video_path, e.g. to look up a near-duplicate's entry.
+        """
+        parts = {
+            'version': CACHE_FORMAT_VERSION,
+            'video': video_hash or self.video_hash(video_path),
+            'model': model_name,
+            'frame_skip': frame_skip,
+            'consumer_items': sorted(consumer_items),
+        }
+        if settings:
+            parts['settings'] = settings
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """Return the cached detection summary for key, or None on a miss."""
+        entry_dir = self._entry_dir(key)
+        summary = self._load_json(os.path.join(entry_dir, SUMMARY_FILE))
+        if summary is None:
+            return None
+
+        summary['main_item_frame'] = None
+        frame_path = os.path.join(entry_dir, FRAME_FILE)
+        if os.path.exists(frame_path):
+            summary['main_item_frame'] = cv2.imread(frame_path)
+        if summary.get('main_item_coordinates') is not None:
+            summary['main_item_coordinates'] = tuple(summary['main_item_coordinates'])
+        crop_path = os.path.join(entry_dir, CROP_FILE)
+        if os.path.exists(crop_path):
+            with open(crop_path, 'rb') as crop_file:
+                summary['cropped_main_item_jpeg'] = crop_file.read()
+        if 'other_item_crops' in summary:
+            summary['other_item_crops'] = {item: cv2.imread(os.path.join(entry_dir, OTHER_ITEM_FILE.format(i)))
+                                           for i, item in enumerate(summary['other_item_crops'])}
+
+        self._touch(entry_dir)
+        logging.info(f"Detection cache hit for {key[:12]}")
+        return summary
+
+    def put(self, key, summary):
+        """Store a detection summary (as returned by get_main_item) under key."""
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+
+        data = {name: value for name, value in summary.items() if name not in IMAGE_FIELDS}
+        if summary.get('main_item_frame') is not None:
+            cv2.imwrite(os.path.join(entry_dir, FRAME_FILE), summary['main_item_frame'])
+        if summary.get('cropped_main_item_jpeg') is not None:
+            # The encoded crop is kept as is, so cache hits reproduce the exact same image
+            with open(os.path.join(entry_dir, CROP_FILE), 'wb') as crop_file:
+                crop_file.write(summary['cropped_main_item_jpeg'])
+        if 'other_item_crops' in summary:
+            # Crops are stored losslessly so they hash the same as freshly detected ones
+            data['other_item_crops'] = list(summary['other_item_crops'])
+            for i, crop in enumerate(summary['other_item_crops'].values()):
+                cv2.imwrite(os.path.join(entry_dir, OTHER_ITEM_FILE.format(i)), crop)
+        self._write_json(os.path.join(entry_dir, SUMMARY_FILE), data)
+        self._added(entry_dir)
+
+    def get_artifact(self, key, name):
+        """Return a JSON artifact stored alongside an entry, or None."""
+        entry_dir = self._entry_dir(key)
+        data = self._load_json(os.path.join(entry_dir, name))
+        if data is not None:
+            self._touch(entry_dir)
+        return data
+
+    def put_artifact(self, key, name, data):
+        """Store a JSON artifact alongside an entry."""
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        self._write_json(os.path.join(entry_dir, name), data)
+        self._added(entry_dir)
+
+    def _added(self, entry_dir):
+        """Account for a written entry, evicting once the cache may have outgrown max_bytes."""
+        try:
+            size = self._entry_size(entry_dir)
+        except FileNotFoundError:
+            size = 0
+        directory = os.path.abspath(self.directory)
+        with self._sizes_lock:
+            if directory in self._sizes:
+                total, scanned_at = self._sizes[directory]
+                total += size
+                self._sizes[directory] = (total, scanned_at)
+                if total <= self.max_bytes and time.monotonic() - scanned_at <= RESCAN_INTERVAL:
+                    return
+        self.evict()
+
+    @staticmethod
+    def _entry_size(entry_dir):
+        return sum(entry.stat().st_size for entry in os.scandir(entry_dir) if entry.is_file())
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes.
+
+        Entries removed meanwhile by another process sharing the cache are skipped.
+        """
+        entries = []
+        total = 0
+        for prefix in os.listdir(self.directory):
+            prefix_dir = os.path.join(self.directory, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            try:
+                keys = os.listdir(prefix_dir)
+            except FileNotFoundError:
+                continue
+            for key in keys:
+                entry_dir = os.path.join(prefix_dir, key)
+                try:
+                    size = self._entry_size(entry_dir)
+                    entries.append((os.stat(entry_dir).st_mtime, size, entry_dir))
+                except FileNotFoundError:
+                    continue
+                total += size
+
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            logging.info(f"Evicted detection cache entry {os.path.basename(entry_dir)[:12]}")
+        with self._sizes_lock:
+            self._sizes[os.path.abspath(self.directory)] = (total, time.monotonic())
+
+    @staticmethod
+    def _touch(entry_dir):
+        now = time.time()
+        os.utime(entry_dir, (now, now))
+
+    @staticmethod
+    def _load_json(path):
+        try:
+            with open(path, 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to read cache file {path}: {e}")
+            return None
+
+    @staticmethod
+    def _write_json(path, data, indent=4):
+        # Write to a temporary file first so readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(data, file, indent=indent)
+        os.replace(tmp_path, path)
@@ -1,62 +1,151 @@
-import requests
 import os
 import json
+import time
+import asyncio
+import hashlib
 import logging
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
+import settings
+import output_paths
+import instrumentation
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Retrieve the SERPAPI API key from environment variables
-SERPAPI_API_KEY = os.getenv('SERPAPI_API_KEY')
-
-if not SERPAPI_API_KEY:
-    logging.error("SERPAPI_API_KEY must be set in the .env file.")
-    raise ValueError("SERPAPI_API_KEY must be set in the .env file.")
+SERPAPI_URL = "https://serpapi.com/search"
 
-def save_to_json(data, video):
-    filename = './visual_matches/visual_matches_'+video.split('.')[0]+'.json'
+def save_to_json(data, video, item=None):
+    filename = output_paths.get().visual_matches(video, item)
     try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
         with open(filename, 'w') as json_file:
             json.dump(data, json_file, indent=4)
         logging.info(f"Data saved to {filename}")
     except Exception as e:
         logging.error(f"Failed to save data to {filename}: {e}")
 
-def google_lens_search(image_url, video):
+class LensCache:
+    """Google Lens results on disk, keyed by the content hash of the searched image, expiring after ttl seconds."""
+
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, key):
+        """Return the cached visual matches for key, or None if missing or expired."""
+        try:
+            with open(self._path(key), 'r') as json_file:
+                entry = json.load(json_file)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry['fetched_at'] > self.ttl:
+            return None
+        return entry['visual_matches']
+
+    def put(self, key, visual_matches):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so a concurrent reader never sees a partial file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as json_file:
+            json.dump({'fetched_at': time.time(), 'visual_matches': visual_matches}, json_file)
+        os.replace(temp_path, path)
+
+def image_key(image_url, image_path=None):
+    """Cache key of a searched image: its content hash when the file is at hand, else its URL's hash."""
+    if image_path is not None and os.path.exists(image_path):
+        with open(image_path, 'rb') as image_file:
+            return hashlib.sha256(image_file.read()).hexdigest()
+    return hashlib.sha256(image_url.encode()).hexdigest()
+
+def cache_from_config(lens_config):
+    """Build the LensCache configured by the 'lens' section of config.yaml, or None if disabled."""
+    lens_config = lens_config or {}
+    if not lens_config.get('cache', True):
+        return None
+    return LensCache(lens_config.get('cache_directory', './lens_cache'), lens_config.get('ttl_hours', 168) * 3600)
+
+def cached_matches(cache, image_url, image_path=None):
+    """Return the cached visual matches of an image, or None."""
+    if cache is None:
+        return None
+    visual_matches = cache.get(image_key(image_url, image_path))
+    if visual_matches is not None:
+        logging.info(f"Google Lens results for {image_url} found in cache.")
+        instrumentation.count('lens_cache_hits')
+    return visual_matches
+
+async def search_images(images, client, cache=None, url=SERPAPI_URL):
+    """Search Google Lens for several images concurrently.
+
+    images is a list of (image_url, image_path) pairs; image_path may be None
+    and is only used to key the cache by content. Results come back in the
+    same order, each the list of visual matches or None if the search failed.
+    Cached results are returned without calling the API.
+    """
+    async def search(image_url, image_path):
+        visual_matches = cached_matches(cache, image_url, image_path)
+        if visual_matches is not None:
+            return visual_matches
+
+        # One failed search must not take the others in the batch down with it
+        try:
+            params = {"engine": "google_lens", "url": image_url, "api_key": settings.api_key('SERPAPI_API_KEY')}
+            with instrumentation.stage('lens_search'):
+                data = await client.get_json(url, params=params)
+            if data is None:
+                return None
+            visual_matches = data.get('visual_matches', [])
+            logging.info(f"Google Lens search successful. Found {len(visual_matches)} visual matches.")
+            if cache is not None:
+                cache.put(image_key(image_url, image_path), visual_matches)
+            return visual_matches
+        except Exception as e:
+            logging.error(f"Google Lens search for {image_url} failed: {e}")
+            return None
+
+    return await asyncio.gather(*(search(image_url, image_path) for image_url, image_path in images))
+
+def google_lens_search_many(images, lens_config=None, http_config=None):
+    """Blocking wrapper of search_images using a rate-limited client and the cache from config.
+
+    When every image is cached no client is created, so aiohttp is not even imported.
+    """
+    lens_config = lens_config or {}
+    cache = cache_from_config(lens_config)
+    results = [cached_matches(cache, image_url, image_path) for image_url, image_path in images]
+    missing = [i for i, visual_matches in enumerate(results) if visual_matches is None]
+    if not missing:
+        return results
+
+    import http_client
+
+    async def run():
+        client = http_client.client_from_config(http_config, rate_limit=lens_config.get('rate_limit', 1.0))
+        async with client:
+            return await search_images([images[i] for i in missing], client, cache, lens_config.get('url', SERPAPI_URL))
+    for i, visual_matches in zip(missing, asyncio.run(run())):
+        results[i] = visual_matches
+    return results
+
+def google_lens_search(image_url, video, image_path=None, lens_config=None, http_config=None):
     """
     Perform a Google Lens search using the given image URL.
 
     Parameters:
     image_url (str): The URL of the image to search.
-    output_filename (str): The filename to save the search results.
+    video (str): The video the image comes from; names the saved results.
+    image_path (str): The local copy of the image, used to cache results by content.
 
     Returns:
     list: A list of visual matches if the search is successful, None otherwise.
     """
-    url = "https://serpapi.com/search"
-    params = {
-        "engine": "google_lens",
-        "url": image_url,
-        "api_key": SERPAPI_API_KEY
-    }
-
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        visual_matches = data.get('visual_matches', [])
-        logging.info(f"Google Lens search successful. Found {len(visual_matches)} visual matches.")
-        save_to_json(visual_matches,video)
-        return visual_matches
-    except requests.exceptions.HTTPError as http_err:
-        logging.error(f"HTTP error occurred: {http_err}")
-    except Exception as err:
-        logging.error(f"An error occurred: {err}")
-    return None
+    visual_matches = google_lens_search_many([(image_url, image_path)], lens_config, http_config)[0]
+    if visual_matches is not None:
+        save_to_json(visual_matches, video)
+    return visual_matches
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,161 @@
+import asyncio
+import codecs
+import logging
+import random
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+import aiohttp
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class RetryableStatus(Exception):
+    """Raised internally for a response status that should be retried."""
+
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+class RateLimiter:
+    """Spaces out acquisitions to at most rate per second across all tasks."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class _FirstImageParser(HTMLParser):
+    """Incremental HTML parser that records the src of the first <img> that has one."""
+
+    def __init__(self):
+        super().__init__()
+        self.src = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.src is None and tag == 'img':
+            src = dict(attrs).get('src')
+            if src:
+                self.src = src
+
+    handle_startendtag = handle_starttag
+
+class HttpClient:
+    """Pooled aiohttp session with bounded concurrency, timeouts and retry with backoff.
+
+    concurrency caps the requests in flight across all hosts and per_host the
+    connections to any one host. Failed requests (connection errors, timeouts
+    and RETRY_STATUSES) are retried up to retries times with exponential
+    backoff starting at backoff seconds; a server's Retry-After is honoured up
+    to max_retry_after seconds. With rate_limit, every attempt (retries
+    included) is spaced to at most rate_limit requests per second.
+    Use as an async context manager.
+    """
+
+    def __init__(self, concurrency=10, per_host=4, timeout=10, connect_timeout=5, retries=3, backoff=0.5,
+                 max_retry_after=30, max_page_bytes=2 * 1024 * 1024, chunk_size=16 * 1024, headers=None,
+                 rate_limit=None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.max_page_bytes = max_page_bytes
+        self.chunk_size = chunk_size
+        self.headers = headers
+        self.rate_limit = rate_limit
+        self._rate_limiter = None
+        self._semaphore = None
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=self.headers)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        if self.rate_limit:
+            self._rate_limiter = RateLimiter(self.rate_limit)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    def _delay(self, attempt, retry_after=None):
+        """Backoff before retry number attempt (1-based), honouring a numeric Retry-After up to max_retry_after."""
+        if retry_after is not None:
+            try:
+                return min(max(0.0, float(retry_after)), self.max_retry_after)
+            except ValueError:
+                pass
+        return self.backoff * 2 ** (attempt - 1) * (1 + random.random() / 2)
+
+    async def request(self, method, url, handler, **kwargs):
+        """Send a request and return await handler(response), retrying transient failures.
+
+        handler runs while the response is open, so it can stream the body.
+        Returns None once the retries are exhausted, for other error statuses
+        and when handler cannot decode the body (e.g. invalid JSON).
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    if self._rate_limiter is not None:
+                        await self._rate_limiter.acquire()
+                    async with self.session.request(method, url, **kwargs) as response:
+                        if response.status in RETRY_STATUSES:
+                            raise RetryableStatus(response.status, response.headers.get('Retry-After'))
+                        if response.status >= 400:
+                            logging.error(f"Error fetching {url}: HTTP {response.status}")
+                            return None
+                        try:
+                            return await handler(response)
+                        except (ValueError, LookupError) as e:
+                            # A malformed body or unknown charset will not decode any better on a retry
+                            logging.error(f"Error reading {url}: {e!r}")
+                            return None
+            except (RetryableStatus, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    logging.error(f"Error fetching {url} after {attempt + 1} attempts: {e!r}")
+                    return None
+                delay = self._delay(attempt + 1, getattr(e, 'retry_after', None))
+                logging.debug(f"Retrying {url} in {delay:.2f}s after {e!r}")
+                await asyncio.sleep(delay)
+
+    async def get_json(self, url, **kwargs):
+        """GET url and return its decoded JSON body, or None on failure."""
+        async def read_json(response):
+            return await response.json(content_type=None)
+        return await self.request('GET', url, read_json, **kwargs)
+
+    async def first_image(self, url, **kwargs):
+        """Return the absolute URL of the first <img> on a page, or None.
+
+        The page is streamed and parsing stops as soon as the image is found,
+        so the rest of the page is never downloaded.
+        """
+        async def find_image(response):
+            parser = _FirstImageParser()
+            decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+            received = 0
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                parser.feed(decoder.decode(chunk))
+                if parser.src is not None:
+                    return urljoin(str(response.url), parser.src)
+                received += len(chunk)
+                if received >= self.max_page_bytes:
+                    break
+            return None
+        return await self.request('GET', url, find_image, **kwargs)
+
+def client_from_config(http_config, **overrides):
+    """Build an HttpClient from the 'http' section of config.yaml, with overrides taking precedence."""
+    return HttpClient(**dict(http_config or {}, **overrides))
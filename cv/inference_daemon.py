@@ -0,0 +1,195 @@
+"""Long-running local worker that keeps the detection model loaded.
+
+Run from the cv/ directory:
+
+    python inference_daemon.py [--host 127.0.0.1] [--port 8765] [--concurrency 1]
+
+Endpoints:
+    POST /jobs            {"video": "video1.mp4", "use_cache": true} -> queued job
+    GET  /jobs/<id>       job status (queued, running, done, no_item or failed) and result;
+                          ?wait=<seconds> long-polls until it finishes
+    GET  /status          queue depth, running jobs and counters
+"""
+import argparse
+import asyncio
+import contextvars
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+import tiktok_recommendation
+import instrumentation
+
+class Job:
+    """A video queued for processing by the daemon."""
+
+    def __init__(self, video, use_cache=True):
+        self.id = uuid.uuid4().hex
+        self.video = video
+        self.use_cache = use_cache
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'video': self.video,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.result is not None:
+            data.update(self.result)
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+class InferenceDaemon:
+    """Queues videos and processes them with a model that is loaded once."""
+
+    def __init__(self, concurrency=1, max_queue=100, max_finished=1000):
+        self.concurrency = max(1, concurrency)
+        self.max_finished = max_finished
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.jobs = OrderedDict()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.workers = []
+
+    async def start(self, app):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, tiktok_recommendation.load_yolo_model)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        logging.info(f"Inference daemon ready with {self.concurrency} worker(s).")
+
+    async def stop(self, app):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            job.status = 'running'
+            job.started_at = time.time()
+            self.running += 1
+            try:
+                # In a context of its own, so its trace is not replaced by a concurrent job's
+                job.result = await loop.run_in_executor(self.executor, contextvars.copy_context().run, run_job,
+                                                        job.video, job.use_cache)
+                # A video without a main item is a normal outcome, not a failure
+                job.status = 'done' if job.result is not None else 'no_item'
+                self.completed += 1
+            except Exception as e:
+                logging.error(f"Job {job.id} for {job.video} failed: {e}")
+                job.status = 'failed'
+                job.error = str(e)
+                self.failed += 1
+            finally:
+                self.running -= 1
+                job.finished_at = time.time()
+                job.done.set()
+                self.queue.task_done()
+                self._forget_finished()
+
+    def _forget_finished(self):
+        """Drop the oldest finished jobs once more than max_finished are kept."""
+        finished = [job_id for job_id, job in self.jobs.items() if job.done.is_set()]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    async def submit(self, request):
+        try:
+            body = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="Expected a JSON body.")
+        video = body.get('video')
+        if not video:
+            raise web.HTTPBadRequest(text="Missing 'video'.")
+
+        job = Job(video, use_cache=body.get('use_cache', True))
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise web.HTTPServiceUnavailable(text="Job queue is full.")
+        self.jobs[job.id] = job
+        return web.json_response(job.to_dict(), status=202)
+
+    async def get_job(self, request):
+        job = self.jobs.get(request.match_info['job_id'])
+        if job is None:
+            raise web.HTTPNotFound(text="Unknown job.")
+
+        wait = float(request.query.get('wait', 0))
+        if wait > 0 and not job.done.is_set():
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+        return web.json_response(job.to_dict())
+
+    async def status(self, request):
+        return web.json_response({
+            'queue_depth': self.queue.qsize(),
+            'running': self.running,
+            'completed': self.completed,
+            'failed': self.failed,
+            'concurrency': self.concurrency,
+        })
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post('/jobs', self.submit)
+        app.router.add_get('/jobs/{job_id}', self.get_job)
+        app.router.add_get('/status', self.status)
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
+
+def run_job(video, use_cache=True):
+    """Process one video with the already loaded model and upload its main item crop.
+
+    Returns None if the video has no main item.
+    """
+    instrumentation.start(video)
+    try:
+        detection_summary = tiktok_recommendation.detect_main_item(video, use_cache)
+        if not detection_summary:
+            return None
+
+        return {
+            'main_item': detection_summary['main_item'],
+            'main_item_colors': detection_summary.get('main_item_colors'),
+            'other_items_summary': detection_summary['other_items_summary'],
+            'main_item_coordinates': detection_summary['main_item_coordinates'],
+            'image_url': tiktok_recommendation.upload_main_item(video, detection_summary),
+        }
+    finally:
+        tiktok_recommendation.write_trace(video)
+
+def main():
+    daemon_config = tiktok_recommendation.config.get('daemon', {})
+    parser = argparse.ArgumentParser(description="Run the warm-model inference daemon.")
+    parser.add_argument('--host', default=daemon_config.get('host', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=daemon_config.get('port', 8765))
+    parser.add_argument('--concurrency', type=int, default=daemon_config.get('concurrency', 1))
+    parser.add_argument('--max-queue', type=int, default=daemon_config.get('max_queue', 100))
+    args = parser.parse_args()
+
+    daemon = InferenceDaemon(concurrency=args.concurrency, max_queue=args.max_queue)
+    web.run_app(daemon.make_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import numpy as np
+
+class Trace:
+    """Stage timings and event counters of one video's run through the pipeline.
+
+    Safe to record into from the decoder and post-processing threads.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self.durations = defaultdict(list)
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.durations[name].append(seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def summary(self):
+        """Per-stage count, total, p50, p95 and max in seconds, plus the counters."""
+        with self._lock:
+            durations = {name: np.array(values) for name, values in self.durations.items()}
+            counters = dict(self.counters)
+        stages = {}
+        for name, values in durations.items():
+            p50, p95 = np.percentile(values, [50, 95])
+            stages[name] = {'count': len(values), 'total': float(values.sum()), 'p50': float(p50),
+                            'p95': float(p95), 'max': float(values.max())}
+        return {'name': self.name, 'started_at': self.started_at,
+                'elapsed': time.time() - self.started_at, 'stages': stages, 'counters': counters}
+
+    def prometheus(self, prefix='tiktok_pipeline'):
+        """The summary in the Prometheus text exposition format."""
+        summary = self.summary()
+        video = self.name.replace('\\', '\\\\').replace('"', '\\"')
+        lines = [f'# HELP {prefix}_stage_seconds Duration of pipeline stages for the last processed video.',
+                 f'# TYPE {prefix}_stage_seconds summary']
+        for stage, stats in sorted(summary['stages'].items()):
+            labels = f'video="{video}",stage="{stage}"'
+            lines.append(f'{prefix}_stage_seconds{{{labels},quantile="0.5"}} {stats["p50"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds{{{labels},quantile="0.95"}} {stats["p95"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{{labels}}} {stats["total"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{{labels}}} {stats["count"]}')
+        lines += [f'# HELP {prefix}_events Events counted for the last processed video.',
+                  f'# TYPE {prefix}_events gauge']
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f'{prefix}_events{{video="{video}",event="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as file:
+        file.write(text)
+    os.replace(temp_path, path)
+
+# The trace being recorded into, replaced by start() for every video. A context variable rather than a global, so
+# videos processed at the same time (e.g. by the daemon's workers) each record into their own; threads started for
+# a video must run in a copy of its context (contextvars.copy_context().run) to record into its trace
+_current = contextvars.ContextVar('trace', default=Trace(''))
+
+def start(name):
+    """Begin a new trace in the current context, e.g. for the next video."""
+    trace = Trace(name)
+    _current.set(trace)
+    return trace
+
+def current():
+    return _current.get()
+
+def stage(name):
+    """Context manager timing a stage of the current trace."""
+    return _current.get().stage(name)
+
+def count(name, n=1):
+    _current.get().count(name, n)
+
+def _merge_recorded_elsewhere(summary, trace_path):
+    """Add the stages another process (e.g. the inference daemon) recorded for this video during this trace."""
+    try:
+        with open(trace_path, 'r') as file:
+            other = json.load(file)
+    except (OSError, ValueError):
+        return summary
+    if other.get('name') != summary['name'] or other.get('started_at', 0) <= summary['started_at']:
+        return summary
+    summary['stages'] = {**other.get('stages', {}), **summary['stages']}
+    summary['counters'] = dict(Counter(other.get('counters', {})) + Counter(summary['counters']))
+    return summary
+
+def finish(trace_path=None, prometheus_path=None):
+    """Log the current trace's stage timings and write it as JSON and/or a Prometheus textfile."""
+    trace = _current.get()
+    summary = trace.summary()
+    if trace_path:
+        summary = _merge_recorded_elsewhere(summary, trace_path)
+    for name, stats in sorted(summary['stages'].items()):
+        logging.info(f"{name}: {stats['count']} x, total {stats['total']:.3f}s, "
+                     f"p50 {stats['p50'] * 1000:.1f}ms, p95 {stats['p95'] * 1000:.1f}ms")
+    if trace_path:
+        _write_atomic(trace_path, json.dumps(summary, indent=4))
+    if prometheus_path:
+        _write_atomic(prometheus_path, trace.prometheus())
+    return summary
@@ -1,25 +1,63 @@
 import sys
-import viewer
+import argparse
+import logging
 import os
-from google_lens_search import google_lens_search
+from google_lens_search import google_lens_search_many, save_to_json
 import tiktok_recommendation
+import upload_image
+import output_paths
+import instrumentation
+from match_index import MatchIndex
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <video>")
-        sys.exit(1)
-    video = sys.argv[1]
-    
-    image_url = tiktok_recommendation.main(video)
-    os.system(f"start {image_url}")
+def run(video, use_cache=True, show=True):
+    """Detect a video's items, search them with Google Lens and save and index the visual matches.
+
+    Returns the visual match file of the main item, or None if no main item was found.
+    With show, the uploaded crop and the matches are opened for viewing.
+    """
+    image_url = tiktok_recommendation.main(video, use_cache=use_cache)
+    if image_url is None:
+        return None
+    if show:
+        os.system(f"start {image_url}")
+
+    paths = output_paths.get()
+    visual_match_file = paths.visual_matches(video)
 
-    visual_match_file = './visual_matches/visual_matches_'+video.split('.')[0]+'.json'
+    # Search the main item and the other item crops together; results are cached by crop content
+    images = [(None, image_url, paths.cropped_main_item(video))]
+    for item, crop_path in tiktok_recommendation.other_item_images(video):
+        crop_url = upload_image.upload_image_to_imgbb(crop_path)
+        if crop_url:
+            images.append((item, crop_url, crop_path))
 
-    if not os.path.exists(visual_match_file):
-        print("Visual matches not found. Searching for visual matches...")
-        google_lens_search(image_url, video)
-        print("Visual matches found. Please run the script again.")
-    
-    if os.path.exists(visual_match_file):
+    print("Searching for visual matches...")
+    results = google_lens_search_many([(url, path) for _, url, path in images],
+                                      tiktok_recommendation.config.get('lens'), tiktok_recommendation.config.get('http'))
+    index_config = tiktok_recommendation.config.get('match_index', {})
+    index = MatchIndex(index_config.get('path', './matches.db')) if index_config.get('enabled', True) else None
+    for (item, _, _), visual_matches in zip(images, results):
+        if visual_matches is not None:
+            save_to_json(visual_matches, video, item)
+            if index is not None:
+                index.upsert(video, visual_matches, item)
+    if index is not None:
+        index.close()
+    tiktok_recommendation.write_trace(video)
+
+    if show and os.path.exists(visual_match_file):
+        # Tk and the thumbnail loader are only imported when the matches are shown
+        import viewer
         viewer.main(visual_match_file)
-    sys.exit(0)
\ No newline at end of file
+    return visual_match_file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find and view visual matches for the main item in a video.")
+    parser.add_argument('video', help="video file name in ../videos/")
+    parser.add_argument('--no-cache', action='store_true', help="ignore and do not update the detection cache")
+    parser.add_argument('--debug', action='store_true', help="log every processed frame and detection")
+    args = parser.parse_args()
+    if args.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+    instrumentation.start(args.video)
+    sys.exit(0 if run(args.video, use_cache=not args.no_cache) else 1)
@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import sqlite3
+import logging
+import argparse
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    video TEXT NOT NULL,
+    item TEXT NOT NULL DEFAULT '',
+    position INTEGER,
+    title TEXT,
+    link TEXT,
+    source TEXT,
+    price REAL,
+    currency TEXT,
+    in_stock INTEGER,
+    thumbnail TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS matches_video ON matches (video, item);
+CREATE INDEX IF NOT EXISTS matches_source ON matches (source);
+CREATE INDEX IF NOT EXISTS matches_price ON matches (price);
+CREATE VIRTUAL TABLE IF NOT EXISTS matches_fts USING fts5 (
+    title, content='matches', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS matches_insert AFTER INSERT ON matches BEGIN
+    INSERT INTO matches_fts (rowid, title) VALUES (new.id, new.title);
+END;
+CREATE TRIGGER IF NOT EXISTS matches_delete AFTER DELETE ON matches BEGIN
+    INSERT INTO matches_fts (matches_fts, rowid, title) VALUES ('delete', old.id, old.title);
+END;
+"""
+
+SORT_COLUMNS = {'title': 'title COLLATE NOCASE', 'source': 'source COLLATE NOCASE', 'price': 'price',
+                'in_stock': 'in_stock', 'position': 'position', 'video': 'video'}
+
+FILE_PATTERN = re.compile(r'^visual_matches_(.+)\.json$')
+
+def _row(video, item, position, match):
+    price = match.get('price', {})
+    value = price.get('extracted_value')
+    in_stock = match.get('in_stock')
+    return (video, item or '', match.get('position', position), match.get('title'), match.get('link'),
+            match.get('source'), float(value) if isinstance(value, (int, float)) else None, price.get('currency'),
+            None if in_stock is None else int(bool(in_stock)), match.get('thumbnail'), json.dumps(match))
+
+def _fts_query(text):
+    """Match every word of text, each quoted so user input cannot break the FTS syntax."""
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+class MatchIndex:
+    """SQLite index of the visual matches of every processed video.
+
+    Matches are stored per (video, item), item being '' for the main item,
+    with indexes on video, source and price and full text search over titles.
+    """
+
+    def __init__(self, path='matches.db'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def upsert(self, video, matches, item=None):
+        """Replace the matches of a video's main item (or of one of its other items)."""
+        with self.connection:
+            self._replace(video, matches, item)
+
+    def _replace(self, video, matches, item):
+        self.connection.execute('DELETE FROM matches WHERE video = ? AND item = ?', (video, item or ''))
+        self.connection.executemany(
+            'INSERT INTO matches (video, item, position, title, link, source, price, currency, in_stock, thumbnail, data) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (_row(video, item, position, match) for position, match in enumerate(matches, 1)))
+
+    def import_directory(self, directory):
+        """Bulk import every visual_matches_<video>[_<item>].json file of a directory in one transaction.
+
+        A file is taken to hold an other item's matches when the main item file
+        of a shorter video name exists next to it, e.g. visual_matches_video1_cup.json
+        beside visual_matches_video1.json. Returns the number of files imported.
+        """
+        names = sorted(name for name in os.listdir(directory) if FILE_PATTERN.match(name))
+        stems = {FILE_PATTERN.match(name).group(1) for name in names}
+        imported = 0
+        with self.connection:
+            for name in names:
+                video, item = FILE_PATTERN.match(name).group(1), None
+                parts = video.split('_')
+                for split in range(len(parts) - 1, 0, -1):
+                    prefix = '_'.join(parts[:split])
+                    if prefix in stems:
+                        video, item = prefix, ' '.join(parts[split:])
+                        break
+                try:
+                    with open(os.path.join(directory, name), 'r') as json_file:
+                        matches = json.load(json_file)
+                except (OSError, ValueError) as e:
+                    logging.error(f"Skipping {name}: {e}")
+                    continue
+                self._replace(video, matches, item)
+                imported += 1
+        return imported
+
+    def _where(self, text=None, video=None, item=None, source=None, min_price=None, max_price=None,
+               in_stock=None, has_price=None):
+        clauses, params = [], []
+        if text:
+            clauses.append('id IN (SELECT rowid FROM matches_fts WHERE matches_fts MATCH ?)')
+            params.append(_fts_query(text))
+        for column, value in (('video', video), ('source', source)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if item is not None:
+            clauses.append('item = ?')
+            params.append(item)
+        if min_price is not None:
+            clauses.append('price >= ?')
+            params.append(min_price)
+        if max_price is not None:
+            clauses.append('price <= ?')
+            params.append(max_price)
+        if in_stock is not None:
+            clauses.append('in_stock = ?')
+            params.append(int(in_stock))
+        if has_price is not None:
+            clauses.append('price IS NOT NULL' if has_price else 'price IS NULL')
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def iter_query(self, sort=None, descending=False, limit=None, offset=0, **filters):
+        """Yield the matches (as the original dicts) passing every filter.
+
+        Filters: text (full text search on title), video, item, source,
+        min_price, max_price, in_stock and has_price. sort is one of
+        SORT_COLUMNS; matches without a price sort last.
+        """
+        where, params = self._where(**filters)
+        order = 'ORDER BY video, item, position'
+        if sort is not None:
+            direction = 'DESC' if descending else 'ASC'
+            order = f'ORDER BY {sort} IS NULL, {SORT_COLUMNS[sort]} {direction}, id'
+        sql = f'SELECT data FROM matches{where} {order}'
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params += [limit, offset]
+        for row in self.connection.execute(sql, params):
+            yield json.loads(row['data'])
+
+    def query(self, **options):
+        """Return iter_query's matches as a list."""
+        return list(self.iter_query(**options))
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        return self.connection.execute(f'SELECT COUNT(*) FROM matches{where}', params).fetchone()[0]
+
+    def videos(self):
+        return [row[0] for row in self.connection.execute('SELECT DISTINCT video FROM matches ORDER BY video')]
+
+    def sources(self):
+        return [row[0] for row in self.connection.execute(
+            'SELECT DISTINCT source FROM matches WHERE source IS NOT NULL ORDER BY source')]
+
+if __name__ == "__main__":
+    import settings
+    import output_paths
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Default to the index and the visual matches the pipeline writes, wherever this is run from
+    config = settings.load()
+    default_db = (config.get('match_index') or {}).get('path') or os.path.join(os.path.dirname(settings.CONFIG_PATH),
+                                                                               'matches.db')
+    parser = argparse.ArgumentParser(description="Build and query the visual match index.")
+    parser.add_argument('--db', default=default_db, help="index database file (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help="import visual_matches_*.json files")
+    import_parser.add_argument('directory', nargs='?', help="directory of the files (default: %(default)s)",
+                               default=output_paths.configure(**config.get('paths', {})).visual_matches_dir)
+    query_parser = subparsers.add_parser('query', help="print matching products")
+    query_parser.add_argument('text', nargs='?', help="words that must appear in the title")
+    query_parser.add_argument('--video')
+    query_parser.add_argument('--source')
+    query_parser.add_argument('--max-price', type=float)
+    query_parser.add_argument('--min-price', type=float)
+    query_parser.add_argument('--in-stock', action='store_true')
+    query_parser.add_argument('--sort', choices=sorted(SORT_COLUMNS))
+    query_parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    index = MatchIndex(args.db)
+    if args.command == 'import':
+        logging.info(f"Imported {index.import_directory(args.directory)} files into {args.db}.")
+    else:
+        for match in index.iter_query(text=args.text, video=args.video, source=args.source,
+                                      min_price=args.min_price, max_price=args.max_price,
+                                      in_stock=True if args.in_stock else None, sort=args.sort, limit=args.limit):
+            price = match.get('price', {}).get('value', 'N/A')
+            print(f"{price:>12}  {match.get('source', '')[:20]:<20}  {match.get('title', '')}")
+    index.close()
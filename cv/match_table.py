@@ -0,0 +1,134 @@
+import json
+from collections import defaultdict
+import numpy as np
+
+def iter_json_array(filepath, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array of objects one at a time.
+
+    The file is read chunk by chunk, so the first elements are available
+    before the whole file has been read.
+    """
+    decoder = json.JSONDecoder()
+    with open(filepath, 'r') as file:
+        buffer = ''
+        position = 0
+        started = False
+        eof = False
+        while True:
+            # Skip whitespace, the opening bracket and separators
+            while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ','
+                                              or (not started and buffer[position] == '[')):
+                started = started or buffer[position] == '['
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            if position < len(buffer):
+                try:
+                    element, position = decoder.raw_decode(buffer, position)
+                    yield element
+                    continue
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+            elif eof:
+                return
+
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+def match_price(item):
+    """Numeric price of a visual match, or NaN."""
+    value = item.get('price', {}).get('extracted_value')
+    return float(value) if isinstance(value, (int, float)) else float('nan')
+
+class MatchTable:
+    """Visual matches with column indexes for fast sorting and filtering.
+
+    Each match is identified by its row, its position in load order, which
+    stays stable however the table is sorted or filtered. Column arrays and
+    sort orders are built once and reused until more matches are added.
+    """
+
+    COLUMNS = ('title', 'source', 'price', 'in_stock', 'has_price')
+
+    def __init__(self):
+        self.items = []
+        self._columns = {name: [] for name in self.COLUMNS}
+        self._by_source = defaultdict(list)
+        self._arrays = {}
+        self._orders = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def extend(self, items):
+        """Append matches, indexing their columns."""
+        for item in items:
+            row = len(self.items)
+            self.items.append(item)
+            source = item.get('source', '')
+            self._columns['title'].append(item.get('title', ''))
+            self._columns['source'].append(source)
+            self._columns['price'].append(match_price(item))
+            self._columns['in_stock'].append(bool(item.get('in_stock', False)))
+            self._columns['has_price'].append('price' in item)
+            self._by_source[source].append(row)
+        self._arrays.clear()
+        self._orders.clear()
+
+    @classmethod
+    def load(cls, filepath):
+        table = cls()
+        table.extend(iter_json_array(filepath))
+        return table
+
+    def sources(self):
+        return sorted(self._by_source)
+
+    def column(self, name):
+        """Return a column as a NumPy array."""
+        if name not in self._arrays:
+            values = self._columns[name]
+            dtype = {'price': np.float64, 'in_stock': bool, 'has_price': bool}.get(name, object)
+            self._arrays[name] = np.array(values, dtype=dtype)
+        return self._arrays[name]
+
+    def order(self, name):
+        """Rows sorted by a column (stable, missing prices last)."""
+        if name not in self._orders:
+            if name in ('title', 'source'):
+                keys = [value.casefold() for value in self._columns[name]]
+                self._orders[name] = np.array(sorted(range(len(keys)), key=keys.__getitem__), dtype=np.int64)
+            else:
+                self._orders[name] = np.argsort(self.column(name), kind='stable')
+        return self._orders[name]
+
+    def query(self, has_price=None, source=None, min_price=None, max_price=None, in_stock=None,
+              sort=None, descending=False):
+        """Return the rows matching every given filter, sorted by the sort column or in load order."""
+        mask = np.ones(len(self.items), dtype=bool)
+        if source is not None:
+            mask[:] = False
+            mask[self._by_source.get(source, [])] = True
+        if has_price is not None:
+            mask &= self.column('has_price') == has_price
+        if in_stock is not None:
+            mask &= self.column('in_stock') == in_stock
+        if min_price is not None:
+            mask &= self.column('price') >= min_price
+        if max_price is not None:
+            mask &= self.column('price') <= max_price
+
+        if sort is None:
+            return np.flatnonzero(mask)
+        rows = self.order(sort)
+        rows = rows[mask[rows]]
+        if descending:
+            if sort == 'price':
+                # Keep matches without a price last
+                known = ~np.isnan(self.column('price')[rows])
+                return np.concatenate([rows[known][::-1], rows[~known]])
+            return rows[::-1]
+        return rows
@@ -0,0 +1,202 @@
+import logging
+import sqlite3
+from itertools import combinations
+import cv2
+import numpy as np
+
+# Each frame hash is split into substrings of this many bits for multi-index hashing
+SUBSTRING_BITS = 16
+SUBSTRINGS_PER_FRAME = 64 // SUBSTRING_BITS
+
+# Frames with less grayscale contrast than this (0-255 standard deviation) carry no usable hash
+MIN_FRAME_CONTRAST = 4.0
+
+# Seek to the sampled frames when they are further apart than this; a seek decodes from the previous keyframe,
+# which beats grabbing every frame in between once the gap exceeds common keyframe intervals
+SEEK_GAP = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id INTEGER PRIMARY KEY,
+    video_hash TEXT NOT NULL UNIQUE,
+    video TEXT,
+    fingerprint BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS substrings (
+    substring INTEGER NOT NULL,
+    video_id INTEGER NOT NULL,
+    PRIMARY KEY (substring, video_id)
+) WITHOUT ROWID;
+"""
+
+# SQLite host parameters per query
+MAX_PARAMS = 900
+
+def frame_hash(frame, margin=0.1):
+    """64-bit perceptual hash (pHash) of a frame, or 0 for frames too flat to hash.
+
+    The borders are cut by margin on every side, where reposts tend to add
+    watermarks, captions and letterboxing; the low frequencies of the DCT of
+    what remains are then compared to their median.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    height, width = gray.shape
+    dy, dx = int(height * margin), int(width * margin)
+    gray = gray[dy:height - dy, dx:width - dx]
+    if gray.std() < MIN_FRAME_CONTRAST:
+        return 0
+    low = cv2.dct(cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32))[:8, :8].ravel()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+def video_fingerprint(video_path, frames=8):
+    """Fingerprint of a video: the frame hashes of frames sampled evenly across it.
+
+    Returns a uint64 array with one hash per sampled frame, or None if the
+    video cannot be read or most of its sampled frames are too flat to hash.
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if not cap.isOpened() or frame_count <= 0:
+            return None
+        targets = [int((i + 0.5) * frame_count / frames) for i in range(frames)]
+        hashes = []
+        if frame_count / frames > SEEK_GAP:
+            for target in targets:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                ret, frame = cap.read()
+                hashes.append(frame_hash(frame) if ret else 0)
+        else:
+            # Short videos: grabbing through the few frames in between is cheaper than decoding from keyframes
+            position = 0
+            for target in targets:
+                while position <= target and cap.grab():
+                    position += 1
+                ret, frame = cap.retrieve() if position == target + 1 else (False, None)
+                hashes.append(frame_hash(frame) if ret else 0)
+    finally:
+        cap.release()
+    if sum(1 for value in hashes if value) * 2 < frames:
+        return None
+    return np.array(hashes, dtype=np.uint64)
+
+def hamming_distances(fingerprint, candidates):
+    """Differing bits and frames compared between a fingerprint and each row of a (K, frames) uint64 array.
+
+    Frames too flat to hash (0) in either fingerprint are left out, so they
+    neither add their 64 bits of noise nor make two flat frames match.
+    Returns two arrays: the distance over the compared frames and their number.
+    """
+    compared = (candidates != 0) & (fingerprint != 0)[None, :]
+    differences = np.where(compared, np.bitwise_xor(candidates, fingerprint[None, :]), np.uint64(0))
+    return np.unpackbits(differences.view(np.uint8), axis=1).sum(axis=1), compared.sum(axis=1)
+
+def substrings(fingerprint):
+    """The fingerprint's substrings, each tagged with its position so equal bits elsewhere never collide.
+
+    Frames too flat to hash are skipped: every such frame would otherwise share its substrings with all others.
+    """
+    mask = (1 << SUBSTRING_BITS) - 1
+    keys = []
+    for position, value in enumerate(int(value) for value in fingerprint):
+        if not value:
+            continue
+        for part in range(SUBSTRINGS_PER_FRAME):
+            index = position * SUBSTRINGS_PER_FRAME + part
+            keys.append((index << SUBSTRING_BITS) | ((value >> (part * SUBSTRING_BITS)) & mask))
+    return keys
+
+def neighbors(key, radius):
+    """Substring keys within radius bits of key (its position tag unchanged)."""
+    keys = [key]
+    for distance in range(1, radius + 1):
+        for bits in combinations(range(SUBSTRING_BITS), distance):
+            flip = 0
+            for bit in bits:
+                flip |= 1 << bit
+            keys.append(key ^ flip)
+    return keys
+
+class FingerprintIndex:
+    """SQLite index of video fingerprints searchable by Hamming distance.
+
+    Uses multi-index hashing: every 64-bit frame hash is split into 16-bit
+    substrings, each indexed with its position. Two fingerprints within
+    max_distance bits share at least one substring within
+    max_distance // substrings bits, so a search only looks up those
+    neighbors and computes exact distances for the few videos they point to,
+    instead of scanning the whole index.
+
+    Frames too flat to hash are neither indexed nor compared. max_distance
+    is then scaled to the frames both fingerprints hashed, which keeps the
+    bound per substring, and so the recall, unchanged.
+    """
+
+    def __init__(self, path='fingerprints.db'):
+        self.path = path
+        # Batch workers may add fingerprints at the same time
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM videos').fetchone()[0]
+
+    def add(self, video_hash, video, fingerprint):
+        """Index the fingerprint of a video identified by its content hash."""
+        with self.connection:
+            existing = self.connection.execute('SELECT id FROM videos WHERE video_hash = ?', (video_hash,)).fetchone()
+            if existing is not None:
+                self.connection.execute('DELETE FROM substrings WHERE video_id = ?', (existing[0],))
+                self.connection.execute('DELETE FROM videos WHERE id = ?', (existing[0],))
+            video_id = self.connection.execute(
+                'INSERT INTO videos (video_hash, video, fingerprint) VALUES (?, ?, ?)',
+                (video_hash, video, np.asarray(fingerprint, dtype=np.uint64).tobytes())).lastrowid
+            self.connection.executemany('INSERT OR IGNORE INTO substrings (substring, video_id) VALUES (?, ?)',
+                                        ((key, video_id) for key in substrings(fingerprint)))
+
+    def _candidates(self, keys):
+        video_ids = set()
+        for start in range(0, len(keys), MAX_PARAMS):
+            batch = keys[start:start + MAX_PARAMS]
+            placeholders = ','.join('?' * len(batch))
+            video_ids.update(row[0] for row in self.connection.execute(
+                f'SELECT video_id FROM substrings WHERE substring IN ({placeholders})', batch))
+        return list(video_ids)
+
+    def search(self, fingerprint, max_distance, exclude=None):
+        """Return (video_hash, video, distance) of the nearest indexed video within max_distance bits, or None.
+
+        max_distance applies to the whole fingerprint; videos sharing fewer
+        hashed frames get a proportionally smaller allowance, and those
+        sharing fewer than half of them never match.
+        exclude is a content hash to skip, e.g. the searched video's own.
+        """
+        fingerprint = np.asarray(fingerprint, dtype=np.uint64)
+        frames = len(fingerprint)
+        radius = max_distance // (frames * SUBSTRINGS_PER_FRAME)
+        video_ids = self._candidates([neighbor for key in substrings(fingerprint) for neighbor in neighbors(key, radius)])
+
+        best = None
+        for start in range(0, len(video_ids), MAX_PARAMS):
+            batch = video_ids[start:start + MAX_PARAMS]
+            placeholders = ','.join('?' * len(batch))
+            rows = [row for row in self.connection.execute(
+                f'SELECT video_hash, video, fingerprint FROM videos WHERE id IN ({placeholders})', batch)
+                if row[0] != exclude and len(row[2]) == fingerprint.nbytes]
+            if not rows:
+                continue
+            candidates = np.frombuffer(b''.join(row[2] for row in rows), dtype=np.uint64).reshape(len(rows), -1)
+            distances, compared = hamming_distances(fingerprint, candidates)
+            # Compare the share of differing bits, as rows may have hashed different numbers of frames
+            ratios = np.where(compared * 2 >= frames, distances / np.maximum(compared, 1), np.inf)
+            nearest = int(np.argmin(ratios))
+            if ratios[nearest] * frames <= max_distance and (best is None or ratios[nearest] < best[3]):
+                best = (rows[nearest][0], rows[nearest][1], int(distances[nearest]), ratios[nearest])
+        logging.debug(f"Fingerprint search checked {len(video_ids)} candidates.")
+        return best[:3] if best else None
@@ -0,0 +1,62 @@
+import os
+
+class OutputPaths:
+    """Locations of the per-video artifacts written by the pipeline.
+
+    All artifact directories live under root, so separate runs (e.g. batch
+    workers) can write to separate roots without colliding.
+    """
+
+    def __init__(self, root='.', videos_dir='../videos', main_items='main_items',
+                 cropped_main_items='cropped_main_items', cropped_other_items='cropped_other_items',
+                 visual_matches='visual_matches', summaries='summaries', traces='traces'):
+        self.root = root
+        self.videos_dir = videos_dir
+        self.main_items_dir = os.path.join(root, main_items)
+        self.cropped_main_items_dir = os.path.join(root, cropped_main_items)
+        self.cropped_other_items_root = os.path.join(root, cropped_other_items)
+        self.visual_matches_dir = os.path.join(root, visual_matches)
+        self.summaries_dir = os.path.join(root, summaries)
+        self.traces_dir = os.path.join(root, traces)
+
+    @staticmethod
+    def stem(video):
+        return video.split('.')[0]
+
+    def video(self, video):
+        return os.path.join(self.videos_dir, video)
+
+    def main_item_frame(self, video):
+        return os.path.join(self.main_items_dir, 'main_item_frame_' + self.stem(video) + '.jpg')
+
+    def cropped_main_item(self, video):
+        return os.path.join(self.cropped_main_items_dir, 'cropped_main_item_' + self.stem(video) + '.jpg')
+
+    def cropped_other_items_dir(self, video):
+        return os.path.join(self.cropped_other_items_root, self.stem(video))
+
+    def cropped_other_item(self, video, item):
+        return os.path.join(self.cropped_other_items_dir(video), item.replace(' ', '_') + '.jpg')
+
+    def summary(self, video):
+        return os.path.join(self.summaries_dir, 'summary_' + self.stem(video) + '.json')
+
+    def trace(self, video):
+        return os.path.join(self.traces_dir, 'trace_' + self.stem(video) + '.json')
+
+    def visual_matches(self, video, item=None):
+        """Visual matches of the main item of a video, or of one of its other items."""
+        suffix = '_' + item.replace(' ', '_') if item else ''
+        return os.path.join(self.visual_matches_dir, 'visual_matches_' + self.stem(video) + suffix + '.json')
+
+_current = OutputPaths()
+
+def configure(**options):
+    """Replace the output locations used by this process."""
+    global _current
+    _current = OutputPaths(**options)
+    return _current
+
+def get():
+    """Return the output locations used by this process."""
+    return _current
@@ -0,0 +1,96 @@
+import numpy as np
+
+# Above this many object x person pairs a KD-tree beats brute force broadcasting
+KDTREE_MIN_PAIRS = 1 << 16
+
+# Maximum number of object x person pairs materialized at once when broadcasting
+BROADCAST_CHUNK_PAIRS = 1 << 22
+
+def _kdtree_class():
+    """scipy's cKDTree, imported on first use as scipy takes long to import; None without scipy."""
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:  # scipy is optional, fall back to brute force broadcasting
+        return None
+    return cKDTree
+
+def _broadcast_nearest(objects, persons):
+    """Nearest-person distance for each object by chunked NumPy broadcasting."""
+    distances = np.empty(len(objects))
+    chunk = max(1, BROADCAST_CHUNK_PAIRS // len(persons))
+    for start in range(0, len(objects), chunk):
+        block = objects[start:start + chunk]
+        d2 = ((block[:, None, :] - persons[None, :, :]) ** 2).sum(axis=-1)
+        distances[start:start + chunk] = np.sqrt(d2.min(axis=1))
+    return distances
+
+def nearest_distances(objects, persons):
+    """Return the distance from every object center to its nearest person center.
+
+    objects and persons are (N, 2) and (M, 2) arrays of (x, y) points.
+    """
+    objects = np.asarray(objects, dtype=np.float64).reshape(-1, 2)
+    persons = np.asarray(persons, dtype=np.float64).reshape(-1, 2)
+    if len(persons) == 0:
+        return np.full(len(objects), np.inf)
+    if len(objects) == 0:
+        return np.empty(0)
+
+    cKDTree = _kdtree_class() if len(objects) * len(persons) >= KDTREE_MIN_PAIRS else None
+    if cKDTree is not None:
+        distances, _ = cKDTree(persons).query(objects, k=1)
+        return distances
+    return _broadcast_nearest(objects, persons)
+
+def nearest_distances_same_frame(objects, object_frames, persons, person_frames):
+    """Like nearest_distances, but only match persons detected in the same frame.
+
+    Objects without a person in their frame get an infinite distance.
+    """
+    objects = np.asarray(objects, dtype=np.float64).reshape(-1, 2)
+    persons = np.asarray(persons, dtype=np.float64).reshape(-1, 2)
+    object_frames = np.asarray(object_frames)
+    person_frames = np.asarray(person_frames)
+    distances = np.full(len(objects), np.inf)
+    if len(objects) == 0 or len(persons) == 0:
+        return distances
+
+    # Sort persons by frame so each frame's persons form a contiguous run
+    order = np.argsort(person_frames, kind='stable')
+    persons = persons[order]
+    person_frames = person_frames[order]
+    starts = np.searchsorted(person_frames, object_frames, side='left')
+    ends = np.searchsorted(person_frames, object_frames, side='right')
+    counts = ends - starts
+    matched = np.flatnonzero(counts)
+    if len(matched) == 0:
+        return distances
+
+    pair_counts = counts[matched]
+    if pair_counts.sum() > BROADCAST_CHUNK_PAIRS:
+        # Crowded frames: query each frame's persons separately
+        object_order = np.argsort(object_frames[matched], kind='stable')
+        matched = matched[object_order]
+        _, frame_starts = np.unique(object_frames[matched], return_index=True)
+        for frame_objects, frame_start in zip(np.split(matched, frame_starts[1:]), starts[matched[frame_starts]]):
+            frame_persons = persons[frame_start:ends[frame_objects[0]]]
+            distances[frame_objects] = nearest_distances(objects[frame_objects], frame_persons)
+        return distances
+
+    # Expand every object into one row per person sharing its frame
+    pair_objects = np.repeat(matched, pair_counts)
+    offsets = np.arange(pair_counts.sum()) - np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+    pair_persons = np.repeat(starts[matched], pair_counts) + offsets
+
+    d2 = ((objects[pair_objects] - persons[pair_persons]) ** 2).sum(axis=-1)
+    segment_starts = np.concatenate(([0], np.cumsum(pair_counts)[:-1]))
+    distances[matched] = np.sqrt(np.minimum.reduceat(d2, segment_starts))
+    return distances
+
+def min_distance_by_label(labels, distances):
+    """Reduce per-object distances to the minimum distance per label."""
+    labels = np.asarray(labels)
+    unique_labels, inverse = np.unique(labels, return_inverse=True)
+    minimums = np.full(len(unique_labels), np.inf)
+    np.minimum.at(minimums, inverse, distances)
+    return {str(label): float(value) for label, value in zip(unique_labels, minimums)}
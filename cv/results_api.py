@@ -0,0 +1,258 @@
+"""HTTP API serving detection summaries and visual matches to the frontend.
+
+Run from the cv/ directory:
+
+    python results_api.py [--host 127.0.0.1] [--port 8766]
+
+Endpoints:
+    GET  /videos                     videos with results
+    GET  /videos/<video>/summary     detection summary; ?fields=main_item,main_item_colors
+    GET  /videos/<video>/matches     visual matches, a page at a time; ?cursor=&limit=&fields=&item=
+    POST /jobs                       {"video": "video1.mp4"} -> processing job (forwarded to the inference daemon)
+    GET  /jobs/<id>                  job status; ?wait=<seconds> long-polls
+
+Responses carry an ETag derived from the content hash of the result file
+they were built from, and requests with a matching If-None-Match get a 304.
+Bodies are gzip-compressed for clients that accept it, under an ETag of
+their own and with Vary: Accept-Encoding so caches keep both apart.
+"""
+import os
+import re
+import json
+import asyncio
+import base64
+import hashlib
+import logging
+import argparse
+import aiohttp
+from aiohttp import web
+import settings
+import output_paths
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+class ResultFiles:
+    """Parsed result files with their content hashes, reloaded only when a file changes."""
+
+    def __init__(self):
+        self._files = {}
+
+    def load(self, path):
+        """Return (content hash, parsed JSON) of a file, or None if it does not exist."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._files.get(path)
+        if cached is None or cached[0] != signature:
+            with open(path, 'rb') as file:
+                content = file.read()
+            cached = (signature, hashlib.sha256(content).hexdigest(), json.loads(content))
+            self._files[path] = cached
+        return cached[1], cached[2]
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({'offset': offset}).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))['offset'])
+    except (ValueError, KeyError, TypeError):
+        raise web.HTTPBadRequest(text="Invalid cursor.")
+
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header allows gzip, honouring q-values (q=0 refuses a coding)."""
+    qualities = {}
+    for entry in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in entry.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+def select_fields(data, fields):
+    """Keep only the requested top-level fields of a dict."""
+    return {name: data[name] for name in fields if name in data} if fields else data
+
+class ResultsApi:
+    """Serves the result files written by the pipeline under the configured output paths."""
+
+    def __init__(self, daemon_url, allow_origin=None):
+        self.daemon_url = daemon_url
+        self.allow_origin = allow_origin
+        self.files = ResultFiles()
+        self.session = None
+
+    async def start(self, app):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=5))
+
+    async def stop(self, app):
+        await self.session.close()
+
+    def respond(self, request, data, content_hash):
+        """JSON response with an ETag from the content hash, the query and the coding, compressed when worthwhile."""
+        query = '&'.join(f'{key}={value}' for key, value in sorted(request.query.items()))
+        etag = hashlib.sha256(f'{content_hash}?{query}'.encode()).hexdigest()[:32]
+        body = json.dumps(data).encode()
+        gzipped = len(body) >= MIN_COMPRESS_BYTES and accepts_gzip(request.headers.get('Accept-Encoding', ''))
+        if gzipped:
+            # The compressed body is a different representation, so it must not share the identity ETag
+            etag += '-gzip'
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if request.if_none_match and any(tag.value == etag for tag in request.if_none_match):
+            return web.Response(status=304, headers=headers)
+
+        response = web.Response(body=body, content_type='application/json', headers=headers)
+        # Without a coding, aiohttp would pick deflate for clients that accept both
+        if gzipped:
+            response.enable_compression(web.ContentCoding.gzip)
+        return response
+
+    async def load(self, path):
+        """ResultFiles.load on a worker thread, so reading and parsing a large file does not block other requests."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.files.load, path)
+
+    @staticmethod
+    def _fields(request):
+        fields = request.query.get('fields')
+        return [name for name in fields.split(',') if name] if fields else None
+
+    async def list_videos(self, request):
+        paths = output_paths.get()
+        summaries = self._stems(paths.summaries_dir, r'^summary_(.+)\.json$')
+        matches = self._stems(paths.visual_matches_dir, r'^visual_matches_(.+)\.json$')
+        # Match files of other items (visual_matches_<video>_<item>.json) are listed under their video
+        return web.json_response({'videos': sorted(summaries | (matches - self._other_item_stems(paths)))})
+
+    @staticmethod
+    def _other_item_stems(paths):
+        """<video>_<item> for every other item crop saved, i.e. the stems of the per-item match files."""
+        root = paths.cropped_other_items_root
+        if not os.path.isdir(root):
+            return set()
+        stems = set()
+        for video in os.listdir(root):
+            video_dir = os.path.join(root, video)
+            if os.path.isdir(video_dir):
+                stems.update(f'{video}_{os.path.splitext(name)[0]}' for name in os.listdir(video_dir))
+        return stems
+
+    @staticmethod
+    def _stems(directory, pattern):
+        if not os.path.isdir(directory):
+            return set()
+        return {match.group(1) for match in map(re.compile(pattern).match, os.listdir(directory)) if match}
+
+    async def get_summary(self, request):
+        loaded = await self.load(output_paths.get().summary(request.match_info['video']))
+        if loaded is None:
+            raise web.HTTPNotFound(text="No summary for this video.")
+        content_hash, summary = loaded
+        return self.respond(request, select_fields(summary, self._fields(request)), content_hash)
+
+    async def get_matches(self, request):
+        video = request.match_info['video']
+        loaded = await self.load(output_paths.get().visual_matches(video, request.query.get('item')))
+        if loaded is None:
+            raise web.HTTPNotFound(text="No visual matches for this video.")
+        content_hash, matches = loaded
+
+        try:
+            limit = min(MAX_PAGE_SIZE, max(1, int(request.query.get('limit', DEFAULT_PAGE_SIZE))))
+        except ValueError:
+            raise web.HTTPBadRequest(text="Invalid limit.")
+        offset = max(0, decode_cursor(request.query['cursor'])) if 'cursor' in request.query else 0
+        fields = self._fields(request)
+        page = [select_fields(match, fields) for match in matches[offset:offset + limit]]
+        next_offset = offset + limit
+        return self.respond(request, {
+            'video': video,
+            'total': len(matches),
+            'matches': page,
+            'next_cursor': encode_cursor(next_offset) if next_offset < len(matches) else None,
+        }, content_hash)
+
+    async def _forward(self, method, path, **kwargs):
+        """Forward a request to the inference daemon and relay its JSON response."""
+        try:
+            async with self.session.request(method, self.daemon_url + path, **kwargs) as response:
+                return web.json_response(await response.json(content_type=None), status=response.status)
+        except aiohttp.ClientError as e:
+            raise web.HTTPServiceUnavailable(text=f"Inference daemon unavailable: {e}")
+
+    async def submit(self, request):
+        try:
+            body = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="Expected a JSON body.")
+        if not body.get('video'):
+            raise web.HTTPBadRequest(text="Missing 'video'.")
+        return await self._forward('POST', '/jobs', json={'video': body['video'], 'use_cache': body.get('use_cache', True)})
+
+    async def get_job(self, request):
+        params = {'wait': request.query['wait']} if 'wait' in request.query else None
+        return await self._forward('GET', f"/jobs/{request.match_info['job_id']}", params=params)
+
+    @web.middleware
+    async def cors(self, request, handler):
+        """Let the frontend, served from another origin, read responses and their ETags."""
+        if request.method == 'OPTIONS':
+            response = web.Response()
+            response.headers['Access-Control-Allow-Methods'] = 'GET, POST'
+            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, If-None-Match'
+        else:
+            try:
+                response = await handler(request)
+            except web.HTTPException as e:
+                response = e
+                response.headers['Access-Control-Allow-Origin'] = self.allow_origin
+                raise
+        response.headers['Access-Control-Allow-Origin'] = self.allow_origin
+        response.headers['Access-Control-Expose-Headers'] = 'ETag'
+        return response
+
+    def make_app(self):
+        app = web.Application(middlewares=[self.cors] if self.allow_origin else [])
+        app.router.add_get('/videos', self.list_videos)
+        app.router.add_get('/videos/{video}/summary', self.get_summary)
+        app.router.add_get('/videos/{video}/matches', self.get_matches)
+        app.router.add_post('/jobs', self.submit)
+        app.router.add_get('/jobs/{job_id}', self.get_job)
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    config = settings.load()
+    output_paths.configure(**config.get('paths', {}))
+
+    api_config = config.get('results_api', {})
+    daemon_config = config.get('daemon', {})
+    parser = argparse.ArgumentParser(description="Serve detection summaries and visual matches over HTTP.")
+    parser.add_argument('--host', default=api_config.get('host', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=api_config.get('port', 8766))
+    parser.add_argument('--daemon-url', default=f"http://{daemon_config.get('host', '127.0.0.1')}:{daemon_config.get('port', 8765)}")
+    args = parser.parse_args()
+
+    api = ResultsApi(args.daemon_url, allow_origin=api_config.get('allow_origin'))
+    web.run_app(api.make_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+import yaml
+
+# config.yaml next to this file, unless TIKTOK_CONFIG names another one
+CONFIG_PATH = os.environ.get('TIKTOK_CONFIG') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.yaml')
+
+# Options holding file system paths, which are relative to the config file rather than the working directory
+PATH_OPTIONS = [
+    ('paths', 'root'), ('paths', 'videos_dir'), ('cache', 'directory'), ('lens', 'cache_directory'),
+    ('match_index', 'path'), ('near_duplicates', 'path'), ('upload', 'index_path'), ('viewer', 'thumbnail_cache'),
+    ('model', 'weights'), ('model', 'repo'), ('model', 'quantized_weights'), ('instrumentation', 'prometheus_textfile'),
+]
+
+_config = None
+_dotenv_loaded = False
+
+def load(path=None):
+    """Return the parsed config.yaml with its relative paths resolved; the default file is read once."""
+    global _config
+    if path is None and _config is not None:
+        return _config
+
+    config_path = path or CONFIG_PATH
+    with open(config_path, 'r') as file:
+        config = yaml.safe_load(file) or {}
+    base = os.path.dirname(os.path.abspath(config_path))
+    for section, option in PATH_OPTIONS:
+        value = (config.get(section) or {}).get(option)
+        if value:
+            config[section][option] = os.path.normpath(os.path.join(base, os.path.expanduser(value)))
+
+    if path is None:
+        _config = config
+    return config
+
+def api_key(name):
+    """Return an API key from the environment or the .env file; checked when a service is first called."""
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _dotenv_loaded = True
+    value = os.getenv(name)
+    if not value:
+        raise ValueError(f"{name} must be set in the .env file.")
+    return value
@@ -0,0 +1,184 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+from collections import OrderedDict, deque
+from io import BytesIO
+from PIL import Image, ImageTk
+
+# Result of a prefetch dropped before it started
+_DROPPED = object()
+
+class ThumbnailLoader:
+    """Loads thumbnails on a thread pool and hands them to Tk on the main thread.
+
+    Downloaded thumbnails are kept in an on-disk cache and the most recently
+    used memory_items of them in memory, so reselecting a row never downloads
+    again. Workers only touch PIL images; PhotoImages are created on the Tk
+    thread when results are delivered through after().
+
+    Explicit requests are loaded before any prefetch, the latest first. Each
+    prefetch() supersedes the previous one: queued prefetches it no longer
+    lists (rows scrolled out of view) are dropped before they start.
+    """
+
+    def __init__(self, root, cache_dir='./thumbnail_cache', size=(200, 200), max_workers=4,
+                 memory_items=256, timeout=10, poll_interval=30):
+        self.root = root
+        self.cache_dir = cache_dir
+        self.size = size
+        self.memory_items = memory_items
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._session = None
+        self._results = queue.Queue()
+        self._memory = OrderedDict()
+        self._pending = {}
+        self._polling = False
+        # Work queues shared with the workers, guarded by _ready: urls not yet started are in _queued
+        self._ready = threading.Condition()
+        self._requests = deque()
+        self._prefetches = deque()
+        self._queued = set()
+        self._wanted = set()
+        self._closed = False
+        for i in range(max_workers):
+            threading.Thread(target=self._work, name=f'thumbnail_{i}', daemon=True).start()
+
+    def get(self, url):
+        """Return the PhotoImage for url if it is in memory, else None."""
+        image = self._memory.get(url)
+        if image is not None:
+            self._memory.move_to_end(url)
+        return image
+
+    def request(self, url, callback=None):
+        """Call callback(PhotoImage or None) on the Tk thread once url's thumbnail is loaded.
+
+        Calls it immediately if the thumbnail is already in memory. Requests
+        for a url already being loaded share its download; a queued prefetch
+        of it is moved ahead of the other prefetches.
+        """
+        image = self.get(url)
+        if image is not None:
+            if callback is not None:
+                callback(image)
+            return
+        if url in self._pending:
+            if callback is not None:
+                self._pending[url].append(callback)
+            with self._ready:
+                if url in self._queued:
+                    self._requests.append(url)
+                    self._ready.notify()
+            return
+        self._pending[url] = [callback] if callback is not None else []
+        self._enqueue(url, prefetch=False)
+
+    def prefetch(self, urls):
+        """Start loading thumbnails that are likely to be shown soon, in place of those of the previous call."""
+        urls = [url for url in urls if url]
+        with self._ready:
+            self._wanted = set(urls)
+        for url in urls:
+            if url not in self._memory and url not in self._pending:
+                self._pending[url] = []
+                self._enqueue(url, prefetch=True)
+
+    def _enqueue(self, url, prefetch):
+        if self._session is None:
+            # Created by the first request, so importing requests does not delay the window
+            import requests
+            self._session = requests.Session()
+        with self._ready:
+            (self._prefetches if prefetch else self._requests).append(url)
+            self._queued.add(url)
+            self._ready.notify()
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_interval, self._deliver)
+
+    def _work(self):
+        """Worker thread: load queued thumbnails, explicit requests first."""
+        while True:
+            with self._ready:
+                while not self._closed and not self._requests and not self._prefetches:
+                    self._ready.wait()
+                if self._closed:
+                    return
+                if self._requests:
+                    # The latest request is the row the user is looking at now
+                    url = self._requests.pop()
+                    dropped = False
+                else:
+                    url = self._prefetches.popleft()
+                    dropped = url not in self._wanted
+                if url not in self._queued:
+                    # Already started from the other queue
+                    continue
+                self._queued.discard(url)
+            if dropped:
+                self._results.put((url, _DROPPED))
+            else:
+                self._load(url)
+
+    def _cache_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode()).hexdigest() + '.png')
+
+    def _load(self, url):
+        """Worker thread: load one thumbnail from disk or the network and queue it for delivery."""
+        image = None
+        try:
+            path = self._cache_path(url)
+            if os.path.exists(path):
+                image = Image.open(path)
+                image.load()
+            else:
+                response = self._session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+                image = Image.open(BytesIO(response.content))
+                image.thumbnail(self.size)
+                os.makedirs(self.cache_dir, exist_ok=True)
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                image.save(temp_path, format='PNG')
+                os.replace(temp_path, path)
+        except Exception as e:
+            logging.error(f"Error loading thumbnail {url}: {e}")
+            image = None
+        self._results.put((url, image))
+
+    def _deliver(self):
+        """Tk thread: turn loaded thumbnails into PhotoImages and run their callbacks."""
+        while True:
+            try:
+                url, image = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if image is _DROPPED:
+                # Unless it was requested, or scrolled back into view, after the worker dropped it
+                if self._pending.get(url):
+                    self._enqueue(url, prefetch=False)
+                elif url in self._wanted:
+                    self._enqueue(url, prefetch=True)
+                else:
+                    self._pending.pop(url, None)
+                continue
+            photo = None
+            if image is not None:
+                photo = ImageTk.PhotoImage(image)
+                self._memory[url] = photo
+                while len(self._memory) > self.memory_items:
+                    self._memory.popitem(last=False)
+            for callback in self._pending.pop(url, []):
+                callback(photo)
+
+        if self._pending:
+            self.root.after(self.poll_interval, self._deliver)
+        else:
+            self._polling = False
+
+    def close(self):
+        with self._ready:
+            self._closed = True
+            self._ready.notify_all()
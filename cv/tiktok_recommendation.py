@@ -1,46 +1,61 @@
-import torch
 import cv2
 import numpy as np
-import aiohttp
 import asyncio
 import logging
 import sys
-from bs4 import BeautifulSoup
-from PIL import Image
-from io import BytesIO
+import argparse
+import queue
+import threading
+import contextvars
 import os
-from dotenv import load_dotenv
+import json
+import shutil
 from collections import Counter, defaultdict
-from sklearn.cluster import KMeans
-import yaml
-import requests
-from google_lens_search import google_lens_search
+from concurrent.futures import ThreadPoolExecutor
+import settings
 import upload_image
-# Load environment variables from .env file
-load_dotenv()
+import detection_backends
+import output_paths
+import instrumentation
+from color_engine import ColorEngine, nearest_color_names
+from detection_cache import DetectionCache
+from near_duplicates import FingerprintIndex, video_fingerprint
+from video_decoder import FrameDecoder
+from adaptive_sampling import SceneChangeSampler, StabilityMonitor
+from tracker import IoUTracker
+from proximity import nearest_distances, nearest_distances_same_frame, min_distance_by_label
 
-API_KEY = os.getenv('API_KEY')
+# Load configuration; API keys are only required once a service that needs them is called
+config = settings.load()
 
-SEARCH_ENGINE_ID = os.getenv('SEARCH_ENGINE_ID')
+# Where videos are read from and per-video artifacts are written
+output_paths.configure(**config.get('paths', {}))
 
-if not API_KEY or not SEARCH_ENGINE_ID:
-    raise ValueError("API_KEY and SEARCH_ENGINE_ID must be set in the .env file.")
-
-# Load configuration
-with open('config.yaml', 'r') as file:
-    config = yaml.safe_load(file)
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Configure logging; per-frame and per-detection messages are only logged with debug
+logging.basicConfig(level=logging.DEBUG if config.get('logging', {}).get('debug', False) else logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Initialize the YOLOv5 model
 model = None
 
+# Identifies the configured model and backend, e.g. in cache keys
+MODEL_NAME = detection_backends.model_id(config.get('model', {}))
+
+# Process every FRAME_SKIP-th frame of a video
+FRAME_SKIP = config.get('inference', {}).get('frame_skip', 5)
+
 def load_yolo_model():
     global model
     if model is None:
         logging.info("Loading YOLOv5 model...")
-        model = torch.hub.load('ultralytics/yolov5', 'yolov5s', pretrained=True)
+        inference_config = config.get('inference', {})
+        # Only detect what get_main_item uses, so NMS and post-processing skip every other class
+        classes = ['person'] + all_consumer_items if inference_config.get('restrict_classes', True) else None
+        model = detection_backends.load_backend(config.get('model', {}), classes=classes)
+        roi_config = config.get('roi', {})
+        if roi_config.get('enabled', False):
+            model = detection_backends.PersonRoiDetector(model, person_size=roi_config.get('person_image_size', 320),
+                                                         margin=roi_config.get('margin', 0.5))
         logging.info("Model loaded.")
     return model
 
@@ -51,190 +66,461 @@ all_consumer_items = []
 for category in consumer_items.values():
     all_consumer_items.extend(category)
 
-def get_main_item(video_path, model, frame_skip=5):
-    """Get the main item and its color in the video, and return the frame with the main item highlighted."""
-    logging.info(f"Opening video file: {video_path}")
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        logging.error("Could not open video file.")
-        return None
-    
-    person_coordinates = []
-    object_distances = defaultdict(list)
-    color_counts = defaultdict(Counter)
-    frame_count = 0
-    main_item_frame = None
-    main_item_coordinates = None
-    
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
+# For constant-time membership tests of every detection
+consumer_item_names = frozenset(all_consumer_items)
+
+# Vectorized dominant-color detection shared by all frames
+color_engine = ColorEngine(**config.get('color', {}))
+
+def _detection_frames(decoder, sampler):
+    """Yield the decoded frames worth detecting on; all of them without a sampler."""
+    frames = decoder.frames()
+    while True:
+        with instrumentation.stage('decode'):
+            item = next(frames, None)
+        if item is None:
             break
-        
-        frame_count += 1
-        if frame_count % frame_skip != 0:
-            continue  # Skip frames
-        
-        logging.info(f"Processing frame {frame_count}...")
-        
+        instrumentation.count('frames_decoded')
+        if sampler is not None:
+            with instrumentation.stage('sampling'):
+                detect = sampler.should_detect(item[1])
+            if not detect:
+                continue
+        instrumentation.count('frames_detected')
+        yield item
+
+def _decode_worker(decoder, sampler, frame_queue, stop_event):
+    """Decoder thread: push sampled frames into a bounded queue, then a None sentinel."""
+    try:
+        for item in _detection_frames(decoder, sampler):
+            if stop_event.is_set():
+                break
+            frame_queue.put(item)
+    except Exception as e:
+        logging.error(f"Error decoding video: {e}")
+    finally:
+        frame_queue.put(None)
+
+def _iter_batches(frame_queue, batch_size):
+    """Group frames from the decoder queue into lists of at most batch_size."""
+    batch = []
+    while True:
+        item = frame_queue.get()
+        if item is None:
+            break
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _highlight(frame, box, label, copy=True):
+    """Return the frame with the box drawn and labelled."""
+    x1, y1, x2, y2 = box
+    frame = frame.copy() if copy else frame
+    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+    return frame
+
+class DetectionAccumulator:
+    """Collects per-frame detections and reduces them to the main item summary.
+
+    With early_exit_after, `finished` is set once the main item and its color
+    have been the same for that many consecutive frames with detections.
+
+    With a tracker, consumer items are linked into tracks: colors are only
+    sampled a few times per track, and with track_selection the main item is
+    the track with the best combination of dwell time and person proximity,
+    and the summary also carries crops of up to other_items of the best
+    scoring other items, e.g. for visual search.
+    """
+
+    def __init__(self, same_frame=False, early_exit_after=0, tracker=None, track_selection=False,
+                 color_samples=3, proximity_scale=0.25, other_items=0):
+        self.same_frame = same_frame
+        self.finished = False
+        self._stability = StabilityMonitor(early_exit_after) if early_exit_after else None
+        self.tracker = tracker
+        self.track_selection = track_selection and tracker is not None
+        self.color_samples = color_samples
+        self.proximity_scale = proximity_scale
+        self.other_items = other_items
+        self.frame_diagonal = None
+        self.person_coordinates = []
+        self.person_frames = []
+        self.object_distances = defaultdict(list)
+        self.object_frames = defaultdict(list)
+        self.color_counts = defaultdict(Counter)
+        self.main_item_frame = None
+        self.main_item_coordinates = None
+
+    def add(self, frame_count, frame, detections, labels):
+        """Record the detections (xyxy, conf, cls rows) of one frame."""
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        if debug:
+            logging.debug(f"Processing frame {frame_count}...")
+        instrumentation.count('detections', len(detections))
+
+        consumer_detections = []
+        frame_persons = []
+        for *xyxy, conf, cls in detections:
+            class_id = int(cls)
+            class_name = labels[class_id] if class_id < len(labels) else f"unknown_{class_id}"
+            if debug:
+                logging.debug(f"Detected {class_name} with confidence {conf}")
+
+            x1, y1, x2, y2 = map(int, xyxy)
+            object_center_x = (x1 + x2) / 2
+            object_center_y = (y1 + y2) / 2
+
+            if class_name == 'person':
+                self.person_coordinates.append((object_center_x, object_center_y))
+                self.person_frames.append(frame_count)
+                frame_persons.append((object_center_x, object_center_y))
+            elif class_name in consumer_item_names:
+                consumer_detections.append((class_name, (x1, y1, x2, y2), (object_center_x, object_center_y), conf))
+
+        if consumer_detections and self.tracker is not None:
+            self._add_tracked_items(frame_count, frame, consumer_detections, frame_persons)
+        elif consumer_detections:
+            self._add_consumer_items(frame_count, frame, consumer_detections)
+
+        if self._stability is not None and self._stability.update(self.select_main_item()):
+            logging.info(f"Main item stable for {self._stability.stable_updates} detections, stopping at frame {frame_count}.")
+            self.finished = True
+
+    def _add_consumer_items(self, frame_count, frame, consumer_detections):
+        """Color and record the consumer items detected in one frame."""
+        # Detect the colors of every consumer item in the frame in one call
+        with instrumentation.stage('color'):
+            colors = color_engine.dominant_colors([frame[y1:y2, x1:x2] for _, (x1, y1, x2, y2), _, _ in consumer_detections])
+
+        for (class_name, box, center, _), color in zip(consumer_detections, colors):
+            self._record_item(frame_count, frame, class_name, box, center, color)
+
+    def _record_item(self, frame_count, frame, class_name, box, center, color):
+        """Count one colored consumer item and keep the first frame with a consumer item."""
+        self.color_counts[class_name][color] += 1
+        self.object_distances[class_name].append(center)
+        self.object_frames[class_name].append(frame_count)
+
+        # Save the frame with the detected main item
+        if self.main_item_frame is None:
+            self.main_item_frame = _highlight(frame, box, f"{class_name} ({color})")
+            self.main_item_coordinates = box
+
+    def _add_tracked_items(self, frame_count, frame, consumer_detections, frame_persons):
+        """Link the consumer items of one frame to tracks and color only the tracks that need it."""
+        if self.frame_diagonal is None:
+            self.frame_diagonal = float(np.hypot(frame.shape[0], frame.shape[1]))
+
+        tracks = self.tracker.update(frame_count, [(class_name, box) for class_name, box, _, _ in consumer_detections])
+
+        # Detect colors only for tracks still collecting color samples, all in one call
+        needs_color = [i for i, track in enumerate(tracks) if track.needs_color(self.color_samples)]
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in (consumer_detections[i][1] for i in needs_color)]
+        with instrumentation.stage('color'):
+            colors = color_engine.dominant_colors(crops)
+        for i, color in zip(needs_color, colors):
+            tracks[i].colors[color] += 1
+
+        centers = [center for _, _, center, _ in consumer_detections]
+        with instrumentation.stage('distance'):
+            person_distances = nearest_distances(centers, frame_persons)
+
+        for (class_name, box, center, conf), track, person_distance in zip(consumer_detections, tracks, person_distances):
+            track.observe(frame_count, box, person_distance)
+            self._record_item(frame_count, frame, class_name, box, center, track.color or "unknown")
+
+            # Keep the frame where the track was detected most confidently
+            if self.track_selection and conf > track.best_confidence + 0.05:
+                track.best_confidence = conf
+                track.snapshot = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 95])[1]
+                track.snapshot_box = box
+
+    def track_score(self, track):
+        """Dwell time (detections) weighted by closeness to a person; halves at proximity_scale."""
+        scale = self.proximity_scale * (self.frame_diagonal or 1.0)
+        return track.hits / (1.0 + track.proximity() / scale)
+
+    def select_main_track(self):
+        """Return the highest scoring track, or None."""
+        tracks = [track for track in self.tracker.tracks if track.color is not None]
+        if not tracks or not self.person_coordinates:
+            return None
+        return max(tracks, key=self.track_score)
+
+    def other_item_crops(self, main_item):
+        """Crop the best snapshot of the top scoring track of each other class, best first."""
+        crops = {}
+        tracks = [track for track in self.tracker.tracks
+                  if track.class_name != main_item and track.color is not None and track.snapshot is not None]
+        for track in sorted(tracks, key=self.track_score, reverse=True):
+            if len(crops) == self.other_items:
+                break
+            if track.class_name not in crops:
+                x1, y1, x2, y2 = track.snapshot_box
+                crops[track.class_name] = cv2.imdecode(track.snapshot, cv2.IMREAD_COLOR)[y1:y2, x1:x2]
+        return crops
+
+    def min_person_distances(self, same_frame=False):
+        """Return the minimum distance between each object class and the nearest person.
+
+        With same_frame, objects are only matched with persons detected in the same frame.
+        """
+        labels, objects, object_frames = [], [], []
+        for class_name, coords in self.object_distances.items():
+            labels.extend([class_name] * len(coords))
+            objects.extend(coords)
+            object_frames.extend(self.object_frames[class_name])
+
+        with instrumentation.stage('distance'):
+            if same_frame:
+                distances = nearest_distances_same_frame(objects, object_frames, self.person_coordinates, self.person_frames)
+            else:
+                distances = nearest_distances(objects, self.person_coordinates)
+            by_label = min_distance_by_label(labels, distances)
+
+        # Keep detection order so ties resolve to the first class seen
+        return {class_name: by_label[class_name] for class_name in self.object_distances}
+
+    def select_main_item(self):
+        """Return (main item, main color) from the detections so far, or None."""
+        if self.track_selection:
+            track = self.select_main_track()
+            return (track.class_name, track.color) if track else None
+
+        if not self.person_coordinates or not self.object_distances:
+            return None
+
+        # Calculate the minimum distance between each object and the nearest person
+        min_distances = self.min_person_distances(self.same_frame)
+        if self.same_frame and all(np.isinf(d) for d in min_distances.values()):
+            min_distances = self.min_person_distances()
+
+        # Determine the main item by the smallest minimum distance to a person
+        main_item = min(min_distances, key=min_distances.get)
+
+        # Determine the most frequent color for the main item
+        main_color = self.color_counts[main_item].most_common(1)[0][0]
+        return main_item, main_color
+
+    def summary(self):
+        """Return the detection summary, or None if no person/object pair was seen."""
+        selected = self.select_main_item()
+        if selected is None:
+            logging.info("No persons or objects detected in the video.")
+            return None
+        main_item, main_color = selected
+
+        main_item_frame, main_item_coordinates = self.main_item_frame, self.main_item_coordinates
+        if self.track_selection:
+            track = self.select_main_track()
+            logging.info(f"Main item track {track.id}: {track.hits} detections, proximity {track.proximity():.1f}px.")
+            if track.snapshot is not None:
+                snapshot = cv2.imdecode(track.snapshot, cv2.IMREAD_COLOR)
+                main_item_frame = _highlight(snapshot, track.snapshot_box, f"{main_item} ({main_color})", copy=False)
+                main_item_coordinates = track.snapshot_box
+
+        # Create a summary of other detected items
+        other_items_summary = {item: dict(self.color_counts[item]) for item in self.color_counts if item != main_item}
+
+        summary = {
+            "main_item": f"{main_item} ({main_color})",
+            "main_item_colors": dict(self.color_counts[main_item]),
+            "other_items_summary": other_items_summary,
+            "main_item_frame": main_item_frame,
+            "main_item_coordinates": main_item_coordinates
+        }
+        if self.track_selection and self.other_items:
+            summary["other_item_crops"] = self.other_item_crops(main_item)
+        return summary
+
+def _run_sequential(decoder, sampler, model, accumulator):
+    """Decode, detect and post-process one frame at a time on the calling thread."""
+    for frame_count, frame in _detection_frames(decoder, sampler):
         # Object detection
-        results = model(frame)
+        with instrumentation.stage('inference'):
+            results = model(frame)
 
         # Process results if any detected objects
         if len(results.xyxy[0]) > 0:
             labels = results.names if hasattr(results, 'names') else model.names
-            
-            for *xyxy, conf, cls in results.xyxy[0].tolist():
-                class_id = int(cls)
-                class_name = labels[class_id] if class_id < len(labels) else f"unknown_{class_id}"
-                logging.info(f"Detected {class_name} with confidence {conf}")
-                
-                x1, y1, x2, y2 = map(int, xyxy)
-                object_center_x = (x1 + x2) / 2
-                object_center_y = (y1 + y2) / 2
-                
-                if class_name == 'person':
-                    person_coordinates.append((object_center_x, object_center_y))
-                elif class_name in all_consumer_items:
-                    object_img = frame[y1:y2, x1:x2]
-                    color = detect_color(object_img)
-                    item_key = f"{class_name} ({color})"
-                    color_counts[class_name][color] += 1
-                    object_distances[class_name].append((object_center_x, object_center_y))
-                    
-                    # Save the frame with the detected main item
-                    if main_item_frame is None:
-                        main_item_frame = frame.copy()
-                        main_item_coordinates = (x1, y1, x2, y2)
-                        cv2.rectangle(main_item_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                        cv2.putText(main_item_frame, item_key, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-    
-    cap.release()
-    
-    if not person_coordinates or not object_distances:
-        logging.info("No persons or objects detected in the video.")
+            accumulator.add(frame_count, frame, results.xyxy[0].tolist(), labels)
+            if accumulator.finished:
+                break
+
+def _postprocess_batch(batch, results, labels, accumulator):
+    """Feed the detections of one inferred batch into the accumulator, in frame order."""
+    for (frame_count, frame), detections in zip(batch, results.xyxy):
+        if accumulator.finished:
+            break
+        if len(detections) > 0:
+            accumulator.add(frame_count, frame, detections.tolist(), labels)
+
+def _run_pipelined(decoder, sampler, model, accumulator, batch_size, queue_size):
+    """Overlap decoding, batched inference and post-processing.
+
+    A decoder thread fills a bounded queue with sampled frames, the calling
+    thread runs one model call per batch, and a single post-processing worker
+    consumes the previous batch while the next one is being inferred.
+    """
+    frame_queue = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    # The worker threads record into the trace of the calling context
+    decoder_thread = threading.Thread(target=contextvars.copy_context().run,
+                                      args=(_decode_worker, decoder, sampler, frame_queue, stop_event), daemon=True)
+    decoder_thread.start()
+
+    pending = None
+    try:
+        with ThreadPoolExecutor(max_workers=1) as postprocessor:
+            for batch in _iter_batches(frame_queue, batch_size):
+                if accumulator.finished:
+                    break
+
+                # Object detection for the whole batch in a single call
+                with instrumentation.stage('inference'):
+                    results = model([frame for _, frame in batch])
+                labels = results.names if hasattr(results, 'names') else model.names
+
+                # Keep at most one batch in post-processing so memory stays bounded
+                if pending is not None:
+                    pending.result()
+                pending = postprocessor.submit(contextvars.copy_context().run, _postprocess_batch, batch, results,
+                                               labels, accumulator)
+
+            if pending is not None:
+                pending.result()
+    finally:
+        # Unblock and drain the decoder if we stopped early
+        stop_event.set()
+        while decoder_thread.is_alive():
+            try:
+                frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        decoder_thread.join()
+
+def get_main_item(video_path, model, frame_skip=FRAME_SKIP, batch_size=None, pipelined=None):
+    """Get the main item and its color in the video, and return the frame with the main item highlighted.
+
+    With pipelined inference (see the `inference` section of config.yaml) frames
+    are decoded on a background thread and sent to the model in batches.
+    """
+    inference_config = config.get('inference', {})
+    if batch_size is None:
+        batch_size = inference_config.get('batch_size', 1)
+    if pipelined is None:
+        pipelined = inference_config.get('pipelined', False)
+
+    logging.info(f"Opening video file: {video_path}")
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        logging.error("Could not open video file.")
         return None
-    
-    # Calculate the minimum distance between each object and the nearest person
-    min_distances = {}
-    for class_name, coords in object_distances.items():
-        min_distance = float('inf')
-        for obj_x, obj_y in coords:
-            for person_x, person_y in person_coordinates:
-                distance = np.sqrt((obj_x - person_x)**2 + (obj_y - person_y)**2)
-                if distance < min_distance:
-                    min_distance = distance
-        min_distances[class_name] = min_distance
-    
-    # Determine the main item by the smallest minimum distance to a person
-    main_item = min(min_distances, key=min_distances.get)
-    
-    # Determine the most frequent color for the main item
-    main_color = color_counts[main_item].most_common(1)[0][0]
-    
-    # Create a summary of other detected items
-    other_items_summary = {item: dict(color_counts[item]) for item in color_counts if item != main_item}
-    
-    return {
-        "main_item": f"{main_item} ({main_color})",
-        "other_items_summary": other_items_summary,
-        "main_item_frame": main_item_frame,
-        "main_item_coordinates": main_item_coordinates
-    }
+
+    decode_config = config.get('decode', {})
+    batch_size = max(1, batch_size)
+    queue_size = inference_config.get('queue_size', 32)
+    # Frames alive at once: the queue, two batches (inferring and post-processing) and the decoder's
+    buffer_count = queue_size + 2 * batch_size + 2 if pipelined else 1
+    decoder = FrameDecoder(cap, frame_skip, mode=decode_config.get('mode', 'grab'),
+                           scale=decode_config.get('scale', 1.0), buffer_count=buffer_count)
+
+    sampling_config = config.get('sampling', {})
+    sampler = None
+    if sampling_config.get('scene_change', False):
+        sampler = SceneChangeSampler(threshold=sampling_config.get('scene_threshold', 0.03),
+                                     max_gap=sampling_config.get('max_gap', 6))
+
+    tracking_config = config.get('tracking', {})
+    tracker = None
+    if tracking_config.get('enabled', False):
+        tracker = IoUTracker(iou_threshold=tracking_config.get('iou_threshold', 0.3),
+                             centroid_threshold=tracking_config.get('centroid_threshold', 0.5),
+                             max_age=tracking_config.get('max_age', 60))
+
+    accumulator = DetectionAccumulator(same_frame=config.get('proximity', {}).get('same_frame', False),
+                                       early_exit_after=sampling_config.get('early_exit_after', 0),
+                                       tracker=tracker,
+                                       track_selection=tracking_config.get('track_selection', False),
+                                       color_samples=tracking_config.get('color_samples', 3),
+                                       proximity_scale=tracking_config.get('proximity_scale', 0.25),
+                                       other_items=config.get('lens', {}).get('other_items', 0))
+    try:
+        if pipelined:
+            _run_pipelined(decoder, sampler, model, accumulator, batch_size, queue_size)
+        else:
+            _run_sequential(decoder, sampler, model, accumulator)
+    finally:
+        cap.release()
+
+    if sampler is not None:
+        logging.info(f"Ran detection on {sampler.detected} of {sampler.detected + sampler.skipped} sampled frames.")
+    if tracker is not None:
+        logging.info(f"Linked consumer item detections into {len(tracker.tracks)} tracks.")
+    return accumulator.summary()
 
 def get_color_name(rgb_color):
     """Convert RGB color to a color name."""
-    r, g, b = rgb_color
-    color_thresholds = {
-        "red": (200, 50, 50),
-        "green": (50, 200, 50),
-        "blue": (50, 50, 200),
-        "yellow": (200, 200, 50),
-        "magenta": (200, 50, 200),
-        "cyan": (50, 200, 200),
-        "white": (150, 150, 150),
-        "black": (100, 100, 100),
-        "orange": (200, 100, 50),
-        "lime": (100, 200, 50),
-        "violet": (150, 50, 150),
-    }
-
-    color_diffs = {color: np.linalg.norm(np.array(rgb_color) - np.array(threshold)) for color, threshold in color_thresholds.items()}
-    closest_color = min(color_diffs, key=color_diffs.get)
-    
-    return closest_color
+    return nearest_color_names([rgb_color])[0]
 
 def detect_color(image, k=3):
     """Detect the predominant color in an image."""
-    try:
-        # Convert the image from BGR to RGB
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Resize the image to speed up processing while maintaining aspect ratio
-        height, width, _ = image_rgb.shape
-        aspect_ratio = width / height
-        new_height = 50
-        new_width = int(aspect_ratio * new_height)
-        resized_img = cv2.resize(image_rgb, (new_width, new_height), interpolation=cv2.INTER_AREA)
-        
-        # Flatten the image pixels
-        pixels = resized_img.reshape(-1, 3)
-        
-        # Initialize and fit KMeans
-        kmeans = KMeans(n_clusters=k, random_state=42)
-        kmeans.fit(pixels)
-        
-        # Find the most common cluster
-        most_common = Counter(kmeans.labels_).most_common(1)
-        dominant_color = kmeans.cluster_centers_[most_common[0][0]]
-        
-        # Get the color name
-        color_name = get_color_name(dominant_color)
-        
-        return color_name
-    except Exception as e:
-        logging.error(f"Error detecting color: {e}")
-        return "unknown"
+    engine = color_engine if k == color_engine.k else ColorEngine(k=k, levels=color_engine.levels)
+    return engine.dominant_colors([image])[0]
 
-async def fetch(session, url):
-    """Fetch the content from a URL."""
-    try:
-        async with session.get(url) as response:
-            return await response.json()
-    except Exception as e:
-        logging.error(f"Error fetching {url}: {e}")
-        return None
+# Google Custom Search endpoint; overridable so search can run against a local stub
+GOOGLE_SEARCH_URL = config.get('search', {}).get('url', 'https://www.googleapis.com/customsearch/v1')
+
+def get_http_client():
+    """Return a new pooled HTTP client configured by the 'http' section of config.yaml."""
+    import http_client
+    return http_client.client_from_config(config.get('http'))
+
+async def fetch(client, url, **kwargs):
+    """Fetch the JSON content from a URL."""
+    return await client.get_json(url, **kwargs)
+
+async def search_google(keyword, client=None):
+    """Search Google for a product using the detected keyword.
+
+    The product pages are fetched concurrently over one pooled session, so
+    enrichment takes about as long as the slowest page rather than their sum.
+    """
+    if client is None:
+        async with get_http_client() as client:
+            return await search_google(keyword, client)
 
-async def search_google(keyword):
-    """Search Google for a product using the detected keyword."""
     search_query = f'{keyword} buy OR shop OR price OR Amazon OR eBay'
-    search_url = f'https://www.googleapis.com/customsearch/v1?q={search_query}&key={API_KEY}&cx={SEARCH_ENGINE_ID}'
-    
-    async with aiohttp.ClientSession() as session:
-        response_json = await fetch(session, search_url)
-        if response_json:
-            items = response_json.get('items', [])
-            products = [{'title': item['title'], 'link': item['link'], 'image': await extract_image(item['link'])} for item in items]
-            return products
-        return None
+    params = {'q': search_query, 'key': settings.api_key('API_KEY'), 'cx': settings.api_key('SEARCH_ENGINE_ID')}
+    response_json = await fetch(client, GOOGLE_SEARCH_URL, params=params)
+    if response_json:
+        items = response_json.get('items', [])
+        images = await asyncio.gather(*(extract_image(item['link'], client) for item in items))
+        products = [{'title': item['title'], 'link': item['link'], 'image': image} for item, image in zip(items, images)]
+        return products
+    return None
 
-async def extract_image(url):
+async def extract_image(url, client=None):
     """Extract the image URL from a given webpage URL."""
+    if client is None:
+        async with get_http_client() as client:
+            return await extract_image(url, client)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    soup = BeautifulSoup(await response.text(), 'html.parser')
-                    image_tag = soup.find('img')
-                    if image_tag and image_tag.get('src'):
-                        return image_tag['src']
-        return None
+        return await client.first_image(url)
     except Exception as e:
         logging.error(f"Error extracting image from {url}: {e}")
         return None
 
 def save_images(products):
     """Save product images locally."""
+    import requests
+    from io import BytesIO
+    from PIL import Image
+
     if not os.path.exists('product_images'):
         os.makedirs('product_images')
     
@@ -251,6 +537,62 @@ def save_images(products):
             except Exception as e:
                 logging.error(f"Error saving image from {image_url}: {e}")
 
+def save_detection_outputs(detection_summary, video):
+    with instrumentation.stage('image_write'):
+        _save_detection_outputs(detection_summary, video)
+
+def _save_detection_outputs(detection_summary, video):
+    """Save the highlighted main item frame and the cropped main item of a video.
+
+    The crop is JPEG-encoded once (or taken already encoded from a cached
+    summary) and kept in the summary as cropped_main_item_jpeg, so it can be
+    uploaded without reading the file back.
+    """
+    main_item_frame = detection_summary["main_item_frame"]
+    main_item_coordinates = detection_summary["main_item_coordinates"]
+
+    paths = output_paths.get()
+
+    # Save the frame with the main item highlighted
+    if main_item_frame is not None:
+        os.makedirs(paths.main_items_dir, exist_ok=True)
+        frame_path = paths.main_item_frame(video)
+        cv2.imwrite(frame_path, main_item_frame)
+        logging.info(f"Frame with main item saved to {frame_path}")
+
+    # Save the cropped main item
+    if main_item_frame is not None and main_item_coordinates:
+        x1, y1, x2, y2 = main_item_coordinates
+        cropped_main_item = main_item_frame[y1:y2, x1:x2]
+        os.makedirs(paths.cropped_main_items_dir, exist_ok=True)
+        cropped_path = paths.cropped_main_item(video)
+        jpeg = detection_summary.get("cropped_main_item_jpeg") or upload_image.encode_jpeg(cropped_main_item)
+        with open(cropped_path, 'wb') as image_file:
+            image_file.write(jpeg)
+        detection_summary["cropped_main_item_jpeg"] = jpeg
+        logging.info(f"Cropped main item saved to {cropped_path}")
+
+    # Replace the crops of other items left by an earlier run
+    other_items_dir = paths.cropped_other_items_dir(video)
+    if os.path.isdir(other_items_dir):
+        shutil.rmtree(other_items_dir)
+    for item, crop in detection_summary.get("other_item_crops", {}).items():
+        os.makedirs(other_items_dir, exist_ok=True)
+        cv2.imwrite(paths.cropped_other_item(video, item), crop)
+
+    # The JSON part of the summary, for consumers such as the results API
+    summary = {name: detection_summary.get(name) for name in
+               ("main_item", "main_item_colors", "other_items_summary", "main_item_coordinates")}
+    summary["main_item_frame"] = paths.main_item_frame(video) if main_item_frame is not None else None
+    summary["cropped_main_item"] = paths.cropped_main_item(video) if "cropped_main_item_jpeg" in detection_summary else None
+    summary["other_items"] = {item: paths.cropped_other_item(video, item)
+                              for item in detection_summary.get("other_item_crops", {})}
+    os.makedirs(paths.summaries_dir, exist_ok=True)
+    summary_path = paths.summary(video)
+    with open(summary_path + '.tmp', 'w') as json_file:
+        json.dump(summary, json_file, indent=4)
+    os.replace(summary_path + '.tmp', summary_path)
+
 async def process_video(video_path,video):
     """Process the video, identify the main item, and search for the product."""
     model = load_yolo_model()
@@ -258,8 +600,6 @@ async def process_video(video_path,video):
     if detection_summary:
         main_item = detection_summary["main_item"]
         other_items_summary = detection_summary["other_items_summary"]
-        main_item_frame = detection_summary["main_item_frame"]
-        main_item_coordinates = detection_summary["main_item_coordinates"]
 
         logging.info(f"\nMain item detected: {main_item}\n")
         
@@ -269,19 +609,7 @@ async def process_video(video_path,video):
             colors_str = ', '.join([f"{color}: {weight:.2f}" for color, weight in colors.items()])
             logging.info(f"{item}: {colors_str}")
 
-        # Save the frame with the main item highlighted
-        if main_item_frame is not None:
-            frame_path = './main_items/main_item_frame_'+video.split('.')[0]+'.jpg'
-            cv2.imwrite(frame_path, main_item_frame)
-            logging.info(f"Frame with main item saved to {frame_path}")
-        
-        # Save the cropped main item
-        if main_item_coordinates:
-            x1, y1, x2, y2 = main_item_coordinates
-            cropped_main_item = main_item_frame[y1:y2, x1:x2]
-            cropped_path = './cropped_main_items/cropped_main_item_'+video.split('.')[0]+'.jpg'
-            cv2.imwrite(cropped_path, cropped_main_item)
-            logging.info(f"Cropped main item saved to {cropped_path}")
+        save_detection_outputs(detection_summary, video)
         
         # products = await search_google(main_item)
         # if products:
@@ -293,25 +621,198 @@ async def process_video(video_path,video):
         #     logging.info("No products found.")
     else:
         logging.info("No items detected in the video.")
+    return detection_summary
+
+def get_detection_cache():
+    """Return the detection cache configured in config.yaml, or None if it is disabled."""
+    cache_config = config.get('cache', {})
+    if not cache_config.get('enabled', True):
+        return None
+    max_bytes = int(cache_config.get('max_size_mb', 512) * 1024 * 1024)
+    return DetectionCache(cache_config.get('directory', './cache'), max_bytes)
 
+def detection_cache_key(cache, video_path, video_hash=None):
+    """Cache key for a video under the current model, frame skip, consumer items and result-changing settings.
 
-def main(video):
-    video_path = '../videos/' + video  # Replace with your actual path
+    video_hash keys the entry of other video content, e.g. of a near-duplicate, under the same settings.
+    """
+    # Color clustering and the proximity rule change the main item and its colors whatever their values
+    options = {'color': config.get('color', {}), 'proximity': config.get('proximity', {})}
+    sampling_config = config.get('sampling', {})
+    if sampling_config.get('scene_change', False) or sampling_config.get('early_exit_after', 0):
+        options['sampling'] = sampling_config
+    tracking_config = config.get('tracking', {})
+    if tracking_config.get('enabled', False):
+        options['tracking'] = tracking_config
+    other_items = config.get('lens', {}).get('other_items', 0)
+    if other_items and tracking_config.get('enabled', False) and tracking_config.get('track_selection', False):
+        options['other_items'] = other_items
+    decode_scale = config.get('decode', {}).get('scale', 1.0)
+    if decode_scale != 1.0:
+        options['decode_scale'] = decode_scale
+    roi_config = config.get('roi', {})
+    if roi_config.get('enabled', False):
+        options['roi'] = roi_config
+    return cache.key(video_path, MODEL_NAME, FRAME_SKIP, all_consumer_items, options, video_hash=video_hash)
+
+def get_fingerprint_index():
+    """Return the near-duplicate fingerprint index configured in config.yaml, or None if it is disabled."""
+    duplicates_config = config.get('near_duplicates', {})
+    if not duplicates_config.get('enabled', False):
+        return None
+    return FingerprintIndex(duplicates_config.get('path', './fingerprints.db'))
+
+def find_near_duplicate(cache, video_path):
+    """Fingerprint a video and return (fingerprint, cached detection summary of an indexed near-duplicate).
+
+    The duplicate's entry is looked up under the current settings, so it is
+    only reused if it was detected the same way this video would be. Either
+    value is None when near-duplicate detection is disabled or finds nothing.
+    """
+    index = get_fingerprint_index()
+    if index is None:
+        return None, None
+    duplicates_config = config.get('near_duplicates', {})
+    try:
+        with instrumentation.stage('fingerprint'):
+            fingerprint = video_fingerprint(video_path, duplicates_config.get('frames', 8))
+        if fingerprint is None:
+            return None, None
+        with instrumentation.stage('near_duplicate_search'):
+            match = index.search(fingerprint, duplicates_config.get('max_distance', 60),
+                                 exclude=cache.video_hash(video_path))
+    finally:
+        index.close()
+    if match is None:
+        return fingerprint, None
+
+    video_hash, original, distance = match
+    detection_summary = cache.get(detection_cache_key(cache, video_path, video_hash=video_hash))
+    if detection_summary is not None:
+        logging.info(f"Near-duplicate of {original} ({distance} bits apart), reusing its detection results.")
+        instrumentation.count('near_duplicate_hits')
+    return fingerprint, detection_summary
+
+def add_fingerprint(cache, video_path, video, fingerprint):
+    """Index a processed video's fingerprint so later near-duplicates of it reuse its results."""
+    index = get_fingerprint_index()
+    if index is not None:
+        try:
+            index.add(cache.video_hash(video_path), video, fingerprint)
+        finally:
+            index.close()
+
+def detect_main_item(video, use_cache=True, video_path=None):
+    """Detect the main item of a video, reusing cached results, and save its images.
+
+    video names the outputs; video_path defaults to the video in the configured videos directory.
+    Returns the detection summary, or None if the video is missing or has no main item.
+    """
+    video_path = video_path or output_paths.get().video(video)
 
     if not os.path.exists(video_path):
         logging.error("Video file not found.")
-        sys.exit(1)
+        return None
 
-    image_path = './cropped_main_items/cropped_main_item_'+video.split('.')[0]+'.jpg'
-    image_url = None
+    # Keep recording into a trace the caller started for this video
+    if instrumentation.current().name != video:
+        instrumentation.start(video)
+
+    cache = get_detection_cache() if use_cache else None
+    detection_summary = None
+    fingerprint = None
+    if cache is not None:
+        cache_key = detection_cache_key(cache, video_path)
+        detection_summary = cache.get(cache_key)
+        instrumentation.count('detection_cache_hits' if detection_summary is not None else 'detection_cache_misses')
+        # Reposts are re-encoded, cropped or watermarked, so also look for a near-duplicate before detecting
+        if detection_summary is None:
+            fingerprint, detection_summary = find_near_duplicate(cache, video_path)
+            if detection_summary is not None:
+                # Under this video's own key and fingerprint too, so reruns hit the cache without fingerprinting
+                cache.put(cache_key, detection_summary)
+                add_fingerprint(cache, video_path, video, fingerprint)
+        if detection_summary is not None:
+            save_detection_outputs(detection_summary, video)
+
+    if detection_summary is None:
+        detection_summary = asyncio.run(process_video(video_path,video))
+        if detection_summary and cache is not None:
+            cache.put(cache_key, detection_summary)
+            if fingerprint is not None:
+                add_fingerprint(cache, video_path, video, fingerprint)
+    return detection_summary
+
+def other_item_images(video):
+    """Return (item, crop path) of the other item crops saved for a video."""
+    paths = output_paths.get()
+    other_items_dir = paths.cropped_other_items_dir(video)
+    if not os.path.isdir(other_items_dir):
+        return []
+    return [(os.path.splitext(name)[0].replace('_', ' '), os.path.join(other_items_dir, name))
+            for name in sorted(os.listdir(other_items_dir))]
+
+def upload_main_item(video, detection_summary=None):
+    """Upload the cropped main item of a processed video and return its URL.
+
+    Uses the crop encoded in detection_summary when given, else the saved crop file.
+    """
+    jpeg = detection_summary.get("cropped_main_item_jpeg") if detection_summary else None
+    if jpeg is not None:
+        return upload_image.upload_image_bytes(jpeg)
+
+    image_path = output_paths.get().cropped_main_item(video)
     if not os.path.exists(image_path):
-        asyncio.run(process_video(video_path,video))
-    
-    image_url = upload_image.upload_image_to_imgbb(image_path)
+        logging.error("No main item image to upload.")
+        return None
+    return upload_image.upload_image_to_imgbb(image_path)
+
+def write_trace(video):
+    """Write the current trace of a video as configured in the 'instrumentation' section of config.yaml."""
+    instrumentation_config = config.get('instrumentation', {})
+    trace_path = output_paths.get().trace(video) if instrumentation_config.get('traces', True) else None
+    return instrumentation.finish(trace_path, instrumentation_config.get('prometheus_textfile'))
+
+def main(video, use_cache=True, use_daemon=None):
+    daemon_config = config.get('daemon', {})
+    if use_daemon is None:
+        use_daemon = daemon_config.get('enabled', False)
+
+    # Hand the job to a running inference daemon, which keeps the model loaded
+    if use_daemon:
+        import daemon_client
+        daemon_url = f"http://{daemon_config.get('host', '127.0.0.1')}:{daemon_config.get('port', 8765)}"
+        try:
+            result = daemon_client.submit_job(daemon_url, video, use_cache=use_cache)
+            return result.get('image_url')
+        except daemon_client.DaemonUnavailable as e:
+            logging.warning(f"Could not use the inference daemon ({e}), processing locally.")
+        except (RuntimeError, TimeoutError) as e:
+            # The daemon has the job and may still be processing it; doing it here too would load the model and
+            # write the same outputs concurrently
+            logging.error(str(e))
+            return None
+
+    if not os.path.exists(output_paths.get().video(video)):
+        logging.error("Video file not found.")
+        sys.exit(1)
+
+    detection_summary = detect_main_item(video, use_cache)
+    if not detection_summary:
+        return None
+
+    image_url = upload_main_item(video, detection_summary)
     return image_url
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <video file name>")
-    else:
-        main(sys.argv[1])
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Detect the main item in a video and upload its crop.")
+    parser.add_argument('video', help="video file name in ../videos/")
+    parser.add_argument('--no-cache', action='store_true', help="ignore and do not update the detection cache")
+    parser.add_argument('--no-daemon', action='store_true', help="process in this process even if the inference daemon is enabled")
+    parser.add_argument('--debug', action='store_true', help="log every processed frame and detection")
+    args = parser.parse_args()
+    if args.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+    instrumentation.start(args.video)
+    main(args.video, use_cache=not args.no_cache, use_daemon=False if args.no_daemon else None)
+    write_trace(args.video)
@@ -0,0 +1,115 @@
+from collections import Counter
+import numpy as np
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise intersection over union of two (N, 4) and (M, 4) xyxy box arrays."""
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=-1)
+    area_a = (boxes_a[:, 2:] - boxes_a[:, :2]).prod(axis=-1)
+    area_b = (boxes_b[:, 2:] - boxes_b[:, :2]).prod(axis=-1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+class Track:
+    """One object followed across frames."""
+
+    def __init__(self, track_id, class_name, box, frame_count):
+        self.id = track_id
+        self.class_name = class_name
+        self.box = box
+        self.first_frame = frame_count
+        self.last_frame = frame_count
+        self.hits = 0
+        self.colors = Counter()
+        self.person_distances = []
+        self.best_confidence = -1.0
+        self.snapshot = None
+        self.snapshot_box = None
+
+    @property
+    def center(self):
+        x1, y1, x2, y2 = self.box
+        return (x1 + x2) / 2, (y1 + y2) / 2
+
+    @property
+    def color(self):
+        """Most frequent color sampled for the track, or None before the first sample."""
+        return self.colors.most_common(1)[0][0] if self.colors else None
+
+    def needs_color(self, max_samples):
+        """Sample colors on the 1st, 2nd, 4th, 8th... observation, up to max_samples times."""
+        observation = self.hits + 1
+        return sum(self.colors.values()) < max_samples and (observation & (observation - 1)) == 0
+
+    def observe(self, frame_count, box, person_distance):
+        self.box = box
+        self.last_frame = frame_count
+        self.hits += 1
+        self.person_distances.append(person_distance)
+
+    def proximity(self):
+        """Median distance to the nearest person over the observations that had one, else inf."""
+        distances = [d for d in self.person_distances if np.isfinite(d)]
+        return float(np.median(distances)) if distances else float('inf')
+
+class IoUTracker:
+    """Greedy IoU tracker with a centroid fallback, matching detections of the same class only.
+
+    A detection continues a track when their boxes overlap by at least
+    iou_threshold, or failing that when its center lies within
+    centroid_threshold box diagonals of the track's center. Tracks not seen
+    for more than max_age frames are retired.
+    """
+
+    def __init__(self, iou_threshold=0.3, centroid_threshold=0.5, max_age=60):
+        self.iou_threshold = iou_threshold
+        self.centroid_threshold = centroid_threshold
+        self.max_age = max_age
+        self.tracks = []
+        self._active = []
+        self._next_id = 1
+
+    def _match_scores(self, tracks, boxes):
+        """Score every track/detection pair; IoU matches outrank centroid-only matches."""
+        track_boxes = np.array([track.box for track in tracks], dtype=np.float64)
+        boxes = np.asarray(boxes, dtype=np.float64)
+        scores = iou_matrix(track_boxes, boxes)
+
+        track_centers = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        diagonals = np.hypot(*(track_boxes[:, 2:] - track_boxes[:, :2]).T)
+        offsets = np.hypot(*(track_centers[:, None, :] - centers[None, :, :]).transpose(2, 0, 1))
+        relative_offsets = offsets / np.maximum(diagonals[:, None], 1e-9)
+
+        # Centroid-only matches score below any IoU match
+        centroid_scores = np.where(relative_offsets < self.centroid_threshold, -relative_offsets, -np.inf)
+        return np.where(scores >= self.iou_threshold, scores, centroid_scores)
+
+    def update(self, frame_count, detections):
+        """Assign (class_name, box) detections of one frame to tracks; return the track of each."""
+        self._active = [track for track in self._active if frame_count - track.last_frame <= self.max_age]
+        assigned = [None] * len(detections)
+
+        for class_name in {class_name for class_name, _ in detections}:
+            indices = [i for i, (name, _) in enumerate(detections) if name == class_name]
+            candidates = [track for track in self._active if track.class_name == class_name]
+            if candidates:
+                scores = self._match_scores(candidates, [detections[i][1] for i in indices])
+                # Greedily take the best remaining pair until no valid pair is left
+                while np.isfinite(scores).any():
+                    t, d = np.unravel_index(np.argmax(scores), scores.shape)
+                    assigned[indices[d]] = candidates[t]
+                    scores[t, :] = -np.inf
+                    scores[:, d] = -np.inf
+
+            for i in indices:
+                if assigned[i] is None:
+                    track = Track(self._next_id, class_name, detections[i][1], frame_count)
+                    self._next_id += 1
+                    self.tracks.append(track)
+                    self._active.append(track)
+                    assigned[i] = track
+        return assigned
@@ -1,33 +1,99 @@
 import os
-import base64
-import requests
+import json
+import hashlib
+import threading
 import sys
-from dotenv import load_dotenv
+import cv2
+import settings
+import instrumentation
 
+UPLOAD_URL = "https://api.imgbb.com/1/upload"
 
-load_dotenv()
+# Maps the SHA-256 of every uploaded image to its URL; config.yaml's upload.index_path, else next to config.yaml
+INDEX_PATH = os.path.join(os.path.dirname(settings.CONFIG_PATH), 'upload_index.json')
 
-IMG_API_KEY = os.getenv('IMG_API_KEY')
+# One pooled session, so repeated uploads reuse the connection; created by the first upload
+_session = None
 
-if not IMG_API_KEY:
-    raise ValueError("IMG_API_KEY must be set in the .env file.")
+def get_session():
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
 
-def upload_image_to_imgbb(image_path):
-    url = "https://api.imgbb.com/1/upload"
-    with open(image_path, 'rb') as image_file:
-        encoded_image = base64.b64encode(image_file.read()).decode('utf-8')
-        payload = {
-            'key': IMG_API_KEY,
-            'image': encoded_image
-        }
-        response = requests.post(url, data=payload)
-    
+class UploadIndex:
+    """Persistent content hash -> URL map of uploaded images."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._urls = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as index_file:
+                return json.load(index_file)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, digest):
+        return self._urls.get(digest)
+
+    def put(self, digest, url):
+        with self._lock:
+            # Merge with entries written meanwhile by other processes
+            self._urls = {**self._load(), **self._urls, digest: url}
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w') as index_file:
+                json.dump(self._urls, index_file)
+            os.replace(temp_path, self.path)
+
+_index = None
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = UploadIndex((settings.load().get('upload') or {}).get('index_path') or INDEX_PATH)
+    return _index
+
+def encode_jpeg(image, quality=95):
+    """JPEG-encode a BGR image array into bytes."""
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode image as JPEG")
+    return buffer.tobytes()
+
+def upload_image_bytes(data, name='image.jpg'):
+    """Upload encoded image bytes and return their URL; identical images are only uploaded once."""
+    digest = hashlib.sha256(data).hexdigest()
+    index = get_index()
+    url = index.get(digest)
+    if url is not None:
+        instrumentation.count('upload_dedup_hits')
+        return url
+
+    # Sent as a binary multipart part rather than a base64 form field
+    api_key = settings.api_key('IMG_API_KEY')
+    with instrumentation.stage('upload'):
+        response = get_session().post(UPLOAD_URL, data={'key': api_key},
+                                      files={'image': (name, data, 'image/jpeg')}, timeout=60)
     if response.status_code == 200:
-        return response.json()['data']['url']
+        url = response.json()['data']['url']
+        index.put(digest, url)
+        return url
     else:
         print("Failed to upload image", response.text)
         return None
 
+def upload_image(image, quality=95):
+    """JPEG-encode an in-memory BGR image array and upload it."""
+    return upload_image_bytes(encode_jpeg(image, quality))
+
+def upload_image_to_imgbb(image_path):
+    with open(image_path, 'rb') as image_file:
+        return upload_image_bytes(image_file.read(), os.path.basename(image_path))
+
 if __name__ == "__main__":
     if len(sys.argv) != 2:
         print("Usage: python script.py <filepath>")
@@ -0,0 +1,103 @@
+import logging
+import cv2
+import numpy as np
+
+DECODE_MODES = ('grab', 'seek')
+
+class FrameDecoder:
+    """Yields every frame_skip-th frame of an open cv2.VideoCapture into reusable buffers.
+
+    Modes:
+        grab  grab skipped frames without retrieving/converting them
+        seek  jump straight to each sampled frame; only pays off for sparse sampling
+              since every seek decodes forward from the previous keyframe
+
+    Frames are written into a ring of buffer_count preallocated arrays, so a
+    yielded frame is overwritten buffer_count frames later. Callers that keep
+    frames longer than that must copy them.
+    """
+
+    def __init__(self, cap, frame_skip=5, mode='grab', scale=1.0, buffer_count=1):
+        if mode not in DECODE_MODES:
+            raise ValueError(f"Unknown decode mode '{mode}', expected one of {', '.join(DECODE_MODES)}.")
+        self.cap = cap
+        self.frame_skip = max(1, frame_skip)
+        self.mode = mode
+        self.scale = scale
+        self.buffer_count = max(1, buffer_count)
+
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.source_shape = (height, width, 3)
+        self.output_shape = self.source_shape
+        if scale != 1.0:
+            self.output_shape = (max(1, round(height * scale)), max(1, round(width * scale)), 3)
+
+        self._buffers = [np.empty(self.output_shape, dtype=np.uint8) for _ in range(self.buffer_count)]
+        # Full-resolution scratch frame, only needed when downscaling
+        self._source_buffer = np.empty(self.source_shape, dtype=np.uint8) if scale != 1.0 else None
+        self._next_buffer = 0
+
+    def _retrieve(self):
+        """Retrieve the grabbed frame into the next ring buffer; return it or None."""
+        buffer = self._buffers[self._next_buffer]
+        target = self._source_buffer if self._source_buffer is not None else buffer
+        ret, frame = self.cap.retrieve(target)
+        if not ret:
+            return None
+
+        if frame.shape != target.shape:
+            # Some streams report a different size than their frames; adapt the buffers once
+            logging.warning(f"Decoded frame shape {frame.shape} differs from the reported {target.shape}.")
+            self._resize_buffers(frame.shape)
+            return self._retrieve()
+
+        if self._source_buffer is not None:
+            cv2.resize(frame, (self.output_shape[1], self.output_shape[0]), dst=buffer, interpolation=cv2.INTER_AREA)
+
+        self._next_buffer = (self._next_buffer + 1) % self.buffer_count
+        return buffer
+
+    def _resize_buffers(self, source_shape):
+        self.source_shape = source_shape
+        if self._source_buffer is None:
+            self.output_shape = source_shape
+        else:
+            self._source_buffer = np.empty(source_shape, dtype=np.uint8)
+            self.output_shape = (max(1, round(source_shape[0] * self.scale)), max(1, round(source_shape[1] * self.scale)), 3)
+        self._buffers = [np.empty(self.output_shape, dtype=np.uint8) for _ in range(self.buffer_count)]
+
+    def _frames_grab(self):
+        frame_count = 0
+        while self.cap.isOpened():
+            if not self.cap.grab():
+                break
+            frame_count += 1
+            if frame_count % self.frame_skip != 0:
+                continue  # Skip frames without retrieving them
+
+            frame = self._retrieve()
+            if frame is None:
+                break
+            yield frame_count, frame
+
+    def _frames_seek(self):
+        total = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        for frame_count in range(self.frame_skip, total + 1, self.frame_skip):
+            # Frame numbers are 1-based to match grab mode
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count - 1)
+            if not self.cap.grab():
+                break
+            frame = self._retrieve()
+            if frame is None:
+                break
+            yield frame_count, frame
+
+    def frames(self):
+        """Yield (frame_number, frame) for every sampled frame."""
+        if self.mode == 'seek':
+            return self._frames_seek()
+        return self._frames_grab()
+
+    def __iter__(self):
+        return self.frames()
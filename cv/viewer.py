@@ -1,31 +1,102 @@
-import json
+import os
 import tkinter as tk
 from tkinter import ttk
-from PIL import Image, ImageTk
-import requests
-from io import BytesIO
+from itertools import islice
 import webbrowser
-import sys
+import argparse
+import numpy as np
+import settings
+from thumbnail_loader import ThumbnailLoader
+from match_table import MatchTable, iter_json_array
+from match_index import MatchIndex
 
-def load_json(filepath):
-    with open(filepath, 'r') as file:
-        return json.load(file)
+# Rows around the visible ones and the selection whose thumbnails are prefetched
+PREFETCH_MARGIN = 10
 
-def fetch_image(url):
-    response = requests.get(url)
-    img_data = response.content
-    img = Image.open(BytesIO(img_data))
-    img.thumbnail((200, 200))
-    return ImageTk.PhotoImage(img)
+# Rows inserted into a tree at a time, as the user scrolls down
+PAGE_SIZE = 200
+
+# Matches parsed per idle callback while a file is loading
+LOAD_BATCH = 2000
+
+def shopping_values(item):
+    price = item.get('price', {}).get('value', 'N/A')
+    in_stock = 'Yes' if item.get('in_stock', False) else 'No'
+    return (item['title'], item['source'], price, in_stock)
+
+def other_values(item):
+    return (item['title'], item['source'])
+
+class PagedTree:
+    """Shows the rows of a MatchTable query in a Treeview, one page at a time.
+
+    Tree items are identified by their table row, so the selected match is
+    found in O(1) however the view is sorted or filtered.
+    """
+
+    def __init__(self, tree, table, values, **filters):
+        self.tree = tree
+        self.table = table
+        self.values = values
+        self.filters = filters
+        self.sort = None
+        self.descending = False
+        self.rows = np.empty(0, dtype=np.int64)
+        self.shown = 0
+
+    def item(self, iid):
+        return self.table.items[int(iid)]
+
+    def refresh(self, reset=False):
+        """Re-run the query; without reset, already shown rows are kept when only new matches were added."""
+        self.rows = self.table.query(sort=self.sort, descending=self.descending, **self.filters)
+        if reset or self.sort is not None:
+            self.tree.delete(*self.tree.get_children())
+            self.shown = 0
+        if self.shown < PAGE_SIZE:
+            self.show_more()
+
+    def show_more(self):
+        stop = min(len(self.rows), self.shown + PAGE_SIZE)
+        for row in self.rows[self.shown:stop]:
+            self.tree.insert('', tk.END, iid=str(row), values=self.values(self.table.items[row]))
+        self.shown = stop
+
+    def on_scroll(self, first, last):
+        # Insert the next page when the view nears the end of the shown rows
+        if float(last) > 0.9 and self.shown < len(self.rows):
+            self.show_more()
+
+    def sort_by(self, column):
+        """Sort by column, toggling the direction when it is already the sort column."""
+        self.descending = not self.descending if self.sort == column else False
+        self.sort = column
+        self.refresh(reset=True)
+
+    def items(self, start, stop):
+        return [self.table.items[row] for row in self.rows[max(0, start):min(stop, self.shown)]]
+
+    def visible_items(self, margin=0):
+        """Return the matches in view, widened by margin rows on each side."""
+        first, last = self.tree.yview()
+        return self.items(int(first * self.shown) - margin, int(last * self.shown) + 1 + margin)
+
+def prefetch_thumbnails(loader, views, items=()):
+    """Prefetch the thumbnails of the rows in view in every tree, and of items; those of other rows are dropped."""
+    visible = [item for view in views for item in view.visible_items(PREFETCH_MARGIN)]
+    loader.prefetch(item.get('thumbnail') for item in list(items) + visible)
 
 def open_url(url):
     webbrowser.open_new(url)
 
-def show_details(event, tree, data, details_frame):
-    selected_item = tree.selection()[0]
-    item_data = tree.item(selected_item, 'values')
-    item = next((item for item in data if item['title'] == item_data[0]), None)
-    
+def show_details(event, view, views, details_frame, loader):
+    selection = view.tree.selection()
+    if not selection:
+        return
+    selected_item = selection[0]
+    item = view.item(selected_item)
+    item_data = view.values(item)
+
     for widget in details_frame.winfo_children():
         widget.destroy()
     
@@ -40,15 +111,32 @@ def show_details(event, tree, data, details_frame):
     url_label.grid(row=4, column=0, pady=5)
     url_label.bind("<Button-1>", lambda e: open_url(item['link']))
 
-    img = fetch_image(item['thumbnail'])
-    img_label = tk.Label(details_frame, image=img)
-    img_label.image = img
+    # Render the details now and fill the thumbnail in when it has loaded
+    img_label = tk.Label(details_frame, text="Loading image...", font=("Helvetica", 10, "italic"))
     img_label.grid(row=5, column=0, pady=10)
 
-def main(filepath):
-    data = load_json(filepath)
-    shopping_data = [item for item in data if 'price' in item]
-    other_data = [item for item in data if 'price' not in item]
+    def set_image(img):
+        if not img_label.winfo_exists():
+            return
+        if img is None:
+            img_label.config(text="Image unavailable")
+        else:
+            img_label.config(image=img, text="")
+            img_label.image = img
+
+    if item.get('thumbnail'):
+        loader.request(item['thumbnail'], set_image)
+    else:
+        set_image(None)
+
+    index = view.tree.index(selected_item)
+    prefetch_thumbnails(loader, views, view.items(index - PREFETCH_MARGIN, index + PREFETCH_MARGIN + 1))
+
+def main(filepath=None, index_path=None, **filters):
+    """Show the matches of a visual_matches JSON file, or those of the match index passing filters."""
+    table = MatchTable()
+    index = MatchIndex(index_path) if index_path else None
+    matches = index.iter_query(**filters) if index else iter_json_array(filepath)
 
     root = tk.Tk()
     root.title("JSON Data Viewer")
@@ -59,56 +147,111 @@ def main(filepath):
 
     tk.Label(root, text="Product Listings", font=("Helvetica", 20, "bold"), bg="#f8f8f8", pady=10).pack(fill=tk.X)
 
+    # Filters
+    filter_frame = ttk.Frame(root)
+    filter_frame.pack(fill=tk.X, padx=10)
+    source_var = tk.StringVar(value="All sources")
+    max_price_var = tk.StringVar()
+    in_stock_var = tk.BooleanVar()
+    ttk.Label(filter_frame, text="Source:").pack(side=tk.LEFT)
+    source_box = ttk.Combobox(filter_frame, textvariable=source_var, values=["All sources"], state="readonly", width=25)
+    source_box.pack(side=tk.LEFT, padx=5)
+    ttk.Label(filter_frame, text="Max price:").pack(side=tk.LEFT)
+    ttk.Entry(filter_frame, textvariable=max_price_var, width=10).pack(side=tk.LEFT, padx=5)
+    ttk.Checkbutton(filter_frame, text="In stock only", variable=in_stock_var).pack(side=tk.LEFT, padx=5)
+    status_label = ttk.Label(filter_frame, text="Loading...")
+    status_label.pack(side=tk.RIGHT)
+
     tree_frame = ttk.Frame(root)
     tree_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
 
     scrollbar = ttk.Scrollbar(tree_frame)
     scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
-    shopping_tree = ttk.Treeview(tree_frame, columns=('Title', 'Source', 'Price', 'In Stock'), show='headings', yscrollcommand=scrollbar.set)
-    other_tree = ttk.Treeview(tree_frame, columns=('Title', 'Source'), show='headings', yscrollcommand=scrollbar.set)
+    shopping_tree = ttk.Treeview(tree_frame, columns=('Title', 'Source', 'Price', 'In Stock'), show='headings')
+    other_tree = ttk.Treeview(tree_frame, columns=('Title', 'Source'), show='headings')
+    shopping_view = PagedTree(shopping_tree, table, shopping_values, has_price=True)
+    other_view = PagedTree(other_tree, table, other_values, has_price=False)
+    views = (shopping_view, other_view)
+    viewer_config = settings.load().get('viewer') or {}
+    thumbnail_cache = viewer_config.get('thumbnail_cache') or os.path.join(os.path.dirname(settings.CONFIG_PATH),
+                                                                           'thumbnail_cache')
+    loader = ThumbnailLoader(root, cache_dir=thumbnail_cache)
+
+    def on_scroll(view, first, last):
+        scrollbar.set(first, last)
+        view.on_scroll(first, last)
+        # Prefetch the thumbnails of the rows scrolled into view
+        prefetch_thumbnails(loader, views)
+
+    shopping_tree.configure(yscrollcommand=lambda *args: on_scroll(shopping_view, *args))
+    other_tree.configure(yscrollcommand=lambda *args: on_scroll(other_view, *args))
     scrollbar.config(command=lambda *args: (shopping_tree.yview(*args), other_tree.yview(*args)))
-    
-    for tree in [shopping_tree, other_tree]:
-        tree.heading('Title', text='Title')
-        tree.heading('Source', text='Source')
-        tree.column('Title', anchor=tk.W, width=350)
-        tree.column('Source', anchor=tk.CENTER, width=150)
-        tree.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
-
-    shopping_tree.heading('Price', text='Price')
-    shopping_tree.heading('In Stock', text='In Stock')
+
+    columns = {'Title': 'title', 'Source': 'source', 'Price': 'price', 'In Stock': 'in_stock'}
+    for view in views:
+        for heading in view.tree['columns']:
+            view.tree.heading(heading, text=heading, command=lambda view=view, heading=heading: view.sort_by(columns[heading]))
+        view.tree.column('Title', anchor=tk.W, width=350)
+        view.tree.column('Source', anchor=tk.CENTER, width=150)
+        view.tree.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
+
     shopping_tree.column('Price', anchor=tk.CENTER, width=100)
     shopping_tree.column('In Stock', anchor=tk.CENTER, width=100)
 
-    for item in shopping_data:
-        price = item.get('price', {}).get('value', 'N/A')
-        in_stock = 'Yes' if item.get('in_stock', False) else 'No'
-        shopping_tree.insert('', tk.END, values=(
-            item['title'],
-            item['source'],
-            price,
-            in_stock
-        ))
-
-    for item in other_data:
-        other_tree.insert('', tk.END, values=(
-            item['title'],
-            item['source']
-        ))
+    def apply_filters(*args):
+        source = source_var.get() if source_var.get() != "All sources" else None
+        try:
+            max_price = float(max_price_var.get()) if max_price_var.get().strip() else None
+        except ValueError:
+            max_price = None
+        shopping_view.filters.update(source=source, max_price=max_price, in_stock=True if in_stock_var.get() else None)
+        other_view.filters.update(source=source)
+        for view in views:
+            view.refresh(reset=True)
+
+    ttk.Button(filter_frame, text="Apply", command=apply_filters).pack(side=tk.LEFT, padx=5)
+    source_box.bind('<<ComboboxSelected>>', apply_filters)
+
+    def load_more(count):
+        # Parse the file a batch at a time so the window stays responsive
+        batch = list(islice(matches, count))
+        table.extend(batch)
+        for view in views:
+            view.refresh()
+        if len(batch) == count:
+            status_label.config(text=f"Loading... {len(table)} matches")
+            root.after_idle(load_more, LOAD_BATCH)
+        else:
+            status_label.config(text=f"{len(table)} matches")
+            source_box.config(values=["All sources"] + table.sources())
+
+    # The first page is shown as soon as it is parsed
+    load_more(PAGE_SIZE)
 
     details_frame = ttk.Frame(root, padding="10 10 10 10")
     details_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
 
-    shopping_tree.bind('<<TreeviewSelect>>', lambda event: show_details(event, shopping_tree, shopping_data, details_frame))
-    other_tree.bind('<<TreeviewSelect>>', lambda event: show_details(event, other_tree, other_data, details_frame))
+    shopping_tree.bind('<<TreeviewSelect>>', lambda event: show_details(event, shopping_view, views, details_frame, loader))
+    other_tree.bind('<<TreeviewSelect>>', lambda event: show_details(event, other_view, views, details_frame, loader))
 
     tk.Label(root, text="End of Listings", font=("Helvetica", 12, "italic"), bg="#f8f8f8", pady=10).pack(fill=tk.X)
 
     root.mainloop()
+    loader.close()
+    if index is not None:
+        index.close()
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <filepath>")
+    parser = argparse.ArgumentParser(description="Browse visual matches.")
+    parser.add_argument('filepath', nargs='?', help="visual_matches JSON file")
+    parser.add_argument('--db', help="query this match index instead of reading a file")
+    parser.add_argument('--video', help="with --db, only this video's matches")
+    parser.add_argument('--search', help="with --db, only matches with these words in the title")
+    args = parser.parse_args()
+    if not args.filepath and not args.db:
+        parser.error("a file or --db is required")
+    if args.db:
+        main(index_path=args.db, video=args.video, text=args.search)
     else:
-        main(sys.argv[1])
+        main(args.filepath)
@@ -0,0 +1,25 @@
+"""Shared fixtures: the cv/ modules and the local service stubs of benchmarks/stubs.py.
+
+Run from the repository root with: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[:0] = [os.path.join(ROOT, 'cv'), os.path.join(ROOT, 'benchmarks')]
+
+from stubs import StubServices
+
+@pytest.fixture
+def services():
+    """Local stand-ins for the HTTP services, answering without added latency."""
+    with StubServices(latency=0.0) as services:
+        yield services
+
+@pytest.fixture
+def api_keys(monkeypatch):
+    """Placeholder API keys; the stub services ignore them."""
+    for name in ('API_KEY', 'SEARCH_ENGINE_ID', 'SERPAPI_API_KEY', 'IMG_API_KEY'):
+        monkeypatch.setenv(name, 'test')
@@ -0,0 +1,44 @@
+import json
+import textwrap
+
+import batch_process
+
+# Stands in for the pipeline in the spawned workers: a video named crash* kills its worker
+FAKE_PIPELINE = textwrap.dedent("""
+    import os
+    config = {'paths': {}, 'model': {}}
+
+    def load_yolo_model():
+        pass
+
+    def detect_main_item(label, use_cache=True, video_path=None):
+        if label.startswith('crash'):
+            os._exit(1)
+        return {'main_item': 'cup', 'other_items_summary': {}, 'main_item_coordinates': [0, 0, 1, 1]}
+
+    def write_trace(label):
+        return {'stages': {}}
+""")
+
+def test_a_crashing_video_does_not_fail_the_rest_of_the_batch(tmp_path, monkeypatch):
+    fake_modules = tmp_path / 'fake_modules'
+    fake_modules.mkdir()
+    (fake_modules / 'tiktok_recommendation.py').write_text(FAKE_PIPELINE)
+    # Spawned workers start with the parent's sys.path, so they import the fake pipeline
+    monkeypatch.syspath_prepend(str(fake_modules))
+
+    videos_dir = tmp_path / 'videos'
+    videos_dir.mkdir()
+    for name in ('a', 'b', 'c', 'crash', 'd', 'e', 'f'):
+        (videos_dir / f'{name}.mp4').touch()
+    output_root = tmp_path / 'output'
+
+    failures = batch_process.run_batch(batch_process.list_videos(str(videos_dir)), str(videos_dir),
+                                       str(output_root), workers=3, max_attempts=2)
+
+    records = [json.loads(line) for line in (output_root / batch_process.MANIFEST_NAME).read_text().splitlines()]
+    statuses = {record['video']: record['status'] for record in records}
+    assert failures == 1
+    assert len(records) == 7
+    assert statuses.pop('crash.mp4') == 'error'
+    assert set(statuses.values()) == {'ok'}
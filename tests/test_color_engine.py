@@ -0,0 +1,53 @@
+import glob
+import os
+from collections import Counter
+
+import cv2
+import numpy as np
+import pytest
+
+from color_engine import COLOR_PALETTE, ColorEngine, nearest_color_names
+
+CROPS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'cv', 'cropped_main_items', '*.jpg')))
+
+def kmeans_color_name(image, k=3):
+    """The per-crop scikit-learn KMeans the engine replaced, as reference."""
+    from sklearn.cluster import KMeans
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    height, width, _ = image_rgb.shape
+    pixels = cv2.resize(image_rgb, (int(width / height * 50), 50), interpolation=cv2.INTER_AREA).reshape(-1, 3)
+    kmeans = KMeans(n_clusters=k, random_state=42).fit(pixels)
+    dominant = kmeans.cluster_centers_[Counter(kmeans.labels_).most_common(1)[0][0]]
+    distances = {name: np.linalg.norm(dominant - np.array(rgb)) for name, rgb in COLOR_PALETTE.items()}
+    return min(distances, key=distances.get)
+
+@pytest.mark.skipif(not CROPS, reason="no sample crops")
+def test_same_names_as_kmeans_on_the_sample_crops():
+    pytest.importorskip('sklearn')
+    crops = [cv2.imread(path) for path in CROPS]
+    assert ColorEngine().dominant_colors(crops) == [kmeans_color_name(crop) for crop in crops]
+
+@pytest.mark.skipif(not CROPS, reason="no sample crops")
+def test_batch_gives_the_same_names_as_one_crop_at_a_time():
+    crops = [cv2.imread(path) for path in CROPS]
+    engine = ColorEngine()
+    assert engine.dominant_colors(crops) == [engine.dominant_colors([crop])[0] for crop in crops]
+
+def test_names_a_uniform_crop_after_its_palette_color():
+    crops = [np.full((40, 30, 3), rgb[::-1], dtype=np.uint8) for rgb in COLOR_PALETTE.values()]
+    assert ColorEngine().dominant_colors(crops) == list(COLOR_PALETTE)
+
+def test_dominant_color_is_the_largest_cluster():
+    crop = np.zeros((60, 60, 3), dtype=np.uint8)
+    crop[:, :40] = (50, 50, 200)  # BGR red on two thirds
+    crop[:, 40:] = (200, 50, 50)
+    assert ColorEngine().dominant_colors([crop]) == ['red']
+
+def test_empty_crops_are_unknown():
+    empty = np.zeros((0, 10, 3), dtype=np.uint8)
+    red = np.full((10, 10, 3), (50, 50, 200), dtype=np.uint8)
+    assert ColorEngine().dominant_colors([empty, None, red]) == ['unknown', 'unknown', 'red']
+    assert ColorEngine().dominant_colors([]) == []
+
+def test_nearest_color_names():
+    assert nearest_color_names([[210, 40, 40], [0, 0, 0], [160, 160, 160]]) == ['red', 'black', 'white']
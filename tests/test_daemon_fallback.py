@@ -0,0 +1,32 @@
+import pytest
+
+import daemon_client
+import tiktok_recommendation
+
+@pytest.fixture
+def local_runs(monkeypatch):
+    """Videos main() processed in this process instead of the daemon."""
+    runs = []
+    monkeypatch.setattr(tiktok_recommendation, 'detect_main_item', lambda video, use_cache: runs.append(video))
+    monkeypatch.setattr(tiktok_recommendation.os.path, 'exists', lambda path: True)
+    return runs
+
+def daemon_raising(monkeypatch, error):
+    def submit_job(*args, **kwargs):
+        raise error
+    monkeypatch.setattr(daemon_client, 'submit_job', submit_job)
+
+def test_falls_back_locally_when_the_daemon_does_not_take_the_job(monkeypatch, local_runs):
+    daemon_raising(monkeypatch, daemon_client.DaemonUnavailable("Connection refused"))
+    tiktok_recommendation.main('video1.mp4', use_daemon=True)
+    assert local_runs == ['video1.mp4']
+
+@pytest.mark.parametrize('error', [
+    daemon_client.JobLost("Lost track of job x"),
+    TimeoutError("Job x did not finish within 600 seconds"),
+    RuntimeError("Job x failed: boom"),
+])
+def test_does_not_process_again_a_job_the_daemon_accepted(monkeypatch, local_runs, error):
+    daemon_raising(monkeypatch, error)
+    assert tiktok_recommendation.main('video1.mp4', use_daemon=True) is None
+    assert local_runs == []
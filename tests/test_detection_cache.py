@@ -0,0 +1,97 @@
+import copy
+import os
+
+import numpy as np
+import pytest
+
+import detection_cache
+from detection_cache import DetectionCache
+
+def summary(item='cup'):
+    return {'main_item': item, 'other_items_summary': {}, 'main_item_coordinates': (1, 2, 3, 4),
+            'main_item_frame': np.zeros((8, 8, 3), dtype=np.uint8), 'cropped_main_item_jpeg': b'x' * 1000}
+
+@pytest.fixture(autouse=True)
+def fresh_size_estimates(monkeypatch):
+    monkeypatch.setattr(DetectionCache, '_sizes', {})
+
+def test_round_trip(tmp_path):
+    cache = DetectionCache(str(tmp_path))
+    cache.put('ab' * 32, summary())
+    cached = cache.get('ab' * 32)
+    assert cached['main_item'] == 'cup'
+    assert cached['main_item_coordinates'] == (1, 2, 3, 4)
+    assert cached['cropped_main_item_jpeg'] == b'x' * 1000
+    assert cache.get('cd' * 32) is None
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = DetectionCache(str(tmp_path))
+    keys = [f'{i:02d}' * 32 for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, summary())
+        # Distinct modification times, oldest first
+        os.utime(cache._entry_dir(key), (1000 + i, 1000 + i))
+    cache.get(keys[0])
+    # Room for three entries: the fourth evicts the least recently used one
+    cache.max_bytes = 3.5 * DetectionCache._entry_size(cache._entry_dir(keys[0]))
+    cache.put('99' * 32, summary())
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
+
+def test_only_walks_the_cache_when_it_may_be_full(tmp_path, monkeypatch):
+    cache = DetectionCache(str(tmp_path), max_bytes=1 << 30)
+    evictions = []
+    evict = DetectionCache.evict
+    monkeypatch.setattr(DetectionCache, 'evict', lambda self: evictions.append(1) or evict(self))
+    for i in range(5):
+        DetectionCache(str(tmp_path), max_bytes=1 << 30).put(f'{i:02d}' * 32, summary())
+    # The first write measures the cache; the others add to the estimate
+    assert len(evictions) == 1
+
+    monkeypatch.setattr(detection_cache, 'RESCAN_INTERVAL', -1)
+    cache.put('99' * 32, summary())
+    assert len(evictions) == 2
+
+def test_eviction_skips_entries_removed_by_another_process(tmp_path, monkeypatch):
+    cache = DetectionCache(str(tmp_path), max_bytes=0)
+    cache.put('aa' * 32, summary())
+    entry_size = DetectionCache._entry_size
+
+    def removed_meanwhile(entry_dir):
+        if os.path.basename(entry_dir) == 'aa' * 32:
+            raise FileNotFoundError(entry_dir)
+        return entry_size(entry_dir)
+    monkeypatch.setattr(DetectionCache, '_entry_size', staticmethod(removed_meanwhile))
+    cache.put('bb' * 32, summary())
+
+def test_cache_key_changes_with_result_changing_settings(tmp_path, monkeypatch):
+    import tiktok_recommendation
+    video = tmp_path / 'video.mp4'
+    video.write_bytes(b'video')
+    cache = DetectionCache(str(tmp_path / 'cache'))
+    base_config = copy.deepcopy(tiktok_recommendation.config)
+    base_config.update({'sampling': {'scene_change': False, 'early_exit_after': 0},
+                        'tracking': {'enabled': False}, 'roi': {'enabled': False}})
+
+    def key(**sections):
+        config = copy.deepcopy(base_config)
+        for section, options in sections.items():
+            config[section] = {**config.get(section, {}), **options}
+        monkeypatch.setattr(tiktok_recommendation, 'config', config)
+        return tiktok_recommendation.detection_cache_key(cache, str(video))
+
+    base = key()
+    assert key() == base
+    changed = [
+        key(color={'k': 5}),
+        key(color={'levels': 8}),
+        key(proximity={'same_frame': True}),
+        key(sampling={'scene_change': True}),
+        key(sampling={'early_exit_after': 10}),
+        key(tracking={'enabled': True}),
+        key(roi={'enabled': True}),
+        key(decode={'scale': 0.5}),
+    ]
+    assert base not in changed
+    assert len(set(changed)) == len(changed)
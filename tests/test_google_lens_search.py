@@ -0,0 +1,62 @@
+import google_lens_search
+
+FAST_RETRIES = {'backoff': 0.01}
+
+def search(services, images, **lens_options):
+    lens_config = dict({'url': services.url('/lens'), 'rate_limit': 100, 'cache': False}, **lens_options)
+    return google_lens_search.google_lens_search_many(images, lens_config, FAST_RETRIES)
+
+def images(count):
+    return [(f"https://images.example.com/{i}.jpg", None) for i in range(count)]
+
+def test_results_come_back_in_order(services, api_keys):
+    results = search(services, images(3))
+    assert [matches[0]['position'] for matches in results] == [1, 1, 1]
+    assert results[0] != results[1]
+    assert services.requests['lens'] == 3
+
+def test_requests_are_rate_limited(services, api_keys):
+    search(services, images(4), rate_limit=10)
+    times = services.times['lens']
+    assert len(times) == 4
+    # 10 requests per second, with some slack for the event loop's clock
+    assert all(later - earlier >= 0.09 for earlier, later in zip(times, times[1:]))
+
+def test_retries_are_rate_limited_too(services, api_keys):
+    services.fail('/lens', 429)
+    search(services, images(1), rate_limit=5)
+    first, second = services.times['lens']
+    assert second - first >= 0.19
+
+def test_retries_rate_limiting_and_server_errors(services, api_keys):
+    services.fail('/lens', 429)
+    services.fail('/lens', 500)
+    results = search(services, images(1))
+    assert results[0]
+    assert services.requests['lens'] == 3
+
+def test_failed_search_does_not_fail_the_batch(services, api_keys):
+    services.fail('/lens', 200, body='<html>not json</html>')
+    results = search(services, images(2))
+    assert sorted(matches is None for matches in results) == [False, True]
+
+def test_cached_results_skip_the_api(services, api_keys, tmp_path):
+    options = {'cache': True, 'cache_directory': str(tmp_path), 'ttl_hours': 1}
+    first = search(services, images(2), **options)
+    second = search(services, images(2), **options)
+    assert second == first
+    assert services.requests['lens'] == 2
+
+def test_cache_is_keyed_by_image_content(services, api_keys, tmp_path):
+    options = {'cache': True, 'cache_directory': str(tmp_path / 'cache'), 'ttl_hours': 1}
+    crop = tmp_path / 'crop.jpg'
+    crop.write_bytes(b'same pixels')
+    search(services, [("https://images.example.com/a.jpg", str(crop))], **options)
+    search(services, [("https://images.example.com/b.jpg", str(crop))], **options)
+    assert services.requests['lens'] == 1
+
+def test_expired_results_are_searched_again(services, api_keys, tmp_path):
+    options = {'cache': True, 'cache_directory': str(tmp_path), 'ttl_hours': 0}
+    search(services, images(1), **options)
+    search(services, images(1), **options)
+    assert services.requests['lens'] == 2
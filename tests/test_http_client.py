@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import http_client
+
+def run(coroutine_function, **options):
+    """Run coroutine_function(client) with a fresh HttpClient that retries quickly."""
+    async def main():
+        async with http_client.HttpClient(**dict({'backoff': 0.01}, **options)) as client:
+            return await coroutine_function(client)
+    return asyncio.run(main())
+
+def test_first_image_stops_reading_at_the_first_image(services):
+    image = run(lambda client: client.first_image(services.url('/pages/3')))
+    assert image == services.url('/images/3.jpg')
+    # The page keeps streaming after its image; the server must not get to finish it
+    time.sleep(0.3)
+    assert services.requests['pages'] == 1
+    assert services.pages_completed == 0
+
+def test_search_google_fetches_product_pages_concurrently(services, api_keys, monkeypatch):
+    import tiktok_recommendation
+    monkeypatch.setattr(tiktok_recommendation, 'GOOGLE_SEARCH_URL', services.url('/search'))
+    services.latency = 0.2
+
+    start = time.perf_counter()
+    products = run(lambda client: tiktok_recommendation.search_google('cup', client), per_host=services.products)
+    elapsed = time.perf_counter() - start
+
+    assert [product['image'] for product in products] == [services.url(f'/images/{i}.jpg') for i in range(5)]
+    # One search plus one round of pages, rather than one page after another
+    assert elapsed < 0.2 + 0.2 * services.products / 2
+
+def test_retries_rate_limiting_and_server_errors(services):
+    services.fail('/lens', 429)
+    services.fail('/lens', 503)
+    data = run(lambda client: client.get_json(services.url('/lens')))
+    assert data['visual_matches']
+    assert services.requests['lens'] == 3
+
+def test_gives_up_after_the_last_retry(services):
+    for _ in range(3):
+        services.fail('/lens', 502)
+    assert run(lambda client: client.get_json(services.url('/lens')), retries=2) is None
+    assert services.requests['lens'] == 3
+
+def test_does_not_retry_client_errors(services):
+    services.fail('/lens', 404)
+    assert run(lambda client: client.get_json(services.url('/lens'))) is None
+    assert services.requests['lens'] == 1
+
+def test_backoff_grows_exponentially():
+    client = http_client.HttpClient(backoff=0.5)
+    for attempt, base in ((1, 0.5), (2, 1.0), (3, 2.0)):
+        assert base <= client._delay(attempt) <= base * 1.5
+
+def test_honours_retry_after(services):
+    services.fail('/lens', 429, retry_after=0.3)
+    start = time.perf_counter()
+    assert run(lambda client: client.get_json(services.url('/lens'))) is not None
+    assert time.perf_counter() - start >= 0.3
+
+def test_caps_retry_after(services):
+    services.fail('/lens', 503, retry_after=3600)
+    start = time.perf_counter()
+    assert run(lambda client: client.get_json(services.url('/lens')), max_retry_after=0.1) is not None
+    assert time.perf_counter() - start < 1.0
+
+def test_invalid_json_returns_none_without_retrying(services):
+    services.fail('/lens', 200, body='<html>not json</html>')
+    assert run(lambda client: client.get_json(services.url('/lens'))) is None
+    assert services.requests['lens'] == 1
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from match_index import MatchIndex
+
+def product(title, source, price=None, in_stock=None):
+    match = {'title': title, 'source': source, 'link': f'https://{source.lower()}.example.com'}
+    if price is not None:
+        match['price'] = {'value': f'${price:,.2f}', 'extracted_value': price, 'currency': '$'}
+    if in_stock is not None:
+        match['in_stock'] = in_stock
+    return match
+
+MATCHES = [
+    product('Gucci Jackie Leather Shoulder Bag', 'Gucci', 3400, True),
+    product('Leather Shoulder Bags for Women', 'Amazon', 39.99, True),
+    product('Vintage leather bag "Jackie" style', 'Etsy', 120, False),
+    product('Shoulder bag review', 'YouTube'),
+]
+
+@pytest.fixture
+def index(tmp_path):
+    index = MatchIndex(str(tmp_path / 'matches.db'))
+    index.upsert('video1', MATCHES)
+    index.upsert('video1', [product('Ceramic coffee cup', 'Amazon', 12.5, True)], item='cup')
+    yield index
+    index.close()
+
+def titles(matches):
+    return [match['title'] for match in matches]
+
+def test_full_text_search_matches_every_word_with_stemming(index):
+    assert titles(index.query(text='leather bags')) == titles(MATCHES[:3])
+    assert titles(index.query(text='jackie')) == [MATCHES[0]['title'], MATCHES[2]['title']]
+
+def test_full_text_search_treats_syntax_as_words(index):
+    assert titles(index.query(text='"jackie" OR')) == []
+    assert titles(index.query(text='bag" NEAR(')) == []
+
+def test_price_range_and_sort(index):
+    assert titles(index.query(min_price=30, max_price=200, sort='price')) == [MATCHES[1]['title'], MATCHES[2]['title']]
+    # Matches without a price sort last in either direction
+    assert titles(index.query(item='', sort='price', descending=True)) == titles([MATCHES[0], MATCHES[2], MATCHES[1], MATCHES[3]])
+    assert index.count(has_price=False) == 1
+
+def test_stock_filter(index):
+    assert titles(index.query(in_stock=True, video='video1', item='')) == titles(MATCHES[:2])
+    assert titles(index.query(in_stock=False)) == [MATCHES[2]['title']]
+
+def test_upsert_replaces_an_items_matches(index):
+    index.upsert('video1', MATCHES[:1])
+    assert index.count(item='') == 1
+    assert index.count(item='cup') == 1
+    assert index.count(text='bags') == 1
+
+def test_import_directory_assigns_other_item_files_to_their_video(tmp_path):
+    directory = tmp_path / 'visual_matches'
+    directory.mkdir()
+    (directory / 'visual_matches_video1.json').write_text(json.dumps(MATCHES))
+    (directory / 'visual_matches_video1_coffee_cup.json').write_text(json.dumps(MATCHES[:1]))
+    index = MatchIndex(str(tmp_path / 'matches.db'))
+    try:
+        assert index.import_directory(str(directory)) == 2
+        assert index.videos() == ['video1']
+        assert index.count(video='video1', item='coffee cup') == 1
+    finally:
+        index.close()
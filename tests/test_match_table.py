@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from match_table import iter_json_array
+
+MATCHES = [
+    {'position': 1, 'title': 'Bag [limited], "Jackie" \\ edition', 'price': {'value': '$3,400.00', 'extracted_value': 3400}},
+    {'position': 2, 'title': 'Sac à main en cuir — 日本', 'source': 'Étsy', 'tags': [], 'in_stock': True},
+    {'position': 3, 'title': '}]{[,', 'nested': {'a': [1, {'b': None}], 'c': 1.5e-3}},
+    {},
+]
+
+@pytest.fixture(params=['compact', 'indented'])
+def match_file(request, tmp_path):
+    path = tmp_path / 'visual_matches_video1.json'
+    indent = 4 if request.param == 'indented' else None
+    path.write_text(json.dumps(MATCHES, indent=indent, ensure_ascii=False), encoding='utf-8')
+    return path
+
+def test_every_chunk_boundary(match_file):
+    # Every chunk size up to the file's length puts a boundary inside every token at least once
+    for chunk_size in range(1, len(match_file.read_text(encoding='utf-8')) + 2):
+        assert list(iter_json_array(match_file, chunk_size=chunk_size)) == MATCHES, chunk_size
+
+@pytest.mark.parametrize('text', ['[]', ' [ ] ', '[\n]\n'])
+def test_empty_arrays(tmp_path, text):
+    path = tmp_path / 'empty.json'
+    path.write_text(text)
+    assert list(iter_json_array(path, chunk_size=1)) == []
+
+def test_truncated_file_raises(tmp_path):
+    path = tmp_path / 'truncated.json'
+    path.write_text(json.dumps(MATCHES)[:-20])
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(path, chunk_size=7))
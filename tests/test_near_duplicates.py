@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from near_duplicates import FingerprintIndex, hamming_distances, substrings
+
+FRAMES = 8
+
+@pytest.fixture
+def index(tmp_path):
+    index = FingerprintIndex(str(tmp_path / 'fingerprints.db'))
+    yield index
+    index.close()
+
+def random_fingerprint(rng):
+    return rng.integers(1, 2 ** 63, size=FRAMES, dtype=np.uint64)
+
+def flip_bits(fingerprint, count, rng, frames=None):
+    """A copy of fingerprint with count distinct bits flipped, only in the given frames if any."""
+    frames = list(range(len(fingerprint))) if frames is None else frames
+    flipped = fingerprint.copy()
+    for bit in rng.choice(len(frames) * 64, size=count, replace=False):
+        flipped[frames[bit // 64]] ^= np.uint64(1) << np.uint64(bit % 64)
+    return flipped
+
+def test_flat_frames_are_not_indexed():
+    fingerprint = np.array([0, 1, 0, 2], dtype=np.uint64)
+    assert len(substrings(fingerprint)) == 2 * 4
+
+def test_flat_frames_are_not_compared():
+    fingerprint = np.array([0, 0b111, 5, 0], dtype=np.uint64)
+    candidates = np.array([[2 ** 63, 0b100, 5, 0], [0, 0, 0, 0]], dtype=np.uint64)
+    distances, compared = hamming_distances(fingerprint, candidates)
+    assert distances.tolist() == [2, 0]
+    assert compared.tolist() == [2, 0]
+
+@pytest.mark.parametrize('max_distance', [31, 60])
+def test_finds_every_video_within_max_distance(index, max_distance):
+    rng = np.random.default_rng(max_distance)
+    originals = [random_fingerprint(rng) for _ in range(200)]
+    for i, fingerprint in enumerate(originals):
+        index.add(f'hash{i}', f'video{i}.mp4', fingerprint)
+
+    for i, fingerprint in enumerate(originals[:50]):
+        repost = flip_bits(fingerprint, max_distance, rng)
+        assert index.search(repost, max_distance) == (f'hash{i}', f'video{i}.mp4', max_distance)
+
+def test_matches_brute_force(index):
+    rng = np.random.default_rng(1)
+    originals = [random_fingerprint(rng) for _ in range(100)]
+    # Reposts of the first videos, some flipped further than max_distance
+    originals += [flip_bits(originals[i], 20 + 4 * i, rng) for i in range(10)]
+    for i, fingerprint in enumerate(originals):
+        index.add(f'hash{i}', f'video{i}.mp4', fingerprint)
+
+    max_distance = 60
+    for i in range(10):
+        distances, _ = hamming_distances(originals[i], np.array(originals))
+        distances[i] = np.iinfo(distances.dtype).max
+        nearest = int(np.argmin(distances))
+        expected = (f'hash{nearest}', f'video{nearest}.mp4', int(distances[nearest]))
+        assert index.search(originals[i], max_distance, exclude=f'hash{i}') == \
+            (expected if distances[nearest] <= max_distance else None)
+
+def test_max_distance_is_scaled_to_the_frames_compared(index):
+    rng = np.random.default_rng(2)
+    original = random_fingerprint(rng)
+    index.add('hash', 'video.mp4', original)
+    # The repost's last two frames are black: 6 of 8 frames compared allow 45 of 60 bits
+    repost = original.copy()
+    repost[6:] = 0
+    assert index.search(flip_bits(repost, 45, rng, frames=range(6)), 60) == ('hash', 'video.mp4', 45)
+    assert index.search(flip_bits(repost, 46, rng, frames=range(6)), 60) is None
+
+def test_flat_frames_never_make_a_match(index):
+    rng = np.random.default_rng(3)
+    original = random_fingerprint(rng)
+    original[:5] = 0
+    index.add('hash', 'video.mp4', original)
+    # Flat in the same frames, different everywhere else: fewer than half the frames can be compared
+    other = random_fingerprint(rng)
+    other[:5] = 0
+    assert index.search(other, 60) is None
+    assert index.search(original, 60) is None
@@ -0,0 +1,60 @@
+import math
+
+import numpy as np
+import pytest
+
+import proximity
+from proximity import min_distance_by_label, nearest_distances, nearest_distances_same_frame
+
+def brute_force(objects, persons, object_frames=None, person_frames=None):
+    """The nested loop proximity replaced."""
+    distances = []
+    for i, (ox, oy) in enumerate(objects):
+        best = math.inf
+        for j, (px, py) in enumerate(persons):
+            if object_frames is None or object_frames[i] == person_frames[j]:
+                best = min(best, math.hypot(ox - px, oy - py))
+        distances.append(best)
+    return np.array(distances)
+
+@pytest.fixture(params=['broadcast', 'chunked', 'kdtree'])
+def strategy(request, monkeypatch):
+    """Run each test down every code path: plain and chunked broadcasting, and scipy's KD-tree."""
+    if request.param == 'kdtree':
+        pytest.importorskip('scipy')
+        monkeypatch.setattr(proximity, 'KDTREE_MIN_PAIRS', 1)
+    else:
+        monkeypatch.setattr(proximity, 'KDTREE_MIN_PAIRS', 1 << 62)
+    if request.param == 'chunked':
+        monkeypatch.setattr(proximity, 'BROADCAST_CHUNK_PAIRS', 7)
+    return request.param
+
+def points(rng, count):
+    return rng.uniform(0, 1920, size=(count, 2))
+
+@pytest.mark.parametrize('objects, persons', [(300, 40), (1, 1), (50, 1), (1, 50)])
+def test_nearest_distances_match_brute_force(strategy, objects, persons):
+    rng = np.random.default_rng(objects * persons)
+    objects, persons = points(rng, objects), points(rng, persons)
+    np.testing.assert_allclose(nearest_distances(objects, persons), brute_force(objects, persons))
+
+def test_nearest_distances_without_objects_or_persons(strategy):
+    assert nearest_distances(np.empty((0, 2)), [[1, 2]]).shape == (0,)
+    assert nearest_distances([[1, 2], [3, 4]], np.empty((0, 2))).tolist() == [math.inf, math.inf]
+
+def test_same_frame_distances_match_brute_force(strategy):
+    rng = np.random.default_rng(0)
+    objects, persons = points(rng, 400), points(rng, 120)
+    # Some frames have objects but no person, and frames are not sorted
+    object_frames = rng.integers(0, 60, size=len(objects))
+    person_frames = rng.integers(0, 50, size=len(persons))
+    np.testing.assert_allclose(nearest_distances_same_frame(objects, object_frames, persons, person_frames),
+                               brute_force(objects, persons, object_frames, person_frames))
+
+def test_same_frame_ignores_closer_persons_in_other_frames(strategy):
+    distances = nearest_distances_same_frame([[0, 0]], [1], [[1, 0], [10, 0]], [2, 1])
+    assert distances.tolist() == [10.0]
+    assert nearest_distances_same_frame([[0, 0]], [3], [[1, 0]], [2]).tolist() == [math.inf]
+
+def test_min_distance_by_label():
+    assert min_distance_by_label(['cup', 'handbag', 'cup'], [5.0, 2.0, 3.0]) == {'cup': 3.0, 'handbag': 2.0}
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import output_paths
+import results_api
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    """Output paths under a temporary root."""
+    monkeypatch.setattr(output_paths, '_current', output_paths.OutputPaths(root=str(tmp_path)))
+    return output_paths.get()
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(data, file)
+
+def get(path, **headers):
+    """GET path from a fresh results API; returns (status, headers, parsed JSON body or None)."""
+    async def run():
+        client = TestClient(TestServer(results_api.ResultsApi('http://127.0.0.1:1').make_app()), auto_decompress=True)
+        await client.start_server()
+        try:
+            response = await client.get(path, headers=headers)
+            body = await response.json() if response.content_type == 'application/json' else None
+            return response.status, response.headers, body
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+@pytest.fixture
+def matches(paths):
+    data = [{'title': f'product {i}', 'link': f'https://example.com/{i}', 'price': '$10'} for i in range(120)]
+    write_json(paths.visual_matches('video1.mp4'), data)
+    return data
+
+def test_matching_etag_gets_a_304(matches):
+    status, headers, _ = get('/videos/video1.mp4/matches')
+    assert status == 200
+    status, _, body = get('/videos/video1.mp4/matches', **{'If-None-Match': headers['ETag']})
+    assert (status, body) == (304, None)
+
+def test_etag_changes_with_the_file(paths, matches):
+    _, headers, _ = get('/videos/video1.mp4/matches')
+    write_json(paths.visual_matches('video1.mp4'), matches[:10])
+    status, _, body = get('/videos/video1.mp4/matches', **{'If-None-Match': headers['ETag']})
+    assert status == 200 and body['total'] == 10
+
+def test_each_encoding_has_its_own_etag(matches):
+    _, identity, _ = get('/videos/video1.mp4/matches', **{'Accept-Encoding': 'identity'})
+    _, gzipped, _ = get('/videos/video1.mp4/matches', **{'Accept-Encoding': 'gzip'})
+    assert gzipped['Content-Encoding'] == 'gzip' and 'Content-Encoding' not in identity
+    assert identity['ETag'] != gzipped['ETag']
+    assert identity['Vary'] == gzipped['Vary'] == 'Accept-Encoding'
+    status, _, _ = get('/videos/video1.mp4/matches', **{'Accept-Encoding': 'identity', 'If-None-Match': gzipped['ETag']})
+    assert status == 200
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip', True),
+    ('deflate, gzip;q=0.5', True),
+    ('gzip;q=0', False),
+    ('gzip; q=0.0, deflate', False),
+    ('*', True),
+    ('*;q=0', False),
+    ('gzip;q=0, *', False),
+    ('deflate, br', False),
+    ('', False),
+])
+def test_accepts_gzip_honours_q_values(accept_encoding, expected):
+    assert results_api.accepts_gzip(accept_encoding) is expected
+
+def test_cursor_pages_through_every_match(matches):
+    seen, cursor = [], None
+    while True:
+        status, _, body = get('/videos/video1.mp4/matches?limit=50' + (f'&cursor={cursor}' if cursor else ''))
+        assert status == 200 and body['total'] == len(matches)
+        seen.extend(body['matches'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+    assert seen == matches
+
+def test_invalid_cursor_is_a_bad_request(matches):
+    status, _, _ = get('/videos/video1.mp4/matches?cursor=not-a-cursor')
+    assert status == 400
+
+def test_list_videos_hides_only_saved_other_item_files(paths):
+    write_json(paths.summary('video1.mp4'), {'main_item': 'handbag'})
+    write_json(paths.visual_matches('video1.mp4'), [])
+    os.makedirs(paths.cropped_other_items_dir('video1.mp4'))
+    open(paths.cropped_other_item('video1.mp4', 'cell phone'), 'wb').close()
+    write_json(paths.visual_matches('video1.mp4', 'cell phone'), [])
+    # A video of its own whose name merely starts with another video's
+    write_json(paths.visual_matches('video1_b.mp4'), [])
+
+    _, _, body = get('/videos')
+    assert body == {'videos': ['video1', 'video1_b']}
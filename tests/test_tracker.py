@@ -0,0 +1,71 @@
+import numpy as np
+
+from tracker import IoUTracker, Track, iou_matrix
+
+def step(tracker, frame, detections):
+    """Track one frame's detections and record them on their tracks, as get_main_item does."""
+    tracks = tracker.update(frame, detections)
+    for track, (_, box) in zip(tracks, detections):
+        track.observe(frame, box, float('inf'))
+    return tracks
+
+def test_iou_matrix():
+    ious = iou_matrix([[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30], [0, 0, 0, 0]])
+    np.testing.assert_allclose(ious, [[1.0, 50 / 150, 0.0, 0.0]])
+
+def test_moving_object_keeps_its_track():
+    tracker = IoUTracker()
+    tracks = [step(tracker, frame, [('handbag', [10 * frame, 0, 10 * frame + 50, 50])])[0] for frame in range(10)]
+    assert len({track.id for track in tracks}) == 1
+    assert tracks[0].box == [90, 0, 140, 50]
+
+def test_centroid_fallback_follows_a_jump_without_overlap():
+    tracker = IoUTracker(iou_threshold=0.3, centroid_threshold=0.5)
+    first = step(tracker, 0, [('cup', [0, 0, 10, 10])])[0]
+    # Shifted by 0.4 of the box diagonal: IoU below the threshold but the center is close enough
+    near = step(tracker, 1, [('cup', [5.6, 0, 15.6, 10])])[0]
+    far = step(tracker, 2, [('cup', [40, 40, 50, 50])])[0]
+    assert near is first and far is not first
+
+def test_only_detections_of_the_same_class_continue_a_track():
+    tracker = IoUTracker()
+    bag = step(tracker, 0, [('handbag', [0, 0, 50, 50])])[0]
+    backpack = step(tracker, 1, [('backpack', [0, 0, 50, 50])])[0]
+    assert backpack is not bag and len(tracker.tracks) == 2
+
+def test_crossing_objects_are_assigned_to_the_best_overlap():
+    tracker = IoUTracker()
+    left, right = step(tracker, 0, [('cup', [0, 0, 20, 20]), ('cup', [30, 0, 50, 20])])
+    # Listed in the other order, each shifted slightly
+    second_right, second_left = step(tracker, 1, [('cup', [32, 0, 52, 20]), ('cup', [2, 0, 22, 20])])
+    assert (second_left, second_right) == (left, right)
+
+def test_two_detections_never_share_a_track():
+    tracker = IoUTracker()
+    track = step(tracker, 0, [('cup', [0, 0, 20, 20])])[0]
+    first, second = step(tracker, 1, [('cup', [0, 0, 20, 20]), ('cup', [1, 0, 21, 20])])
+    assert first is track and second is not track
+
+def test_tracks_unseen_for_more_than_max_age_are_retired():
+    tracker = IoUTracker(max_age=5)
+    track = step(tracker, 0, [('cup', [0, 0, 20, 20])])[0]
+    assert step(tracker, 5, [('cup', [0, 0, 20, 20])])[0] is track
+    assert step(tracker, 11, [('cup', [0, 0, 20, 20])])[0] is not track
+
+def test_colors_are_sampled_on_power_of_two_observations():
+    track = Track(1, 'cup', [0, 0, 1, 1], 0)
+    sampled = []
+    for frame in range(20):
+        if track.needs_color(max_samples=4):
+            sampled.append(frame + 1)
+            track.colors['red'] += 1
+        track.observe(frame, [0, 0, 1, 1], float('inf'))
+    assert sampled == [1, 2, 4, 8]
+    assert track.color == 'red'
+
+def test_proximity_is_the_median_of_finite_distances():
+    track = Track(1, 'cup', [0, 0, 1, 1], 0)
+    assert track.proximity() == float('inf')
+    for frame, distance in enumerate([5.0, float('inf'), 1.0, 3.0]):
+        track.observe(frame, [0, 0, 1, 1], distance)
+    assert track.proximity() == 3.0